@@ -1,159 +1,318 @@
 from src.handler_api.qdrant_vector_retriever_pipeline import initialize_qdrant_vector_retriever
-import json
+from src.handler_api.translation_cache import initialize_translation_cache
+from src.handler_api.llm_handler import prompt_templates, call_gpt_2, stream_gpt, build_instruction, translate_items, llm_client, llm_hedger, llm_breaker
+from src.handler_api.request_hedger import Deadline
+from src.handler_api.recipe_models import RecipeResult, FormattedRecipe
+from src.handler_api.prompt_builder import prompt_builder
+from src.constants import pipeline_constants
+import orjson
+import asyncio
+import logging
 from fastapi import FastAPI, HTTPException, Request, Query
-from fastapi.responses import JSONResponse
+from fastapi.responses import StreamingResponse
 import uvicorn
 from pydantic import BaseModel
-from typing import List, Dict 
+from typing import List, Dict, Tuple, Union, Optional
 from src.logger import AppLogger
 import openai 
 from dotenv import load_dotenv
-import requests
 import os 
-import httpx
+from contextlib import asynccontextmanager
 
 
+load_dotenv(override=True)
+openai_api_key = os.getenv("OPENAI_API_KEY")
+openai.api_key = openai_api_key
+
 retriever = initialize_qdrant_vector_retriever()
 
 app_logger = AppLogger("UserEndpoint")
 
+# read after load_dotenv, so values set in .env apply
+degraded_mode = os.getenv("DEGRADED_MODE", str(pipeline_constants.DEGRADED_MODE)).lower() == "true"
+llm_stage_budget_seconds = float(os.getenv("LLM_STAGE_BUDGET_SECONDS", pipeline_constants.LLM_STAGE_BUDGET_SECONDS))
+request_deadline_seconds = float(os.getenv("REQUEST_DEADLINE_SECONDS", pipeline_constants.REQUEST_DEADLINE_SECONDS))
+batch_max_items = int(os.getenv("BATCH_MAX_ITEMS", pipeline_constants.BATCH_MAX_ITEMS))
+batch_llm_concurrency = int(os.getenv("BATCH_LLM_CONCURRENCY", pipeline_constants.BATCH_LLM_CONCURRENCY))
 
-load_dotenv(override=True)
-openai_api_key = os.getenv("OPENAI_API_KEY")
-openai.api_key = openai_api_key
-print(openai_api_key)
-
-instruction_prompt = """
-you are an helpful assistant that will format and translate the recipes provided to you. given the recipes, your strict- final format should be:
- "{'recipe_name':str
-    'recipe_ingredients':List[str],
-    'recipe_directions':List[str],
-    'recipe_details':{'Prep_time':str, 'CookTime':str, 'TotalTime':str, 'Servings':str}
-    'recipe_nutrition_details':{'Calories':str,'Total Fat':str,'Carbohydrates':str,'Protein':str},}
-    'shopping_list':List[str]}"
-  1- you can 'process'/'do calculation' etc on the data to achieve this final format. If you can not calculate, just 'make up' a reasonable value.
-  2- you 'have to' satisfy the datatypes specified for each key-value pair!
-  3- then you will translate this recipe to 'target' language." Translate 'all the keys' and 'values', use a natural kitchen language.
-  4- provide only the translated recipe. dont add any additional text since it will be used in production.
-  5- Lastly you will generate a shopping list substracting user ingredients list from the recipe_ingredients_list, append "shopping_list":List[str] to the end of your response.
-  YOU HAVE TO SATISFY ALL 5 CONDITION. STEP BACK AND EVALUATE YOUR RESULT, ITS CRUCIAL.
-"""
-
-
-url = "https://api.openai.com/v1/chat/completions"
-
-headers = {
-    'Authorization': f'Bearer {openai_api_key}',
-    'Content-Type': 'application/json',}
-
-
-
-async def call_gpt_2(instruction: str, prompt: str, model_name: str = "gpt-3.5-turbo", timeout_duration: int = 70) -> str:
-    app_logger.handle_logging("Calling GPT for final processing.")
-    payload = {
-        "model": model_name,
-        "messages": [
-            {"role": "system", "content": instruction},
-            {"role": "user", "content": prompt}
-        ]
-    }
-    
-    async with httpx.AsyncClient() as client:  # Use async client
-        try:
-            response = await client.post(url, headers=headers, json=payload, timeout=timeout_duration)
-            print(response)
-            data = response.json()
-            metrics = data["usage"]
-            print("metrics: " , metrics)
-            text = data["choices"][0]["message"]["content"]
-            return text
-        except Exception as e:
-            print(f"Error occurred: {e}")
-            return None
-
-
-
-
-async def call_gpt(instruction: str, prompt: str, model_name: str = "gpt-3.5-turbo", timeout_duration: int = 70) -> str:
-    app_logger.handle_logging("Calling GPT for final processing.")
-    print(openai.api_key)
-    payload = {
-        "model": model_name,
-        "messages": [
-            {"role": "system", "content": instruction},
-            {"role": "user", "content": prompt}
-        ]
-            }
-
-    try:
-        response = requests.post(url, headers=headers, data=json.dumps(payload), timeout=timeout_duration)
-        print("response:  ",response)
-        data = response.json()
-    
-        
-        text = data["choices"][0]["message"]["content"]
-        print("usage", data["usage"])
-        return text
-    
-    except requests.exceptions.Timeout:
-        print(f"The request timed out after {timeout_duration} seconds.")
-        return None
-    except requests.exceptions.HTTPError as http_err:
-        print(f"HTTP error occurred: {http_err}")
-        return None
-    except requests.exceptions.RequestException as err:
-        print(f"Other error occurred: {err}")
-        return None
+
+# formatted/translated recipes are cached per (recipe url, language, prompt version) for the recipe content they were made from,
+# editing a prompt template invalidates them.
+translation_cache = initialize_translation_cache(prompt_templates())
+translation_cache.invalidate_stale()
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # one pooled LLM client per worker for the whole application lifetime
+    await llm_client.start()
+    yield
+    await llm_client.close()
+    await retriever.close()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 
 
 @app.get("/home")
 async def test_endpoint():
     return {"message":"ok"}
 
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return {
+        "embedding_batcher": retriever.embedding_batcher.metrics(),
+        "embedding_executor": retriever.embedding_executor.metrics(),
+        "search_executor": retriever.search_executor.metrics(),
+        "embedding_cache": retriever.embedding_cache.metrics(),
+        "recipe_store": retriever.recipe_store.metrics() if retriever.recipe_store is not None else None,
+        "translation_cache": translation_cache.metrics(),
+        "llm_client": llm_client.metrics(),
+        "llm_hedging": llm_hedger.metrics(),
+        "llm_circuit_breaker": llm_breaker.metrics(),
+    }
+
+def missing_ingredient_indices(recipe_ingredients: List[str], user_ingredients: List[str], recipe_ingredient_ids: List[List[int]] = None) -> List[int]:
+    """
+    positions of the recipe ingredient lines the user does not have.
+    recipes ingested with canonical ingredient ids are matched as int sets against the ids of the user's ingredients,
+    with a text check where the vocabulary cannot map them (see IngredientVocabulary.text_covered_lines);
+    older payloads fall back to checking whether any user ingredient appears in the line.
+    """
+    if recipe_ingredient_ids and len(recipe_ingredient_ids) == len(recipe_ingredients):
+        vocabulary = retriever.refresh_ingredient_vocabulary()
+        user_ids = vocabulary.query_ids(user_ingredients)
+        text_covered = vocabulary.text_covered_lines(user_ingredients, recipe_ingredients, recipe_ingredient_ids)
+        return [i for i, line_ids in enumerate(recipe_ingredient_ids) if line_ids and user_ids.isdisjoint(line_ids) and not text_covered[i]]
+    user_ingredients = [ingredient.strip().lower() for ingredient in user_ingredients if ingredient.strip()]
+    return [i for i, line in enumerate(recipe_ingredients) if not any(ingredient in line.lower() for ingredient in user_ingredients)]
+
+
+async def compute_shopping_list(recipe:RecipeResult, formatted_recipe:FormattedRecipe, user_ingredients:List[str], country:str,
+                                deadline:Deadline = None) -> List[str]:
+    """
+    the shopping list is computed here, not by the LLM: deterministic, and the formatted recipe stays cacheable per
+    (recipe, language). missing lines are taken from the translated ingredient list when it lines up with the stored one,
+    otherwise only the missing lines are translated, through the item translation cache.
+    """
+    missing = missing_ingredient_indices(recipe.recipe_ingredients, user_ingredients, recipe.recipe_ingredient_ids)
+    if not missing:
+        return []
+    if len(formatted_recipe.recipe_ingredients) == len(recipe.recipe_ingredients):
+        return [formatted_recipe.recipe_ingredients[i] for i in missing]
+
+    items = [recipe.recipe_ingredients[i] for i in missing]
+    translations = translation_cache.get_items(items, country)
+    pending = [item for item in dict.fromkeys(items) if item not in translations]
+    if pending:
+        translated = await translate_items(pending, country, deadline=deadline)
+        if translated is not None:
+            new_translations = dict(zip(pending, translated))
+            translation_cache.put_items(new_translations, country)
+            translations.update(new_translations)
+    return [translations.get(item, item) for item in items] # untranslated lines beat no shopping list
+
+
 #create a request model
 class UserRequest(BaseModel):
     country:str
     allergic_ingredients:List[str]
     preferences:List[str]
     ingredients:List[str]
+    max_total_minutes:Optional[int] = None
+    max_calories:Optional[int] = None
 
 
+class BatchRecipeResult(BaseModel):
+    recipe:Optional[FormattedRecipe] = None
+    error:Optional[str] = None # set instead of recipe when this item failed, the other items are unaffected
 
-@app.post("/get-recipe")
-async def get_recipe(request:UserRequest):
 
-    country = request.country
-    allergic_ingredients = request.allergic_ingredients
+
+def build_query_and_filter(request:UserRequest) -> Tuple[str, Dict]:
     recipe_tags = request.preferences
-    ingredients = request.ingredients
+    query = f"{'|'.join(request.ingredients)}\nrecipe_tags_formatted{'|'.join(recipe_tags)}"
+    # keyword/range conditions on the indexed payload fields (text matches for collections ingested without them)
+    filter_1 = retriever.compile_filter(recipe_tags, request.allergic_ingredients, ranges={
+        "recipe_total_minutes": {"lte": request.max_total_minutes},
+        "recipe_calories": {"lte": request.max_calories}})
+    return query, filter_1
 
-    query = f"{'|'.join(ingredients)}\nrecipe_tags_formatted{'|'.join(recipe_tags)}"
-    filter_1 = {
-        "must":[{"key":"page_content","match":{"text":tag}} for tag in recipe_tags],
-        "must_not":[{"key":"page_content","match":{"text":ingredient}} for ingredient in allergic_ingredients]
-     } 
 
+async def retrieve_recipe(request:UserRequest) -> Union[RecipeResult, None]:
+    query, filter_1 = build_query_and_filter(request)
     response = await retriever.similarity_search(
         query= query,
         filter=filter_1,
         k=1,
+        user_ingredients=request.ingredients,
+        )
+    if not response:
+        return None
+    app_logger.handle_logging(f"retrieved recipe: {response[0].recipe_url}")
+    return response[0]
+
+
+def get_cached_recipe(recipe:RecipeResult, country:str) -> Union[FormattedRecipe, None]:
+    translation_cache.record_request(recipe.recipe_url)
+    cached = translation_cache.get(recipe.recipe_url, country, recipe.content_hash())
+    return FormattedRecipe.model_validate(cached) if cached is not None else None
+
+
+def degraded_recipe(recipe:RecipeResult, country:str) -> Union[FormattedRecipe, None]:
+    """
+    the stored recipe formatted locally when the LLM stage failed, missed its budget or its circuit breaker is open.
+    ingredient lines already in the item translation cache come back translated. None when degraded mode is off.
+    """
+    if not degraded_mode:
+        return None
+    app_logger.handle_logging(f"serving {recipe.recipe_url} degraded", logging.WARNING)
+    return FormattedRecipe.from_recipe(recipe, translation_cache.get_items(recipe.recipe_ingredients, country))
+
+
+async def format_recipe(recipe:RecipeResult, country:str, deadline:Deadline) -> Union[FormattedRecipe, None]:
+    """
+    the recipe formatted/translated for the country, from the translation cache or the LLM (within the LLM stage
+    budget), otherwise the degraded local version. None if formatting failed and degraded mode is off.
+    """
+    final_response = get_cached_recipe(recipe, country)
+    if final_response is None:
+        instruction = build_instruction(country)
+        final_response = FormattedRecipe.from_llm_output(await call_gpt_2(instruction=instruction,prompt=prompt_builder.build(recipe, instruction),
+                                                                          deadline=deadline.limit(llm_stage_budget_seconds)))
+        if final_response is None:
+            return degraded_recipe(recipe, country)
+        translation_cache.put(recipe.recipe_url, country, final_response.cache_value(), recipe.content_hash()) # shopping list is user-specific, never cached
+    return final_response
+
+
+async def finalize_response(final_response:FormattedRecipe, recipe:RecipeResult, ingredients:List[str], country:str,
+                            deadline:Deadline = None) -> FormattedRecipe:
+    """
+    adds the per-request fields (shopping list) and the urls from the stored recipe to the formatted recipe.
+    """
+    return final_response.model_copy(update={
+        "shopping_list": await compute_shopping_list(recipe, final_response, ingredients, country, deadline),
+        "recipe_image_url": recipe.recipe_image_url,
+        "recipe_url": recipe.recipe_url})
+
+
+# with a response model fastapi serializes the pydantic object straight to JSON bytes (pydantic-core), no dict/jsonable_encoder pass
+@app.post("/get-recipe", response_model=FormattedRecipe)
+async def get_recipe(request:UserRequest) -> FormattedRecipe:
+
+    deadline = Deadline(request_deadline_seconds) # every LLM call of this request shares the remaining budget
+    country = request.country
+    ingredients = request.ingredients
+
+    recipe = await retrieve_recipe(request)
+    if recipe is None:
+        raise HTTPException(status_code=404, detail="no recipe found for the given ingredients and preferences")
+
+    final_response = await format_recipe(recipe, country, deadline)
+    if final_response is None:
+        raise HTTPException(status_code=502, detail="recipe formatting failed")
+
+    return await finalize_response(final_response, recipe, ingredients, country, deadline)
+
+
+@app.post("/get-recipes", response_model=List[BatchRecipeResult])
+async def get_recipes(requests:List[UserRequest]) -> List[BatchRecipeResult]:
+    """
+    batch variant of /get-recipe, one result per request in the same order.
+    all queries are embedded in one model call and searched in one vector search round; the LLM formatting of the
+    items then runs concurrently, at most BATCH_LLM_CONCURRENCY calls at a time. items asking for the same recipe in
+    the same language share one formatting call.
+    """
+    deadline = Deadline(request_deadline_seconds)
+    if len(requests) > batch_max_items:
+        raise HTTPException(status_code=413, detail=f"at most {batch_max_items} requests per batch")
+
+    queries, filters = zip(*[build_query_and_filter(request) for request in requests]) if requests else ((), ())
+    recipes = await retriever.similarity_search_batch(
+        queries=list(queries),
+        filters=list(filters),
+        k=1,
+        user_ingredients=[request.ingredients for request in requests],
         )
-    response = str(response[0])
-    print("response : ",response)
-    #print("type : ",type(response))
-    final_response = await call_gpt_2(instruction=instruction_prompt+"\nTRANSLATION LANGUAGE: "+country+"\n",prompt=response)
-    #print(type(final_response))# string
-    #print(eval(final_response)) # turn it into a dictionary
-    final_response = eval(final_response)
-    final_response["recipe_image_url"]=str(eval(response)["recipe_image_url"])
-    final_response["recipe_url"]=str(eval(response)["recipe_url"])
-    print(final_response)    
-    return JSONResponse(content=final_response)
-        
+
+    semaphore = asyncio.Semaphore(batch_llm_concurrency)
+    formatting_tasks = {}
+
+    async def bounded_format(recipe:RecipeResult, country:str) -> Union[FormattedRecipe, None]:
+        async with semaphore:
+            return await format_recipe(recipe, country, deadline)
+
+    async def process(request:UserRequest, recipes:Union[List[RecipeResult], None]) -> BatchRecipeResult:
+        if not recipes:
+            return BatchRecipeResult(error="no recipe found for the given ingredients and preferences")
+        recipe = recipes[0]
+        key = (recipe.recipe_url, request.country)
+        if key not in formatting_tasks:
+            formatting_tasks[key] = asyncio.ensure_future(bounded_format(recipe, request.country))
+        final_response = await formatting_tasks[key]
+        if final_response is None:
+            return BatchRecipeResult(error="recipe formatting failed")
+        return BatchRecipeResult(recipe=await finalize_response(final_response, recipe, request.ingredients, request.country, deadline))
+
+    return await asyncio.gather(*[process(request, item_recipes) for request, item_recipes in zip(requests, recipes)])
+
+
+def sse_event(event:str, data:Dict) -> str:
+    return f"event: {event}\ndata: {orjson.dumps(data).decode('utf-8')}\n\n"
+
+
+@app.post("/get-recipe/stream")
+async def get_recipe_stream(request:UserRequest):
+    """
+    server-sent events variant of /get-recipe:
+        - "metadata": recipe name, image url and recipe url, sent right after retrieval
+        - "delta": incremental LLM output text (skipped on a translation cache hit)
+        - "final": the parsed final object, same schema as /get-recipe (the degraded local version if the LLM stage failed)
+        - "error": sent instead of "final" if anything fails
+    """
+    deadline = Deadline(request_deadline_seconds)
+    country = request.country
+    ingredients = request.ingredients
+    recipe = await retrieve_recipe(request)
+
+    async def event_stream():
+        if recipe is None:
+            yield sse_event("error", {"detail": "no recipe found for the given ingredients and preferences"})
+            return
+
+        yield sse_event("metadata", {
+            "recipe_name": recipe.recipe_name,
+            "recipe_image_url": recipe.recipe_image_url,
+            "recipe_url": recipe.recipe_url})
+
+        final_response = get_cached_recipe(recipe, country)
+        if final_response is None:
+            chunks = []
+            try:
+                instruction = build_instruction(country)
+                async for delta in stream_gpt(instruction=instruction, prompt=prompt_builder.build(recipe, instruction),
+                                              deadline=deadline.limit(llm_stage_budget_seconds)):
+                    chunks.append(delta)
+                    yield sse_event("delta", {"text": delta})
+            except Exception as e:
+                app_logger.handle_logging(f"streaming LLM call failed: {e}", logging.ERROR)
+            final_response = FormattedRecipe.from_llm_output("".join(chunks))
+            if final_response is None:
+                final_response = degraded_recipe(recipe, country) # clients replace the streamed text with the final object
+                if final_response is None:
+                    yield sse_event("error", {"detail": "recipe formatting failed"})
+                    return
+            else:
+                translation_cache.put(recipe.recipe_url, country, final_response.cache_value(), recipe.content_hash()) # shopping list is user-specific, never cached
+
+        final_response = await finalize_response(final_response, recipe, ingredients, country, deadline)
+        yield sse_event("final", final_response.model_dump())
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 
 
 
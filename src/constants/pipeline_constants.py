@@ -9,6 +9,110 @@ LOGS_DIR = os.path.join(os.getcwd(), "logs")
 INVALID_RECIPES_FOLDER = os.path.join(os.getcwd(), "artifacts","invalid_recipes") # first make sure that it exists.
 
 
+#LOCAL VECTOR INDEX
+LOCAL_INDEX_DIR = os.path.join(os.getcwd(), "artifacts", "local_index") # snapshot of the qdrant collection for the in-process backend
+HNSW_M = 16 # graph degree, higher -> better recall, bigger index
+HNSW_EF_CONSTRUCTION = 200 # candidate list size while building
+HNSW_EF_SEARCH = 64 # candidate list size while searching, tune per deployment against the reported recall
+RETRIEVAL_MODE = "dense" # "dense" (embedding + mmr) or "hybrid" (embedding and bm25 fused with reciprocal rank fusion)
+SEARCH_EXECUTOR_WORKERS = 2 # threads answering local index searches, numpy releases the gil for the matrix products
+SEARCH_EXECUTOR_MAX_QUEUE = 64
+
+
+#PANTRY RERANKING
+RERANK_POOL_SIZE = 100 # candidates re-scored by pantry coverage when the user sends ingredients, 0 disables reranking
+RERANK_VECTOR_WEIGHT = 0.5 # weight of the (pool min-max scaled) retriever score
+RERANK_COVERAGE_WEIGHT = 0.35 # weight of the share of recipe ingredients the user has
+RERANK_MISSING_WEIGHT = 0.15 # penalty weight of the number of missing ingredients
+RERANK_MAX_MISSING = 15 # missing ingredient count at which the penalty saturates
+
+
+#INGREDIENT VOCABULARY
+INGREDIENT_VOCABULARY_PATH = os.path.join(os.getcwd(), "artifacts", "ingredient_vocabulary.json") # canonical ingredient names, list index = id
+INGREDIENT_VOCABULARY_RELOAD_SECONDS = 60 # how often the api checks the file for ids added by a later ingestion, 0 -> on every request
+
+
+#QUERY EMBEDDING
+EMBEDDING_BATCH_WINDOW_MS = 3.0 # how long the first waiting query waits for others to join its batch
+EMBEDDING_MAX_BATCH_SIZE = 32 # a batch is embedded immediately once this many queries are waiting
+EMBEDDING_CACHE_MAX_SIZE = 10000 # LRU bound on cached query embeddings (384 floats each)
+EMBEDDING_CACHE_TTL_SECONDS = 0 # 0 -> entries never expire, only get evicted
+EMBEDDING_EXECUTOR_WORKERS = 1 # threads running the embedding model, torch already uses several cores per call
+EMBEDDING_EXECUTOR_MAX_QUEUE = 64 # batches allowed to wait for a thread before callers are held back on the event loop
+
+
+#RECIPE BODY STORE
+RECIPE_STORE_PATH = os.path.join(os.getcwd(), "artifacts", "recipe_store", "recipes.sqlite3") # full payloads keyed by qdrant point id
+LEAN_PAYLOAD = True # qdrant searches return ids, scores and LEAN_PAYLOAD_FIELDS only, result bodies are read from the recipe store (once it holds the whole collection)
+LEAN_PAYLOAD_FIELDS = ["metadata.recipe_ingredient_ids"] # what the pantry reranker reads from every candidate
+
+
+#TRANSLATION CACHE
+TRANSLATION_CACHE_PATH = os.path.join(os.getcwd(), "artifacts", "cache", "translations.sqlite3")
+TRANSLATION_CACHE_MAX_ENTRIES = 50000 # least recently used entries are evicted above this
+
+
+#LLM HTTP CLIENT
+LLM_MAX_CONNECTIONS = 20 # pooled connections to the LLM API per worker
+LLM_MAX_KEEPALIVE_CONNECTIONS = 10
+LLM_KEEPALIVE_EXPIRY_SECONDS = 30
+LLM_CONNECT_TIMEOUT_SECONDS = 5
+LLM_READ_TIMEOUT_SECONDS = 60 # max silence between bytes of the response
+LLM_TOTAL_TIMEOUT_SECONDS = 70 # budget for the whole call
+LLM_HTTP2 = True
+LLM_MAX_INPUT_TOKENS = 3000 # instruction + recipe budget of the formatting call, longer recipes get trimmed
+LLM_TOKENIZER_ENCODING = "cl100k_base" # tiktoken encoding of the gpt-3.5/4 family
+LLM_MAX_DIRECTION_CHARS = 400 # direction steps are cut to this length first when the budget is exceeded
+
+
+#LLM DEADLINES, HEDGING AND RETRIES
+REQUEST_DEADLINE_SECONDS = 60 # end-to-end budget of one recipe request, LLM calls get what is left of it
+LLM_HEDGE_PERCENTILE = 95 # a second request is sent once the first is slower than this latency percentile, 0 disables hedging
+LLM_HEDGE_MIN_DELAY_SECONDS = 1.0
+LLM_HEDGE_DEFAULT_DELAY_SECONDS = 10.0 # hedge delay until LLM_HEDGE_MIN_SAMPLES latencies were observed
+LLM_HEDGE_MIN_SAMPLES = 20
+LLM_HEDGE_WINDOW = 500 # recent call latencies the percentile is computed over
+LLM_HEDGE_MAX_RATE = 0.1 # share of calls allowed to hedge, keeps a slow upstream from getting twice the load
+LLM_MAX_ATTEMPTS = 3 # attempts per call, retries only happen while the deadline leaves room for the backoff
+LLM_BACKOFF_BASE_SECONDS = 0.5 # full jitter: sleep uniform(0, min(max, base * 2^attempt))
+LLM_BACKOFF_MAX_SECONDS = 4.0
+
+
+#LLM CIRCUIT BREAKER AND DEGRADED MODE
+DEGRADED_MODE = True # serve the stored recipe (flagged "degraded") instead of an error when the LLM stage fails
+LLM_STAGE_BUDGET_SECONDS = 25 # latency budget of the formatting call within the request deadline
+LLM_BREAKER_WINDOW = 50 # recent calls the error and slow call rates are computed over
+LLM_BREAKER_MIN_CALLS = 10
+LLM_BREAKER_FAILURE_RATE = 0.5
+LLM_BREAKER_SLOW_CALL_SECONDS = 20
+LLM_BREAKER_SLOW_CALL_RATE = 0.5
+LLM_BREAKER_OPEN_SECONDS = 30 # calls are rejected at once for this long after the breaker opens
+LLM_BREAKER_HALF_OPEN_CALLS = 2 # probe calls that must succeed before the breaker closes again
+
+
+#BATCH ENDPOINT
+BATCH_MAX_ITEMS = 20 # requests accepted by one /get-recipes call
+BATCH_LLM_CONCURRENCY = 4 # LLM formatting calls one batch may have in flight
+
+
+#STREAMING INGESTION
+INGESTION_QUEUE_SIZE = 8 # items each bounded queue between two stages holds (files, recipe lists, document batches)
+INGESTION_PARSE_WORKERS = 2 # threads reading and parsing json files
+INGESTION_EMBED_WORKERS = 0 # embedding processes, 0 -> one per core
+INGESTION_EMBED_TORCH_THREADS = 1 # torch threads per embedding process, so the processes do not oversubscribe the cores
+INGESTION_EMBED_BATCH_SIZE = 64 # documents per embedding call and per upsert
+INGESTION_UPSERT_CONCURRENCY = 4 # upsert requests in flight
+INGESTION_REPORT_INTERVAL_SECONDS = 10 # how often stage throughput and queue depths are logged
+INGESTION_MANIFEST_PATH = os.path.join(os.getcwd(), "artifacts", "ingestion", "manifest.sqlite3") # per-file / per-batch progress, lets a restarted run resume
+
+
+#PRE-TRANSLATION JOB
+RECIPES_DIRS = [os.path.join(os.getcwd(), "artifacts", "recipes", "new_data", "2foodnet_formatted"),
+                os.path.join(os.getcwd(), "artifacts", "recipes", "new_data", "allrecipescom")] # same folders great_migration walks
+PRETRANSLATION_CONCURRENCY = 4 # LLM calls in flight at once
+PRETRANSLATION_REQUESTS_PER_MINUTE = 60 # stay below the account rate limit
+
+
 #RECIPE RELATED
 UNIVERSAL_RECIPE_FORMAT_FILE = r"C:\Users\ayhan\Desktop\ChefApp_v2\src\universal_recipe_format.json"
 UNIVERSAL_XLSX_UNWANTED_FIELDS = ["web-scraper-order","web-scraper-start-url","sub_category","sub","card","recipe_card"]
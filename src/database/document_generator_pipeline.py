@@ -5,6 +5,9 @@ from src.logger import AppLogger
 from src.exception_handler import handle_exceptions
 from src.constants import pipeline_constants
 from src.database.document_to_vectorstore_pipeline import run_documents_to_pinecone_pipeline
+from src.handler_api.ingredient_vocabulary import IngredientVocabulary
+from src.handler_api.recipe_details_parser import parse_recipe_facts
+from src.handler_api.payload_schema import keyword_fields
 
 
 import logging
@@ -20,8 +23,11 @@ class DocumentGeneratorPipeline:
         3- construct a new Document object and return list of Document objects
     """
 
-    def __init__(self,):
+    def __init__(self, ingredient_vocabulary_path:str=pipeline_constants.INGREDIENT_VOCABULARY_PATH):
         self.log_writer = AppLogger("DocumentGeneratorPipeline")
+        # shared, append-only vocabulary: every processed file may add new canonical ingredients
+        self.ingredient_vocabulary_path = ingredient_vocabulary_path
+        self.ingredient_vocabulary = IngredientVocabulary.load_or_create(ingredient_vocabulary_path)
 
     @handle_exceptions
     def replace_null(self, obj:Union[Dict, List], fill_value = 'null')->Union[Dict, List]:
@@ -50,7 +56,17 @@ class DocumentGeneratorPipeline:
         """
         #load and clean the recipes in the JSON file
         json_data = self.replace_null(self.load_json_object(file_path))
-        
+        documents = self.build_documents(json_data)
+        self.ingredient_vocabulary.save(self.ingredient_vocabulary_path)
+        self.log_writer.handle_logging(f"Documents are generated successfully! # of documents: {len(documents)}", logging.INFO)
+        return documents
+
+    @handle_exceptions
+    def build_documents(self, json_data:List[Dict])->List[Document]:
+        """
+        builds the Document objects of already loaded and cleaned recipes. grows the ingredient vocabulary, which is not
+        saved here: callers save it once they are done (per file, or once at the end of a streaming ingestion).
+        """
         #initialize the Documents List
         documents = []
 
@@ -67,7 +83,6 @@ class DocumentGeneratorPipeline:
                 # add additional fields, if necessary
 
             documents.append(new_document) # we use append since we are adding documents one by one
-        self.log_writer.handle_logging(f"Documents are generated successfully! # of documents: {len(documents)}", logging.INFO)
         return documents
 
     @handle_exceptions
@@ -79,10 +94,20 @@ class DocumentGeneratorPipeline:
         #print(set(fields).difference(set(recipe.keys())))
 
         #extract key-value pairs using dict comprehension
-        #metadata = {field: str(recipe.get(field),"None") for field in fields}#we want all the metadata to be strings
-        metadata = {field: str(recipe.get(field, "None").decode('utf-8')) if isinstance(recipe.get(field), bytes) else str(recipe.get(field, "None")) for field in fields}
+        #lists and dicts keep their native types, qdrant stores them as json payloads so nothing has to be re-parsed at query time
+        metadata = {field: recipe.get(field).decode('utf-8') if isinstance(recipe.get(field), bytes) else recipe.get(field, "None") for field in fields}
+
+        # canonical ingredient ids per ingredient line, matched against the user's ingredients as int sets at query time
+        ingredients = recipe.get("recipe_ingredients_formatted")
+        metadata["recipe_ingredient_ids"] = self.ingredient_vocabulary.recipe_ids(ingredients if isinstance(ingredients, list) else [])
+
+        # typed minutes / servings / nutrition numbers, parsed once here instead of by the LLM on every request; usable in filters
+        metadata.update(parse_recipe_facts(recipe.get("recipe_details_formatted"), recipe.get("recipe_nutrition_details_formatted")))
 
         tags = recipe.get("recipe_tags_formatted","None")
+        # keyword arrays behind the indexed qdrant filters (see payload_schema.compile_filter)
+        metadata.update(keyword_fields(tags if isinstance(tags, list) else [], ingredients if isinstance(ingredients, list) else [],
+                                       metadata["recipe_ingredient_ids"], self.ingredient_vocabulary))
         return metadata, tags
 
     
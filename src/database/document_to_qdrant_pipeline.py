@@ -9,8 +9,14 @@ from langchain.embeddings import HuggingFaceEmbeddings, SentenceTransformerEmbed
 from typing import List,Tuple ,Union, Any, Dict
 import os 
 from src.database.document_generator import JsonToDocument
+from src.handler_api.local_vector_index import LocalVectorIndex
+from src.handler_api.payload_schema import create_payload_indexes
+from src.handler_api.recipe_store import initialize_recipe_store, point_key
+from src.database.recipe_identity import stamp_documents, hash_selector, stored_hashes, changed_positions
+from src.constants import pipeline_constants
 import qdrant_client
-from qdrant_client.http.models import Distance, VectorParams,OptimizersConfig
+from qdrant_client.http.models import Distance, VectorParams,OptimizersConfig, PointStruct, PointIdsList
+import numpy as np
 
 
 
@@ -65,13 +71,104 @@ class DocumentToQdrantPipeline(VectorRetriever):
                 vectors_config=VectorParams(size=384, distance=Distance.COSINE, on_disk=True),
                 optimizers_config=optimizers_config
             )
+            create_payload_indexes(self.client, "chef-app-2")
             self.vector_store = Qdrant(
                 client=self.client,
                 collection_name="chef-app-2",
                 embeddings=self.embedder
             )
 
-    #No need to update add_documents, since langchain handles them automatically with the same implementation.
+    @handle_exceptions
+    def add_new_documents(self, documents:List[Document], hnsw_index_dir:str=None, batch_size:int=64, delete_missing:bool=False)->List[str]:
+        """
+        embeds the documents once and upserts them to the qdrant collection (same payload layout langchain uses).
+        point ids are uuid5 of the recipe url and payloads carry a content hash, so re-running it only embeds and
+        upserts the recipes that are new or changed since they were stored (see recipe_identity); returns their ids.
+        pass delete_missing=True when the documents are the whole corpus: points no document maps to (removed recipes)
+        are deleted as well. the payloads are also written to (and removed from) the recipe store (LEAN_PAYLOAD mode).
+        if hnsw_index_dir is given, the on-disk LocalVectorIndex + hnsw graph there gets the new and changed vectors and
+        loses the changed and deleted ones, so the retriever pipelines can open it read-only with mmap.
+        """
+        ids = stamp_documents(documents)
+        unique = {point_key(point_id): i for i, point_id in reversed(list(enumerate(ids)))} # first occurrence of a url wins
+        documents, ids = [documents[i] for i in sorted(unique.values())], [ids[i] for i in sorted(unique.values())]
+
+        stored = {}
+        for start in range(0, len(ids), batch_size):
+            stored.update(stored_hashes(self.vector_store.client.retrieve(
+                collection_name=self.vector_store.collection_name, ids=ids[start:start+batch_size], with_payload=hash_selector(), with_vectors=False)))
+        positions = changed_positions(documents, ids, stored)
+        self.log_writer.handle_logging(f"{len(positions['new'])} new, {len(positions['changed'])} changed, "
+                                       f"{len(positions['unchanged'])} unchanged documents")
+        keep = sorted(positions["new"] + positions["changed"])
+        documents, ids = [documents[i] for i in keep], [ids[i] for i in keep]
+        deleted_ids = self.delete_missing_points(set(unique), batch_size=batch_size) if delete_missing else []
+        lean_payload = os.getenv("LEAN_PAYLOAD", str(pipeline_constants.LEAN_PAYLOAD)).lower() == "true"
+
+        vectors = self.embedder.embed_documents([doc.page_content for doc in documents]) if documents else []
+        payloads = [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in documents]
+
+        for start in range(0, len(documents), batch_size):
+            points = [PointStruct(id=point_id, vector=vector, payload=payload) for point_id, vector, payload in
+                      zip(ids[start:start+batch_size], vectors[start:start+batch_size], payloads[start:start+batch_size])]
+            self.vector_store.client.upsert(collection_name=self.vector_store.collection_name, points=points)
+        self.log_writer.handle_logging(f"{len(documents)} documents inserted to the vector store successfully!")
+
+        if lean_payload and (documents or deleted_ids):
+            # the retriever reads result bodies from the recipe store, it has to know the new points too
+            recipe_store = initialize_recipe_store()
+            recipe_store.put_many(ids, payloads)
+            recipe_store.delete_many(deleted_ids)
+            recipe_store.close()
+
+        if hnsw_index_dir and (documents or deleted_ids):
+            self.update_hnsw_index(np.asarray(vectors, dtype=np.float32), payloads, ids, hnsw_index_dir, removed_ids=deleted_ids)
+        return ids
+
+    @handle_exceptions
+    def delete_missing_points(self, keep:set, batch_size:int=1000)->List[Union[str, int]]:
+        """
+        deletes the points of the collection whose point_key is not in keep, returns their ids.
+        """
+        missing = []
+        offset = None
+        while True:
+            points, offset = self.vector_store.client.scroll(collection_name=self.vector_store.collection_name, limit=batch_size,
+                                                             offset=offset, with_payload=False, with_vectors=False)
+            missing.extend(point.id for point in points if point_key(point.id) not in keep)
+            if offset is None:
+                break
+        for start in range(0, len(missing), batch_size):
+            self.vector_store.client.delete(collection_name=self.vector_store.collection_name,
+                                            points_selector=PointIdsList(points=missing[start:start+batch_size]))
+        self.log_writer.handle_logging(f"{len(missing)} documents no longer in the corpus deleted from the vector store")
+        return missing
+
+    @handle_exceptions
+    def update_hnsw_index(self, vectors:np.ndarray, payloads:List[Dict], ids:List[str], index_dir:str, removed_ids:List[Union[str, int]]=()):
+        """
+        incrementally grows the persistent hnsw index in index_dir, creating it on the first call.
+        rows of removed_ids and stale rows of the given (changed) ids are dropped first: their graph nodes are tombstoned
+        and the changed vectors inserted as new nodes, the graph is only rebuilt once tombstones make up too much of it.
+        """
+        if not LocalVectorIndex.exists(index_dir) and not len(ids):
+            return
+        if LocalVectorIndex.exists(index_dir):
+            local_index = LocalVectorIndex.load(index_dir, mmap=False)
+            removed = local_index.remove([*removed_ids, *ids])
+            if removed:
+                self.log_writer.handle_logging(f"{removed} changed or deleted vectors dropped from the hnsw index at {index_dir}, "
+                                               f"tombstones: {local_index.ann_index.n_deleted if local_index.ann_index is not None else 0}")
+        else:
+            hnsw_params = {"M": pipeline_constants.HNSW_M,
+                           "ef_construction": pipeline_constants.HNSW_EF_CONSTRUCTION,
+                           "ef_search": pipeline_constants.HNSW_EF_SEARCH}
+            local_index = LocalVectorIndex.empty(vectors.shape[1], hnsw_params=hnsw_params)
+        if len(ids):
+            local_index.add(vectors, payloads, ids)
+        local_index.save(index_dir)
+        recall = f", recall@10: {local_index.ann_recall(k=10):.3f}" if len(local_index) else ""
+        self.log_writer.handle_logging(f"hnsw index at {index_dir} updated, # of vectors: {len(local_index)}{recall}")
 
     def similarity_search(self, query: Union[str, List[str]], k:int = 3, filter=None):
 
@@ -105,7 +202,7 @@ class DocumentToQdrantPipeline(VectorRetriever):
         else: 
             raise ValueError("query must be a string or a list of strings")
 
-def run_documents_to_qdrant_pipeline(documents:List[Document]):
+def run_documents_to_qdrant_pipeline(documents:List[Document], hnsw_index_dir:str=None):
         
     #MODEL PARAMETERS
     model_name = "sentence-transformers/all-MiniLM-L6-v2"
@@ -114,7 +211,7 @@ def run_documents_to_qdrant_pipeline(documents:List[Document]):
 
     pipeline = DocumentToQdrantPipeline(model_name, model_kwargs, encode_kwargs)
     pipeline.initialize_qdrant_client()
-    pipeline.add_new_documents(documents)
+    pipeline.add_new_documents(documents, hnsw_index_dir=hnsw_index_dir)
     pipeline.log_writer.handle_logging("documents-to-qdrant-pipeline completed successfully!")
 
 
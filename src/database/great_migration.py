@@ -1,38 +1,34 @@
-from src.database.document_generator_pipeline import DocumentGeneratorPipeline
-from src.database.document_to_qdrant_pipeline import run_documents_to_qdrant_pipeline
+from src.database.ingestion_pipeline import run_streaming_ingestion
+from typing import List, Iterator
 import os
 
 #iterates thru all the json recipes folder
-#pass them to the document generator pipelineü
-#then passes these documents to the run_documents_to_qdrant_pipeline to insert them into qdrant cloud
+#streams them through the ingestion pipeline: parse -> documents -> embeddings (process pool) -> qdrant cloud upserts
+#nothing waits for the whole corpus, memory stays flat (see StreamingIngestionPipeline)
 
 
 recipes_dir_1 = r"C:\Users\ayhan\Desktop\ChefApp_v2\artifacts\recipes\new_data\2foodnet_formatted"
 recipes_dir_2 = r"C:\Users\ayhan\Desktop\ChefApp_v2\artifacts\recipes\new_data\allrecipescom"
 
-pipeline = DocumentGeneratorPipeline()
-#docs = pipeline.run_document_generator_pipeline(json_path)
-documents = []
 
-#iterate thru recipes_dir_1
-
-
-for filename in os.listdir(recipes_dir_1):
-    if filename.endswith(".json"):
-        json_path = os.path.join(recipes_dir_1, filename)
-        docs = pipeline.run_document_generator_pipeline(json_path)
-        documents.extend(docs)
-
-#iterate thru recipes_dir_2, this includes recipe folders
-# Iterate through recipes_dir_2
-for folder in os.listdir(recipes_dir_2):
-    folder_path = os.path.join(recipes_dir_2, folder)
-    if os.path.isdir(folder_path):
-        for filename in os.listdir(folder_path):
+def iter_recipe_json_files(recipes_dirs:List[str]) -> Iterator[str]:
+    """
+    yields every .json recipe file directly inside the given directories or one folder below them
+    (recipes_dir_1 holds the files itself, recipes_dir_2 holds one folder per category).
+    """
+    for recipes_dir in recipes_dirs:
+        for filename in sorted(os.listdir(recipes_dir)):
+            path = os.path.join(recipes_dir, filename)
             if filename.endswith(".json"):
-                json_path = os.path.join(folder_path, filename)
-                docs = pipeline.run_document_generator_pipeline(json_path)
-                documents.extend(docs)
-
-#then pass these documents to the run_documents_to_qdrant_pipeline
-run_documents_to_qdrant_pipeline(documents)
\ No newline at end of file
+                yield path
+            elif os.path.isdir(path):
+                for sub_filename in sorted(os.listdir(path)):
+                    if sub_filename.endswith(".json"):
+                        yield os.path.join(path, sub_filename)
+
+
+if __name__ == "__main__":
+    #iterate thru recipes_dir_1 and the recipe folders of recipes_dir_2
+    #the run covers the whole corpus, so recipes no longer in the folders are deleted from the collection
+    #an interrupted run is resumed from the ingestion manifest, files that fail to parse are moved to the invalid recipes folder
+    print(run_streaming_ingestion(iter_recipe_json_files([recipes_dir_1, recipes_dir_2]), delete_missing=True))
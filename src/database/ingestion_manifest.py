@@ -0,0 +1,160 @@
+from src.constants import pipeline_constants
+from typing import Dict, List, Set, Union
+import sqlite3
+import orjson
+import time
+import os
+
+
+class IngestionManifest:
+    """
+    durable progress record of ingestion runs: per run, the status of every file (pending -> building -> done, or
+    quarantined) and of every batch of documents cut from it (upserted / unchanged = committed, failed), with the point
+    ids each committed batch covers.
+    a restarted run resumes the last unfinished one: done files are not read again, partially ingested files are rebuilt
+    and only their uncommitted batches go through diff / embed / upsert again. a file that changed on disk since it was
+    recorded (size, mtime) starts over.
+    """
+
+    def __init__(self, db_path: str) -> None:
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.db_path = db_path
+        self.run_id = None
+
+        # autocommit mode: every status change is durable the moment it is written
+        self.connection = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                status TEXT NOT NULL,
+                started_at REAL NOT NULL,
+                finished_at REAL)""")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                run_id INTEGER NOT NULL,
+                file_path TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                status TEXT NOT NULL,
+                n_batches INTEGER,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (run_id, file_path))""")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS batches (
+                run_id INTEGER NOT NULL,
+                file_path TEXT NOT NULL,
+                batch_index INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                n_documents INTEGER NOT NULL,
+                point_ids BLOB,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (run_id, file_path, batch_index))""")
+
+    @staticmethod
+    def fingerprint(file_path: str) -> str:
+        stat = os.stat(file_path)
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+    #RUNS
+    def start_run(self, resume: bool = True) -> int:
+        """
+        resumes the last run when it did not finish (and resume is set), starts a new one otherwise.
+        """
+        row = self.connection.execute("SELECT run_id, status FROM runs ORDER BY run_id DESC LIMIT 1").fetchone()
+        if resume and row is not None and row[1] != "finished":
+            self.run_id = row[0]
+            self.connection.execute("UPDATE runs SET status='running' WHERE run_id=?", (self.run_id,))
+        else:
+            self.run_id = self.connection.execute("INSERT INTO runs (status, started_at) VALUES ('running', ?)", (time.time(),)).lastrowid
+        return self.run_id
+
+    def finish_run(self, status: str = "finished") -> None:
+        """
+        "finished" closes the run; any other status ("failed", "incomplete") leaves it to be resumed.
+        """
+        self.connection.execute("UPDATE runs SET status=?, finished_at=? WHERE run_id=?", (status, time.time(), self.run_id))
+
+    #FILES
+    def file_status(self, file_path: str) -> Union[str, None]:
+        """
+        status of the file in this run, None when it was not seen yet or changed on disk since.
+        """
+        row = self.connection.execute("SELECT fingerprint, status FROM files WHERE run_id=? AND file_path=?", (self.run_id, file_path)).fetchone()
+        if row is None or not os.path.exists(file_path) or row[0] != self.fingerprint(file_path):
+            return None
+        return row[1]
+
+    def begin_file(self, file_path: str) -> None:
+        """
+        records the file as being ingested. a file that changed since it was recorded loses its committed batches.
+        """
+        fingerprint = self.fingerprint(file_path)
+        row = self.connection.execute("SELECT fingerprint FROM files WHERE run_id=? AND file_path=?", (self.run_id, file_path)).fetchone()
+        if row is not None and row[0] != fingerprint:
+            self.connection.execute("DELETE FROM batches WHERE run_id=? AND file_path=?", (self.run_id, file_path))
+        self.connection.execute(
+            "INSERT OR REPLACE INTO files (run_id, file_path, fingerprint, status, updated_at) VALUES (?, ?, ?, 'building', ?)",
+            (self.run_id, file_path, fingerprint, time.time()))
+
+    def set_batches(self, file_path: str, n_batches: int) -> None:
+        self.connection.execute("UPDATE files SET n_batches=?, updated_at=? WHERE run_id=? AND file_path=?",
+                                (n_batches, time.time(), self.run_id, file_path))
+        self.complete_file(file_path)
+
+    def complete_file(self, file_path: str) -> bool:
+        """
+        marks the file done once every one of its batches is committed.
+        """
+        row = self.connection.execute("""
+            SELECT f.n_batches, COUNT(b.batch_index) FROM files f
+            LEFT JOIN batches b ON b.run_id=f.run_id AND b.file_path=f.file_path AND b.status IN ('upserted', 'unchanged')
+            WHERE f.run_id=? AND f.file_path=? GROUP BY f.file_path""", (self.run_id, file_path)).fetchone()
+        if row is None or row[0] is None or row[1] < row[0]:
+            return False
+        self.connection.execute("UPDATE files SET status='done', error=NULL, updated_at=? WHERE run_id=? AND file_path=?",
+                                (time.time(), self.run_id, file_path))
+        return True
+
+    def quarantine_file(self, file_path: str, error: str) -> None:
+        self.connection.execute("UPDATE files SET status='quarantined', error=?, updated_at=? WHERE run_id=? AND file_path=?",
+                                (error, time.time(), self.run_id, file_path))
+
+    def file_point_ids(self, file_path: str) -> List[str]:
+        """
+        point ids of the committed batches of the file, the recipes a done file contributes to the run.
+        """
+        rows = self.connection.execute("SELECT point_ids FROM batches WHERE run_id=? AND file_path=? AND status IN ('upserted', 'unchanged')",
+                                       (self.run_id, file_path)).fetchall()
+        return [point_id for (point_ids,) in rows for point_id in orjson.loads(point_ids)]
+
+    #BATCHES
+    def committed_batches(self, file_path: str) -> Set[int]:
+        rows = self.connection.execute("SELECT batch_index FROM batches WHERE run_id=? AND file_path=? AND status IN ('upserted', 'unchanged')",
+                                       (self.run_id, file_path)).fetchall()
+        return {batch_index for (batch_index,) in rows}
+
+    def commit_batch(self, file_path: str, batch_index: int, status: str, point_ids: List[str]) -> bool:
+        """
+        records a batch as committed ("upserted", or "unchanged" when the diff left nothing to write); returns whether the file is now done.
+        """
+        self.connection.execute("INSERT OR REPLACE INTO batches VALUES (?, ?, ?, ?, ?, ?, NULL, ?)",
+                                (self.run_id, file_path, batch_index, status, len(point_ids), orjson.dumps(point_ids), time.time()))
+        return self.complete_file(file_path)
+
+    def fail_batch(self, file_path: str, batch_index: int, n_documents: int, error: str) -> None:
+        self.connection.execute("INSERT OR REPLACE INTO batches VALUES (?, ?, ?, 'failed', ?, NULL, ?, ?)",
+                                (self.run_id, file_path, batch_index, n_documents, error, time.time()))
+
+    def summary(self) -> Dict:
+        files = self.connection.execute("SELECT status, COUNT(*) FROM files WHERE run_id=? GROUP BY status", (self.run_id,)).fetchall()
+        batches = self.connection.execute("SELECT status, COUNT(*) FROM batches WHERE run_id=? GROUP BY status", (self.run_id,)).fetchall()
+        return {"run_id": self.run_id, "files": dict(files), "batches": dict(batches)}
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def initialize_ingestion_manifest() -> IngestionManifest:
+    return IngestionManifest(os.getenv("INGESTION_MANIFEST_PATH", pipeline_constants.INGESTION_MANIFEST_PATH))
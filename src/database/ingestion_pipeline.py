@@ -0,0 +1,476 @@
+from src.database.document_generator_pipeline import DocumentGeneratorPipeline
+from src.handler_api.payload_schema import create_payload_indexes_async
+from src.handler_api.recipe_store import RecipeStore, initialize_recipe_store, point_key
+from src.database.recipe_identity import stamp_documents, hash_selector, stored_hashes, changed_positions
+from src.database.ingestion_manifest import IngestionManifest, initialize_ingestion_manifest
+from src.constants import pipeline_constants
+from src.logger import AppLogger
+from langchain.schema.document import Document
+from langchain.embeddings import HuggingFaceEmbeddings
+from qdrant_client.http.models import Distance, VectorParams, PointStruct, PointIdsList
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, BrokenExecutor
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Tuple, Union
+from collections import Counter
+from dotenv import load_dotenv
+import multiprocessing
+import qdrant_client
+import numpy as np
+import functools
+import asyncio
+import logging
+import shutil
+import orjson
+import time
+import os
+
+
+DONE = object() # end of stream marker passed down the queues
+
+#state of an embedding worker process, set once by init_embedding_worker
+_worker_embedder = None
+
+
+def default_embedder_factory() -> Callable[[], Any]:
+    """
+    picklable factory of the ingestion embedder, the same model the retriever embeds queries with.
+    """
+    return functools.partial(HuggingFaceEmbeddings, model_name="sentence-transformers/all-MiniLM-L6-v2",
+                             model_kwargs={'device': 'cpu'}, encode_kwargs={'normalize_embeddings': False})
+
+
+def init_embedding_worker(embedder_factory: Callable[[], Any], torch_threads: int) -> None:
+    """
+    runs once in every embedding process: loads the model a single time instead of once per batch.
+    """
+    global _worker_embedder
+    if torch_threads:
+        try:
+            import torch
+            torch.set_num_threads(torch_threads)
+        except ImportError:
+            pass
+    _worker_embedder = embedder_factory()
+
+
+def embed_texts(texts: List[str]) -> np.ndarray:
+    return np.asarray(_worker_embedder.embed_documents(texts), dtype=np.float32)
+
+
+class DocumentBatch:
+    """
+    up to batch_size documents cut from one file, the unit that is diffed, embedded, upserted and checkpointed.
+    point_ids keeps every id of the batch, documents / ids only what still has to be written once the batch is diffed.
+    """
+
+    def __init__(self, file_path: str, index: int, documents: List[Document], ids: List[str]) -> None:
+        self.file_path = file_path
+        self.index = index
+        self.documents = documents
+        self.ids = ids
+        self.point_ids = list(ids)
+        self.vectors: Union[np.ndarray, None] = None
+
+
+class ItemFailed(Exception):
+    """
+    a failed item that still hands items to the next stage: the files a failed file held back in the reorder buffer.
+    """
+
+    def __init__(self, error: Exception, outputs: List[Any]) -> None:
+        super().__init__(str(error))
+        self.error = error
+        self.outputs = outputs
+
+
+class StageStats:
+    """
+    counters of one pipeline stage: items handled, documents that went through and the time its workers were busy.
+    """
+
+    def __init__(self) -> None:
+        self.items = 0
+        self.documents = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.started_at = None
+        self.finished_at = None
+
+    def record(self, documents: int, seconds: float) -> None:
+        self.items += 1
+        self.documents += documents
+        self.busy_seconds += seconds
+
+    def metrics(self) -> Dict:
+        elapsed = ((self.finished_at or time.monotonic()) - self.started_at) if self.started_at else 0.0
+        return {
+            "items": self.items,
+            "documents": self.documents,
+            "errors": self.errors,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "documents_per_second": round(self.documents / elapsed, 1) if elapsed else 0.0,
+        }
+
+
+class StreamingIngestionPipeline:
+    """
+    ingests recipe json files into the qdrant collection as a stream of stages connected by bounded queues:
+        files -> parse (thread pool: read + json parsing) -> build (one thread: documents, ingredient vocabulary)
+              -> diff (stored content hashes) -> embed (process pool, one model per process) -> upsert (async qdrant client, + recipe store)
+    every queue holds at most queue_size items, so a slow stage holds the ones before it back and memory stays flat
+    whatever the corpus size; all stages run at once, so the embedding processes keep every core busy while files are
+    still being parsed and earlier batches are being upserted. documents per second of each stage and the queue depths
+    are logged every report_interval seconds and returned by run().
+    the ingredient vocabulary is append-only and shared, so documents are built by a single thread; it is saved after
+    every file, before any payload referring to its new ids is written.
+    re-ingestion is idempotent and costs what changed: point ids are uuid5 of the recipe url and every payload carries a
+    content hash, so recipes whose stored hash matches are skipped before embedding, changed ones overwrite their point.
+    the first occurrence of a url wins within a run. delete_missing=True (only for runs over the whole corpus) also deletes
+    the points no ingested recipe maps to, which removes dropped recipes and points written with random ids before.
+    progress is checkpointed in an IngestionManifest: a restarted run skips the files it already finished and re-sends
+    only the uncommitted batches of the others. a file that cannot be parsed or built is moved to quarantine_dir
+    (as PreprocessorPipeline does with invalid xlsx files) and the run goes on.
+    the local index snapshot is not updated here, export it afterwards (export_local_vector_index).
+    """
+
+    def __init__(self, client: Any = None, collection_name: str = None,
+                 embedder_factory: Callable[[], Any] = None,
+                 queue_size: int = pipeline_constants.INGESTION_QUEUE_SIZE,
+                 parse_workers: int = pipeline_constants.INGESTION_PARSE_WORKERS,
+                 embed_workers: int = pipeline_constants.INGESTION_EMBED_WORKERS,
+                 torch_threads: int = pipeline_constants.INGESTION_EMBED_TORCH_THREADS,
+                 batch_size: int = pipeline_constants.INGESTION_EMBED_BATCH_SIZE,
+                 upsert_concurrency: int = pipeline_constants.INGESTION_UPSERT_CONCURRENCY,
+                 report_interval: float = pipeline_constants.INGESTION_REPORT_INTERVAL_SECONDS,
+                 recipe_store: Union[RecipeStore, None] = None, delete_missing: bool = False,
+                 manifest: Union[IngestionManifest, None] = None,
+                 quarantine_dir: str = pipeline_constants.INVALID_RECIPES_FOLDER) -> None:
+        self.log_writer = AppLogger("StreamingIngestionPipeline")
+        self.client = client # AsyncQdrantClient
+        self.collection_name = collection_name
+        self.embedder_factory = embedder_factory or default_embedder_factory()
+        self.queue_size = queue_size
+        self.parse_workers = parse_workers
+        self.embed_workers = embed_workers or os.cpu_count() or 1
+        self.torch_threads = torch_threads
+        self.batch_size = batch_size
+        self.upsert_concurrency = upsert_concurrency
+        self.report_interval = report_interval
+        self.recipe_store = recipe_store
+        self.delete_missing = delete_missing
+        self.manifest = manifest or IngestionManifest(":memory:") # without one the run is tracked, not resumable
+        self.quarantine_dir = quarantine_dir
+        self.document_generator = DocumentGeneratorPipeline()
+        self.stages = {name: StageStats() for name in ("parse", "build", "diff", "embed", "upsert")}
+        self.recipes = Counter() # new / changed / unchanged / duplicate / deleted / resumed
+        self.seen_ids = set() # point keys of every recipe of the run
+        self.reorder_buffer: Dict[int, Union[Tuple[str, List[Dict]], None]] = {} # parsed files waiting for the ones discovered before them
+        self.next_sequence = 0
+        self.collection_found = False
+        self.queues: Dict[str, asyncio.Queue] = {}
+        self.peak_depths: Dict[str, int] = {}
+        self.collection_ready = None
+
+    #STAGES
+    def parse_file(self, file_path: str) -> List[Dict]:
+        with open(file_path, "rb") as f:
+            json_data = self.document_generator.replace_null(orjson.loads(f.read()))
+        if not isinstance(json_data, list):
+            raise ValueError(f"expected a list of recipes, got {type(json_data).__name__}")
+        return json_data
+
+    def build_batches(self, file_path: str, json_data: List[Dict]) -> List[DocumentBatch]:
+        documents = self.document_generator.build_documents(json_data)
+        self.document_generator.ingredient_vocabulary.save(self.document_generator.ingredient_vocabulary_path)
+        unique_documents, unique_ids = [], []
+        for document, point_id in zip(documents, stamp_documents(documents)):
+            if point_key(point_id) in self.seen_ids: # the same recipe listed in several category files
+                self.recipes["duplicate"] += 1
+                continue
+            self.seen_ids.add(point_key(point_id))
+            unique_documents.append(document)
+            unique_ids.append(point_id)
+        return [DocumentBatch(file_path, index, unique_documents[start:start + self.batch_size], unique_ids[start:start + self.batch_size])
+                for index, start in enumerate(range(0, len(unique_documents), self.batch_size))]
+
+    async def diff_batch(self, batch: DocumentBatch) -> None:
+        """
+        keeps the documents of the batch that are new or changed since they were stored.
+        """
+        stored = {}
+        if self.collection_found:
+            stored = stored_hashes(await self.client.retrieve(collection_name=self.collection_name, ids=batch.ids,
+                                                              with_payload=hash_selector(), with_vectors=False))
+        positions = changed_positions(batch.documents, batch.ids, stored)
+        self.recipes.update({status: len(status_positions) for status, status_positions in positions.items()})
+        keep = sorted(positions["new"] + positions["changed"])
+        batch.documents, batch.ids = [batch.documents[i] for i in keep], [batch.ids[i] for i in keep]
+
+    async def upsert_batch(self, batch: DocumentBatch) -> None:
+        if self.collection_ready is None: # first batch: the vector size is known now
+            self.collection_ready = asyncio.ensure_future(self.ensure_collection(batch.vectors.shape[1]))
+        await self.collection_ready
+
+        payloads = [{"page_content": document.page_content, "metadata": document.metadata} for document in batch.documents]
+        await self.client.upsert(collection_name=self.collection_name, wait=True,
+                                 points=[PointStruct(id=point_id, vector=vector.tolist(), payload=payload)
+                                         for point_id, vector, payload in zip(batch.ids, batch.vectors, payloads)])
+        if self.recipe_store is not None:
+            self.recipe_store.put_many(batch.ids, payloads)
+
+    async def ensure_collection(self, vector_size: int) -> None:
+        if not await self.client.collection_exists(self.collection_name):
+            await self.client.create_collection(collection_name=self.collection_name,
+                                                vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE, on_disk=True))
+            self.log_writer.handle_logging(f"collection {self.collection_name} created, vector size: {vector_size}")
+        await create_payload_indexes_async(self.client, self.collection_name)
+
+    async def delete_missing_points(self, batch_size: int = 1000) -> int:
+        """
+        deletes the points of the collection (and recipe store) that no recipe of this run maps to.
+        """
+        missing = []
+        offset = None
+        while True:
+            points, offset = await self.client.scroll(collection_name=self.collection_name, limit=batch_size, offset=offset,
+                                                      with_payload=False, with_vectors=False)
+            missing.extend(point.id for point in points if point_key(point.id) not in self.seen_ids)
+            if offset is None:
+                break
+        for start in range(0, len(missing), batch_size):
+            await self.client.delete(collection_name=self.collection_name, points_selector=PointIdsList(points=missing[start:start + batch_size]))
+        if self.recipe_store is not None:
+            self.recipe_store.delete_many(missing)
+        self.recipes["deleted"] += len(missing)
+        return len(missing)
+
+    #CHECKPOINTS
+    def commit(self, batch: DocumentBatch, status: str) -> None:
+        if self.manifest.commit_batch(batch.file_path, batch.index, status, batch.point_ids):
+            self.log_writer.handle_logging(f"file ingested: {batch.file_path}")
+
+    def quarantine(self, file_path: str, error: Exception) -> None:
+        """
+        moves a file that cannot be ingested to quarantine_dir, like PreprocessorPipeline does with invalid xlsx files.
+        """
+        self.manifest.quarantine_file(file_path, str(error))
+        os.makedirs(self.quarantine_dir, exist_ok=True)
+        destination = os.path.join(self.quarantine_dir, os.path.basename(file_path))
+        if os.path.exists(destination): # category folders reuse file names
+            destination = os.path.join(self.quarantine_dir, f"{os.path.basename(os.path.dirname(file_path))}_{os.path.basename(file_path)}")
+        shutil.move(file_path, destination)
+        self.log_writer.handle_logging(f"Moved invalid file {file_path} to {destination}", logging.INFO)
+
+    def on_failure(self, item: Any, error: Exception) -> None:
+        """
+        checkpoint of a failed item: its batch is marked failed (retried by the next run), a file that could not be
+        parsed or built is quarantined.
+        """
+        if isinstance(item, DocumentBatch):
+            self.manifest.fail_batch(item.file_path, item.index, len(item.point_ids), str(error))
+        else:
+            try:
+                self.quarantine(item[0], error)
+            except OSError as e:
+                self.log_writer.handle_logging(f"could not quarantine {item[0]}: {e}", logging.ERROR)
+
+    #PLUMBING
+    def new_queue(self, name: str) -> asyncio.Queue:
+        self.queues[name] = asyncio.Queue(maxsize=self.queue_size)
+        self.peak_depths[name] = 0
+        return self.queues[name]
+
+    async def put(self, name: str, item: Any) -> None:
+        await self.queues[name].put(item)
+        self.peak_depths[name] = max(self.peak_depths[name], self.queues[name].qsize())
+
+    async def run_stage(self, name: str, inbox: asyncio.Queue, outbox: Union[str, None], workers: int,
+                        handler: Callable[[Any], Awaitable[Tuple[List[Any], int]]]) -> None:
+        """
+        runs `workers` consumers of inbox. handler returns the items for the outbox queue (possibly none) and the # of
+        documents it handled; a failed item is logged, counted and checkpointed (on_failure), the stream goes on with
+        the items it still releases (ItemFailed).
+        DONE is passed on once every worker has stopped.
+        """
+        stats = self.stages[name]
+        stats.started_at = time.monotonic()
+
+        async def worker() -> None:
+            while True:
+                item = await inbox.get()
+                if item is DONE:
+                    await inbox.put(DONE) # lets the other workers of the stage stop as well
+                    return
+                started = time.perf_counter()
+                try:
+                    outputs, documents = await handler(item)
+                    stats.record(documents, time.perf_counter() - started)
+                except BrokenExecutor: # a dead pool fails every item that follows, the run is aborted instead
+                    raise
+                except Exception as e:
+                    error, outputs = (e.error, e.outputs) if isinstance(e, ItemFailed) else (e, [])
+                    stats.errors += 1
+                    where = f"{item.file_path} batch {item.index}" if isinstance(item, DocumentBatch) else item[0]
+                    self.log_writer.handle_logging(f"ingestion stage {name} failed on {where}: {error}", logging.ERROR)
+                    self.on_failure(item, error)
+                for output in outputs:
+                    await self.put(outbox, output)
+
+        await asyncio.gather(*[worker() for _ in range(workers)])
+        stats.finished_at = time.monotonic()
+        if outbox is not None:
+            await self.put(outbox, DONE)
+
+    async def feed_files(self, file_paths: Iterable[str]) -> None:
+        """
+        file discovery: files the manifest shows as done in this run are skipped, their recipes still count as seen.
+        """
+        sequence = 0
+        for file_path in file_paths:
+            if self.manifest.file_status(file_path) == "done":
+                point_ids = self.manifest.file_point_ids(file_path)
+                self.seen_ids.update(point_key(point_id) for point_id in point_ids)
+                self.recipes["resumed"] += len(point_ids)
+                continue
+            self.manifest.begin_file(file_path)
+            await self.put("files", (file_path, sequence))
+            sequence += 1
+        await self.put("files", DONE)
+
+    def in_discovery_order(self, sequence: int, parsed: Union[Tuple[str, List[Dict]], None]) -> List[Tuple[str, List[Dict]]]:
+        """
+        parse workers finish out of order; files are released to the build stage in the order they were discovered, so
+        the same occurrence of a recipe listed in several files wins on every run. a failed file (None) releases the rest.
+        """
+        self.reorder_buffer[sequence] = parsed
+        released = []
+        while self.next_sequence in self.reorder_buffer:
+            parsed = self.reorder_buffer.pop(self.next_sequence)
+            self.next_sequence += 1
+            if parsed is not None:
+                released.append(parsed)
+        return released
+
+    async def report(self) -> None:
+        while True:
+            await asyncio.sleep(self.report_interval)
+            self.log_writer.handle_logging(f"ingestion progress: {orjson.dumps(self.metrics()).decode('utf-8')}")
+
+    def metrics(self) -> Dict:
+        return {
+            "stages": {name: stats.metrics() for name, stats in self.stages.items()},
+            "queues": {name: {"depth": queue.qsize(), "peak_depth": self.peak_depths[name], "max_size": queue.maxsize}
+                       for name, queue in self.queues.items()},
+            "recipes": dict(self.recipes),
+            "manifest": self.manifest.summary(),
+        }
+
+    async def run(self, file_paths: Iterable[str], resume: bool = True) -> Dict:
+        """
+        resume=True continues the last run of the manifest if it did not finish, resume=False starts a new one.
+        """
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        run_id = self.manifest.start_run(resume)
+        self.log_writer.handle_logging(f"ingestion run {run_id} started, manifest: {self.manifest.summary()}")
+        files, parsed, batches, diffed, embedded = (self.new_queue(name) for name in ("files", "parsed", "batches", "diffed", "embedded"))
+        self.collection_found = await self.client.collection_exists(self.collection_name)
+
+        parse_executor = ThreadPoolExecutor(max_workers=self.parse_workers, thread_name_prefix="ingestion-parse")
+        build_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingestion-build")
+        # spawn: forking a parent that already loaded torch can deadlock its thread pools
+        embed_executor = ProcessPoolExecutor(max_workers=self.embed_workers, mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=init_embedding_worker, initargs=(self.embedder_factory, self.torch_threads))
+
+        async def parse(item: Tuple[str, int]) -> Tuple[List[Tuple[str, List[Dict]]], int]:
+            file_path, sequence = item
+            try:
+                json_data = await loop.run_in_executor(parse_executor, self.parse_file, file_path)
+            except BrokenExecutor:
+                raise
+            except Exception as e: # the files waiting behind this one go on to the build stage
+                raise ItemFailed(e, self.in_discovery_order(sequence, None)) from e
+            return self.in_discovery_order(sequence, (file_path, json_data)), len(json_data)
+
+        async def build(item: Tuple[str, List[Dict]]) -> Tuple[List[DocumentBatch], int]:
+            file_path, json_data = item
+            file_batches = await loop.run_in_executor(build_executor, self.build_batches, file_path, json_data)
+            committed = self.manifest.committed_batches(file_path) # sent by the run this one resumes
+            self.manifest.set_batches(file_path, len(file_batches))
+            return [batch for batch in file_batches if batch.index not in committed], len(json_data)
+
+        async def diff(batch: DocumentBatch) -> Tuple[List[DocumentBatch], int]:
+            await self.diff_batch(batch)
+            if not batch.documents:
+                self.commit(batch, "unchanged")
+                return [], len(batch.point_ids)
+            return [batch], len(batch.point_ids)
+
+        async def embed(batch: DocumentBatch) -> Tuple[List[DocumentBatch], int]:
+            batch.vectors = await loop.run_in_executor(embed_executor, embed_texts, [document.page_content for document in batch.documents])
+            return [batch], len(batch.documents)
+
+        async def upsert(batch: DocumentBatch) -> Tuple[List, int]:
+            await self.upsert_batch(batch)
+            self.commit(batch, "upserted")
+            return [], len(batch.documents)
+
+        reporter = asyncio.ensure_future(self.report())
+        tasks = [asyncio.ensure_future(stage) for stage in (
+            self.feed_files(file_paths),
+            self.run_stage("parse", files, "parsed", self.parse_workers, parse),
+            self.run_stage("build", parsed, "batches", 1, build),
+            self.run_stage("diff", batches, "diffed", self.upsert_concurrency, diff),
+            self.run_stage("embed", diffed, "embedded", self.embed_workers, embed),
+            self.run_stage("upsert", embedded, None, self.upsert_concurrency, upsert))]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            self.manifest.finish_run("failed") # the next run resumes this one
+            raise
+        finally:
+            for task in [*tasks, reporter]: # a failed stage stops the others, they would wait on its queue forever
+                task.cancel()
+            parse_executor.shutdown(wait=False)
+            build_executor.shutdown(wait=False)
+            embed_executor.shutdown(wait=True)
+
+        failed = any(stats.errors for stats in self.stages.values())
+        if self.delete_missing:
+            if failed:
+                # recipes of a failed file or batch were not seen, deleting now would drop them from the collection
+                self.log_writer.handle_logging("stages failed during the run, missing points are not deleted", logging.WARNING)
+            elif await self.client.collection_exists(self.collection_name):
+                await self.delete_missing_points()
+        # failed batches are retried by the next run, which resumes this one
+        self.manifest.finish_run("incomplete" if failed else "finished")
+
+        elapsed = time.monotonic() - started
+        metrics = self.metrics()
+        metrics["elapsed_seconds"] = round(elapsed, 3)
+        metrics["documents_per_second"] = round(self.stages["upsert"].documents / elapsed, 1) if elapsed else 0.0
+        self.log_writer.handle_logging(f"streaming ingestion finished: {orjson.dumps(metrics).decode('utf-8')}")
+        return metrics
+
+
+def run_streaming_ingestion(file_paths: Iterable[str], resume: bool = True, **kwargs: Any) -> Dict:
+    """
+    ingests the given recipe json files into the QDRANT_COLLECTION_NAME collection; kwargs go to StreamingIngestionPipeline.
+    progress is checkpointed in the INGESTION_MANIFEST_PATH manifest, resume=True picks up an interrupted run.
+    payloads are written to the recipe store as well in LEAN_PAYLOAD mode.
+    """
+    load_dotenv()
+
+    async def run() -> Dict:
+        client = qdrant_client.AsyncQdrantClient(url=os.getenv('QDRANT_URL'), api_key=os.getenv('QDRANT_API_KEY'))
+        recipe_store = initialize_recipe_store() if os.getenv("LEAN_PAYLOAD", str(pipeline_constants.LEAN_PAYLOAD)).lower() == "true" else None
+        manifest = initialize_ingestion_manifest()
+        pipeline = StreamingIngestionPipeline(client, os.getenv('QDRANT_COLLECTION_NAME'), recipe_store=recipe_store, manifest=manifest, **kwargs)
+        try:
+            return await pipeline.run(file_paths, resume=resume)
+        finally:
+            await client.close()
+            manifest.close()
+            if recipe_store is not None:
+                recipe_store.close()
+
+    return asyncio.run(run())
@@ -0,0 +1,150 @@
+from src.database.document_generator_pipeline import DocumentGeneratorPipeline
+from src.database.great_migration import iter_recipe_json_files
+from src.handler_api.qdrant_vector_retriever_pipeline import format_recipe
+from src.handler_api.recipe_models import RecipeResult, FormattedRecipe
+from src.handler_api.prompt_builder import prompt_builder
+from src.handler_api.translation_cache import initialize_translation_cache
+from src.handler_api.llm_handler import prompt_templates, call_gpt_2, build_instruction, llm_client, is_retryable
+from src.handler_api.request_hedger import RequestHedger
+from src.constants import pipeline_constants
+from src.logger import AppLogger
+from src.exception_handler import handle_exceptions
+from typing import Iterator, List, Dict, Tuple, Union
+from collections import Counter
+from dotenv import load_dotenv
+import asyncio
+import logging
+import os
+
+
+class RateLimiter:
+    """
+    spaces LLM request starts at least 60/requests_per_minute seconds apart, shared by all workers of the job.
+    """
+
+    def __init__(self, requests_per_minute: float) -> None:
+        self.interval = 60.0 / requests_per_minute
+        self.next_slot = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        async with self.lock:
+            now = asyncio.get_running_loop().time()
+            delay = self.next_slot - now
+            self.next_slot = max(now, self.next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class PretranslationJob:
+    """
+    formats and translates the recipe corpus (or the top-N most requested recipes) into a set of target languages
+    ahead of time and stores the results in the same TranslationCache get_recipe reads from.
+    - languages must be spelled the way clients send UserRequest.country, that string is the cache key.
+    - the job is resumable: (recipe, language) pairs already in the cache are skipped, results are stored one by one.
+    - the corpus is streamed file by file into a bounded queue, and the ingredient vocabulary file is only read.
+    - every LLM request takes a rate limiter slot: the job retries a failed translation itself, so its calls are
+      neither retried nor hedged by call_gpt_2.
+    - set TRANSLATION_CACHE_MAX_ENTRIES above recipes x languages, otherwise eviction drops pre-translated entries.
+    - set OPENAI_BASE_URL to a local stub server (src/handler_api/stub_llm_server.py) to run it offline.
+    """
+
+    def __init__(self, languages: List[str], recipes_dirs: List[str] = pipeline_constants.RECIPES_DIRS,
+                 concurrency: int = pipeline_constants.PRETRANSLATION_CONCURRENCY,
+                 requests_per_minute: float = pipeline_constants.PRETRANSLATION_REQUESTS_PER_MINUTE,
+                 top_n: int = None, max_attempts: int = 3, backoff_seconds: float = 2.0) -> None:
+        self.log_writer = AppLogger("PretranslationJob")
+        self.languages = languages
+        self.recipes_dirs = recipes_dirs
+        self.concurrency = concurrency
+        self.requests_per_minute = requests_per_minute
+        self.top_n = top_n
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.translation_cache = initialize_translation_cache(prompt_templates())
+        self.document_generator = DocumentGeneratorPipeline()
+        # one request per call: no hedge and no retry behind the rate limiter's back
+        self.llm_hedger = RequestHedger(hedge_percentile=0, max_attempts=1, retryable=is_retryable)
+        self.stats = Counter()
+
+    @handle_exceptions
+    def iter_recipes(self) -> Iterator[RecipeResult]:
+        """
+        yields the same recipe objects the retriever hands to the LLM, one file at a time, de-duplicated by recipe url.
+        documents are built without saving the ingredient vocabulary, the job does not write it.
+        """
+        wanted = set(self.translation_cache.top_requested(self.top_n)) if self.top_n else None
+        seen = set()
+        for json_path in iter_recipe_json_files(self.recipes_dirs):
+            json_data = self.document_generator.replace_null(self.document_generator.load_json_object(json_path))
+            for document in self.document_generator.build_documents(json_data):
+                recipe = format_recipe(document.metadata)
+                if recipe.recipe_url in seen or (wanted is not None and recipe.recipe_url not in wanted):
+                    continue
+                seen.add(recipe.recipe_url)
+                self.stats["recipes"] += 1
+                yield recipe
+
+    def pending_tasks(self, recipes: Iterator[RecipeResult]) -> Iterator[Tuple[RecipeResult, str]]:
+        for recipe in recipes:
+            for language in self.languages:
+                if self.translation_cache.contains(recipe.recipe_url, language, recipe.content_hash()):
+                    self.stats["skipped"] += 1
+                else:
+                    yield recipe, language
+
+    async def translate(self, recipe: RecipeResult, language: str, rate_limiter: RateLimiter) -> None:
+        for attempt in range(self.max_attempts):
+            await rate_limiter.wait()
+            instruction = build_instruction(language)
+            value = FormattedRecipe.from_llm_output(await call_gpt_2(instruction=instruction, prompt=prompt_builder.build(recipe, instruction),
+                                                                     hedger=self.llm_hedger))
+            if value is not None:
+                self.translation_cache.put(recipe.recipe_url, language, value.cache_value(), recipe.content_hash()) # shopping list is computed per request
+                self.stats["translated"] += 1
+                return
+            await asyncio.sleep(self.backoff_seconds * 2 ** attempt)
+
+        self.stats["failed"] += 1
+        self.log_writer.handle_logging(f"translation failed for {recipe.recipe_url} [{language}] after {self.max_attempts} attempts", logging.ERROR)
+
+    async def run(self) -> Dict:
+        self.log_writer.handle_logging(f"pre-translation job started: {len(self.languages)} languages, top_n: {self.top_n}")
+        queue = asyncio.Queue(maxsize=2 * self.concurrency) # holds the corpus scan back while the workers are busy
+        rate_limiter = RateLimiter(self.requests_per_minute)
+
+        async def worker() -> None:
+            while True:
+                task = await queue.get()
+                if task is None:
+                    return
+                await self.translate(*task, rate_limiter)
+
+        await llm_client.start()
+        workers = [asyncio.ensure_future(worker()) for _ in range(self.concurrency)]
+        try:
+            for task in self.pending_tasks(self.iter_recipes()):
+                await queue.put(task)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for worker_task in workers:
+                worker_task.cancel()
+            await llm_client.close()
+
+        self.log_writer.handle_logging(f"pre-translation job finished: {dict(self.stats)}")
+        return dict(self.stats)
+
+
+def run_pretranslation_job(languages: List[str], top_n: int = None) -> Dict:
+    job = PretranslationJob(languages, top_n=top_n)
+    return asyncio.run(job.run())
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    #comma separated, e.g. PRETRANSLATION_LANGUAGES="Turkey,Germany,Spain"
+    languages = [language.strip() for language in os.getenv("PRETRANSLATION_LANGUAGES", "").split(",") if language.strip()]
+    top_n = os.getenv("PRETRANSLATION_TOP_N")
+    print(run_pretranslation_job(languages, top_n=int(top_n) if top_n else None))
@@ -0,0 +1,67 @@
+from src.handler_api.recipe_store import point_key
+from langchain.schema.document import Document
+from qdrant_client.http import models
+from typing import Any, Dict, List
+import hashlib
+import orjson
+import uuid
+
+
+RECIPE_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "chef-app/recipes") # namespace of the uuid5 point ids, changing it re-keys the collection
+CONTENT_HASH_FIELD = "recipe_content_hash" # metadata key holding the hash of what was embedded and stored
+NULL_URLS = {"", "None", "null"}
+
+
+def content_hash(document: Document) -> str:
+    """
+    sha256 of everything stored for a recipe: page content and metadata (without the hash itself), independent of key order.
+    """
+    metadata = {key: value for key, value in document.metadata.items() if key != CONTENT_HASH_FIELD}
+    return hashlib.sha256(orjson.dumps({"page_content": document.page_content, "metadata": metadata}, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+def recipe_point_id(document: Document) -> str:
+    """
+    deterministic point id: uuid5 of the recipe url, so re-ingesting a recipe overwrites its point instead of adding a duplicate.
+    recipes without a url are keyed by their content hash.
+    """
+    url = str(document.metadata.get("recipe_card-href") or "")
+    key = url if url not in NULL_URLS else f"content:{document.metadata.get(CONTENT_HASH_FIELD) or content_hash(document)}"
+    return str(uuid.uuid5(RECIPE_ID_NAMESPACE, key))
+
+
+def stamp_documents(documents: List[Document]) -> List[str]:
+    """
+    stores the content hash in every document's metadata and returns their point ids.
+    """
+    for document in documents:
+        document.metadata[CONTENT_HASH_FIELD] = content_hash(document)
+    return [recipe_point_id(document) for document in documents]
+
+
+def hash_selector() -> models.PayloadSelectorInclude:
+    return models.PayloadSelectorInclude(include=[f"metadata.{CONTENT_HASH_FIELD}"])
+
+
+def stored_hashes(points: List[Any]) -> Dict[str, str]:
+    """
+    point_key -> stored content hash of retrieved points, points ingested without a hash map to None.
+    """
+    return {point_key(point.id): ((point.payload or {}).get("metadata") or {}).get(CONTENT_HASH_FIELD) for point in points}
+
+
+def changed_positions(documents: List[Document], ids: List[str], stored: Dict[str, str]) -> Dict[str, List[int]]:
+    """
+    splits a batch by comparing its content hashes with the stored ones: "new" and "changed" positions have to be
+    embedded and upserted, "unchanged" ones are skipped.
+    """
+    positions = {"new": [], "changed": [], "unchanged": []}
+    for position, (document, point_id) in enumerate(zip(documents, ids)):
+        key = point_key(point_id)
+        if key not in stored:
+            positions["new"].append(position)
+        elif stored[key] != document.metadata[CONTENT_HASH_FIELD]:
+            positions["changed"].append(position)
+        else:
+            positions["unchanged"].append(position)
+    return positions
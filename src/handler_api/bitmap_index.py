@@ -0,0 +1,157 @@
+from src.handler_api.recipe_models import parse_payload_field
+from typing import List, Dict, Iterable
+import numpy as np
+import json
+import re
+import os
+
+
+BITMAPS_FILE_NAME = "bitmaps.npy"
+BITMAP_TERMS_FILE_NAME = "bitmap_terms.json"
+TOKEN_PATTERN = re.compile(r"[a-z]+")
+SUBSTRING_CACHE_MAX_SIZE = 4096 # distinct exclusion words whose expanded bitmap is kept
+
+
+def normalize_token(token: str) -> str:
+    """
+    crude singular form so "eggs" / "egg" and "peanuts" / "peanut" share a posting.
+    """
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    return [normalize_token(token) for token in TOKEN_PATTERN.findall(text.lower()) if len(token) > 2]
+
+
+def normalize_tag(tag: str) -> str:
+    return " ".join(tokenize(tag))
+
+
+class BitmapIndex:
+    """
+    inverted index from normalized tags and ingredient tokens to bitsets over the rows of a LocalVectorIndex.
+    each term owns one row of a (n_terms, ceil(n_rows / 8)) uint8 matrix (np.packbits, little bit order), so a filter with
+    any number of preferences and allergens is a handful of AND / ANDNOT operations over n_rows / 8 bytes,
+    instead of one substring scan over every document per condition.
+    tags are keyed as "tag:<tag>", ingredient and tag words as "tok:<token>".
+    only the in-process backend (VECTOR_BACKEND=local) filters with it. the default qdrant backend sends the filter to
+    the server, compiled against the indexed keyword fields of payload_schema instead.
+    """
+
+    def __init__(self, terms: Dict[str, int], bitmaps: np.ndarray, n_rows: int) -> None:
+        self.terms = terms
+        self.bitmaps = bitmaps
+        self.n_rows = n_rows
+        self.tokens = [(term[4:], row) for term, row in terms.items() if term.startswith("tok:")]
+        self.substring_bitmaps: Dict[str, np.ndarray] = {} # token -> OR of the bitmaps of every word containing it
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    @staticmethod
+    def row_terms(payload: Dict) -> set:
+        metadata = payload.get("metadata") or {}
+        tags = parse_payload_field(metadata.get("recipe_tags_formatted"), list)
+        ingredients = parse_payload_field(metadata.get("recipe_ingredients_formatted"), list)
+        terms = {f"tag:{normalize_tag(str(tag))}" for tag in tags}
+        for text in [*map(str, tags), *map(str, ingredients)]:
+            terms.update(f"tok:{token}" for token in tokenize(text))
+        return terms
+
+    @classmethod
+    def from_payloads(cls, payloads: List[Dict]) -> "BitmapIndex":
+        postings: Dict[str, List[int]] = {}
+        for row, payload in enumerate(payloads):
+            for term in cls.row_terms(payload):
+                postings.setdefault(term, []).append(row)
+
+        n_rows = len(payloads)
+        terms = {term: i for i, term in enumerate(sorted(postings))}
+        bitmaps = np.zeros((len(terms), (n_rows + 7) // 8), dtype=np.uint8)
+        for term, rows in postings.items():
+            rows = np.asarray(rows, dtype=np.int64)
+            np.bitwise_or.at(bitmaps[terms[term]], rows >> 3, (1 << (rows & 7)).astype(np.uint8))
+        return cls(terms, bitmaps, n_rows)
+
+    #QUERY
+    def full(self) -> np.ndarray:
+        return np.packbits(np.ones(self.n_rows, dtype=bool), bitorder="little")
+
+    def empty(self) -> np.ndarray:
+        return np.zeros((self.n_rows + 7) // 8, dtype=np.uint8)
+
+    def token_bitmap(self, token: str, substring: bool = False) -> np.ndarray:
+        if not substring:
+            row = self.terms.get(f"tok:{token}")
+            return self.bitmaps[row] if row is not None else self.empty()
+        # every vocabulary word containing the token, e.g. "milk" -> "buttermilk"; scans the vocabulary once per token, not the rows
+        bitmap = self.substring_bitmaps.get(token)
+        if bitmap is None:
+            rows = [row for word, row in self.tokens if token in word]
+            bitmap = np.bitwise_or.reduce(self.bitmaps[rows], axis=0) if rows else self.empty()
+            if len(self.substring_bitmaps) < SUBSTRING_CACHE_MAX_SIZE:
+                self.substring_bitmaps[token] = bitmap
+        return bitmap
+
+    def term_bitmap(self, term: str, substring: bool = False) -> np.ndarray:
+        """
+        rows tagged with the term, or containing all of its words in their ingredients/tags.
+        substring=True also matches words that merely contain a term word, used for exclusions (allergens) so they stay
+        at least as strict as the substring filter they replace.
+        """
+        tokens = tokenize(term)
+        if not tokens:
+            # nothing indexable in the term ("ox", "süt"): it restricts nothing as a preference and excludes nothing as an
+            # exclusion, the caller has to scan the text for it (see LocalVectorIndex.unindexed_text_mask)
+            return self.empty() if substring else self.full()
+        bitmap = self.full()
+        for token in tokens:
+            bitmap &= self.token_bitmap(token, substring)
+        tag_row = self.terms.get(f"tag:{' '.join(tokens)}")
+        if tag_row is not None:
+            bitmap |= self.bitmaps[tag_row]
+        return bitmap
+
+    def evaluate(self, must: Iterable[str] = (), must_not: Iterable[str] = (), should: Iterable[str] = ()) -> np.ndarray:
+        """
+        packed bitmap of the rows matching every must term, no must_not term and at least one should term (if any).
+        must_not terms without an indexable word are not applied here, see term_bitmap.
+        """
+        bitmap = self.full()
+        for term in must:
+            bitmap &= self.term_bitmap(term)
+        for term in must_not:
+            bitmap &= ~self.term_bitmap(term, substring=True)
+        should = list(should)
+        if should:
+            any_bitmap = self.empty()
+            for term in should:
+                any_bitmap |= self.term_bitmap(term)
+            bitmap &= any_bitmap
+        return bitmap
+
+    def to_mask(self, bitmap: np.ndarray) -> np.ndarray:
+        return np.unpackbits(bitmap, count=self.n_rows, bitorder="little").view(bool)
+
+    #PERSISTENCE
+    def save(self, index_dir: str) -> None:
+        os.makedirs(index_dir, exist_ok=True)
+        np.save(os.path.join(index_dir, BITMAPS_FILE_NAME), self.bitmaps)
+        with open(os.path.join(index_dir, BITMAP_TERMS_FILE_NAME), "w") as f:
+            json.dump({"n_rows": self.n_rows, "terms": self.terms}, f)
+
+    @staticmethod
+    def exists(index_dir: str) -> bool:
+        return os.path.exists(os.path.join(index_dir, BITMAP_TERMS_FILE_NAME))
+
+    @classmethod
+    def load(cls, index_dir: str, mmap: bool = True) -> "BitmapIndex":
+        with open(os.path.join(index_dir, BITMAP_TERMS_FILE_NAME), "r") as f:
+            meta = json.load(f)
+        bitmaps = np.load(os.path.join(index_dir, BITMAPS_FILE_NAME), mmap_mode="r" if mmap else None)
+        return cls(meta["terms"], bitmaps, meta["n_rows"])
+
+    def stats(self) -> Dict:
+        return {"terms": len(self.terms), "rows": self.n_rows, "bytes": int(self.bitmaps.nbytes)}
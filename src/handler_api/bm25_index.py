@@ -0,0 +1,121 @@
+from src.handler_api.bitmap_index import tokenize
+from typing import List, Dict, Tuple, Hashable, Iterable
+from collections import Counter
+import numpy as np
+import json
+import os
+
+
+BM25_INDPTR_FILE_NAME = "bm25_indptr.npy"
+BM25_ROWS_FILE_NAME = "bm25_rows.npy"
+BM25_WEIGHTS_FILE_NAME = "bm25_weights.npy"
+BM25_TERMS_FILE_NAME = "bm25_terms.json"
+RRF_K = 60 # rank offset of reciprocal rank fusion, the value from the original paper
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[Hashable]], rrf_k: int = RRF_K) -> List[Hashable]:
+    """
+    fuses several best-first rankings: score(item) = sum over rankings of 1 / (rrf_k + rank). returns items best first.
+    """
+    scores: Dict[Hashable, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class BM25Index:
+    """
+    okapi bm25 over the page_content tokens (ingredient words + tags) of a LocalVectorIndex, stored as CSR postings:
+    rows[indptr[t]:indptr[t + 1]] are the rows containing term t, weights[...] their precomputed bm25 term weights
+    (idf * saturated, length-normalized tf). scoring a query is one gather + np.bincount over the postings of its terms.
+    """
+
+    def __init__(self, terms: Dict[str, int], indptr: np.ndarray, rows: np.ndarray, weights: np.ndarray, n_rows: int) -> None:
+        self.terms = terms
+        self.indptr = indptr
+        self.rows = rows
+        self.weights = weights
+        self.n_rows = n_rows
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    @classmethod
+    def from_texts(cls, texts: List[str], k1: float = 1.2, b: float = 0.75) -> "BM25Index":
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        lengths = np.zeros(len(texts), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[row] = len(tokens)
+            for token, tf in Counter(tokens).items():
+                postings.setdefault(token, []).append((row, tf))
+
+        n_rows = len(texts)
+        average_length = float(lengths.mean()) if n_rows else 0.0
+        terms = {term: i for i, term in enumerate(sorted(postings))}
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        rows, weights = [], []
+        for term, i in terms.items():
+            term_rows = np.array([row for row, _ in postings[term]], dtype=np.int32)
+            tf = np.array([tf for _, tf in postings[term]], dtype=np.float32)
+            idf = np.log1p((n_rows - len(term_rows) + 0.5) / (len(term_rows) + 0.5))
+            norm = k1 * (1 - b + b * lengths[term_rows] / (average_length or 1.0))
+            rows.append(term_rows)
+            weights.append((idf * tf * (k1 + 1) / (tf + norm)).astype(np.float32))
+            indptr[i + 1] = indptr[i] + len(term_rows)
+
+        return cls(terms, indptr,
+                   np.concatenate(rows) if rows else np.empty(0, dtype=np.int32),
+                   np.concatenate(weights) if weights else np.empty(0, dtype=np.float32), n_rows)
+
+    @classmethod
+    def from_payloads(cls, payloads: List[Dict]) -> "BM25Index":
+        return cls.from_texts([payload.get("page_content", "") or "" for payload in payloads])
+
+    def scores(self, query: str) -> np.ndarray:
+        term_ids = sorted({self.terms[token] for token in tokenize(query) if token in self.terms})
+        if not term_ids:
+            return np.zeros(self.n_rows, dtype=np.float32)
+        postings = np.concatenate([np.arange(self.indptr[t], self.indptr[t + 1]) for t in term_ids])
+        return np.bincount(self.rows[postings], weights=self.weights[postings], minlength=self.n_rows)
+
+    def search(self, query: str, k: int, mask: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        rows and bm25 scores of the k best matching rows, best first. rows without any query term are never returned.
+        """
+        scores = self.scores(query)
+        if mask is not None:
+            scores = np.where(mask, scores, 0.0)
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return candidates, scores[candidates]
+
+    #PERSISTENCE
+    def save(self, index_dir: str) -> None:
+        os.makedirs(index_dir, exist_ok=True)
+        np.save(os.path.join(index_dir, BM25_INDPTR_FILE_NAME), self.indptr)
+        np.save(os.path.join(index_dir, BM25_ROWS_FILE_NAME), self.rows)
+        np.save(os.path.join(index_dir, BM25_WEIGHTS_FILE_NAME), self.weights)
+        with open(os.path.join(index_dir, BM25_TERMS_FILE_NAME), "w") as f:
+            json.dump({"n_rows": self.n_rows, "terms": self.terms}, f)
+
+    @staticmethod
+    def exists(index_dir: str) -> bool:
+        return os.path.exists(os.path.join(index_dir, BM25_TERMS_FILE_NAME))
+
+    @classmethod
+    def load(cls, index_dir: str, mmap: bool = True) -> "BM25Index":
+        with open(os.path.join(index_dir, BM25_TERMS_FILE_NAME), "r") as f:
+            meta = json.load(f)
+        mmap_mode = "r" if mmap else None
+        return cls(meta["terms"],
+                   np.load(os.path.join(index_dir, BM25_INDPTR_FILE_NAME), mmap_mode=mmap_mode),
+                   np.load(os.path.join(index_dir, BM25_ROWS_FILE_NAME), mmap_mode=mmap_mode),
+                   np.load(os.path.join(index_dir, BM25_WEIGHTS_FILE_NAME), mmap_mode=mmap_mode),
+                   meta["n_rows"])
+
+    def stats(self) -> Dict:
+        return {"terms": len(self.terms), "postings": int(len(self.rows)), "bytes": int(self.rows.nbytes + self.weights.nbytes + self.indptr.nbytes)}
@@ -0,0 +1,68 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+import threading
+import asyncio
+
+
+class BoundedExecutor:
+    """
+    thread pool for CPU-bound work (query embedding, local index searches) called from async endpoints.
+    at most max_workers jobs run at once and at most max_queue more wait for a thread; further callers wait
+    on the event loop (without blocking it) until a slot frees up, so a burst cannot pile up unbounded work.
+    """
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 64, thread_name_prefix: str = "bounded-executor") -> None:
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self.slots: asyncio.Semaphore = None
+        self.submitted = 0 # accepted by the pool, queued or running
+        self.running = 0 # updated by the worker threads, under running_lock
+        self.running_lock = threading.Lock()
+        self.waiting = 0 # waiting for a slot on the event loop
+        self.completed = 0
+        self.peak_queue_depth = 0
+
+    async def run(self, func: Callable, *args: Any) -> Any:
+        if self.slots is None: # created lazily inside the running loop
+            self.slots = asyncio.Semaphore(self.max_workers + self.max_queue)
+
+        self.waiting += 1
+        async with self.slots:
+            self.waiting -= 1
+            self.submitted += 1
+            self.peak_queue_depth = max(self.peak_queue_depth, self.queue_depth())
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self.executor, self.track, func, args)
+            finally:
+                self.submitted -= 1
+                self.completed += 1
+
+    def track(self, func: Callable, args: tuple) -> Any:
+        with self.running_lock:
+            self.running += 1
+        try:
+            return func(*args)
+        finally:
+            with self.running_lock:
+                self.running -= 1
+
+    def running_jobs(self) -> int:
+        with self.running_lock:
+            return self.running
+
+    def queue_depth(self) -> int:
+        return max(self.submitted - self.running_jobs(), 0) + self.waiting
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False)
+
+    def metrics(self) -> Dict:
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "running": self.running_jobs(),
+            "queue_depth": self.queue_depth(),
+            "peak_queue_depth": self.peak_queue_depth,
+            "completed": self.completed,
+        }
@@ -0,0 +1,92 @@
+from typing import Dict
+from collections import deque
+import time
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    tracks the outcomes of calls to an upstream dependency and stops calling it while it is failing or too slow:
+        - closed: calls go through. once at least min_calls of the last `window` calls are known, the breaker opens
+          when the share of failed calls reaches failure_rate_threshold or the share of calls slower than
+          slow_call_seconds reaches slow_call_rate_threshold.
+        - open: calls are rejected immediately for open_seconds, so requests stop queuing behind a dead dependency.
+        - half-open: then up to half_open_calls probe calls go through; they all succeed in time -> closed, any of them
+          fails or is slow -> open again.
+    """
+
+    def __init__(self, window: int = 50, min_calls: int = 10, failure_rate_threshold: float = 0.5, slow_call_seconds: float = 20.0,
+                 slow_call_rate_threshold: float = 0.5, open_seconds: float = 30.0, half_open_calls: int = 2) -> None:
+        self.outcomes = deque(maxlen=window) # (failed, slow) of recent calls while closed
+        self.min_calls = min_calls
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.probes = 0
+        self.probe_successes = 0
+        self.times_opened = 0
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.open_seconds:
+                self.rejected += 1
+                return False
+            self.state = "half_open"
+            self.probes = 0
+            self.probe_successes = 0
+        if self.state == "half_open":
+            if self.probes >= self.half_open_calls:
+                self.rejected += 1
+                return False
+            self.probes += 1
+        return True
+
+    def record(self, success: bool, latency: float) -> None:
+        failed, slow = not success, latency >= self.slow_call_seconds
+        if self.state == "half_open":
+            if failed or slow:
+                self.trip()
+            else:
+                self.probe_successes += 1
+                if self.probe_successes >= self.half_open_calls:
+                    self.state = "closed"
+                    self.outcomes.clear()
+            return
+        if self.state == "open": # a call let through before the breaker opened
+            return
+
+        self.outcomes.append((failed, slow))
+        if len(self.outcomes) >= self.min_calls:
+            failure_rate, slow_rate = self.rates()
+            if failure_rate >= self.failure_rate_threshold or slow_rate >= self.slow_call_rate_threshold:
+                self.trip()
+
+    def trip(self) -> None:
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        self.outcomes.clear()
+
+    def rates(self) -> tuple:
+        if not self.outcomes:
+            return 0.0, 0.0
+        return (sum(failed for failed, _ in self.outcomes) / len(self.outcomes),
+                sum(slow for _, slow in self.outcomes) / len(self.outcomes))
+
+    def metrics(self) -> Dict:
+        failure_rate, slow_rate = self.rates()
+        return {
+            "state": self.state,
+            "failure_rate": failure_rate,
+            "slow_call_rate": slow_rate,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
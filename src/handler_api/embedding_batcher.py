@@ -0,0 +1,96 @@
+from src.handler_api.bounded_executor import BoundedExecutor
+from typing import List, Dict, Any, Tuple
+from collections import Counter
+import asyncio
+
+
+class EmbeddingBatcher:
+    """
+    micro-batching scheduler for query embeddings, shared by all concurrent requests of a worker.
+    callers await embed_query; texts arriving within window_ms of the first waiting one (or until max_batch_size
+    texts are waiting) are embedded together in one embed_documents call on the bounded executor, then every caller's future is resolved.
+    """
+
+    def __init__(self, embedder: Any, window_ms: float = 3.0, max_batch_size: int = 32, executor: BoundedExecutor = None) -> None:
+        self.embedder = embedder
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.executor = executor or BoundedExecutor(max_workers=1, thread_name_prefix="query-embedder")
+        self.queue: asyncio.Queue = None
+        self.worker: asyncio.Task = None
+        self.batch_sizes = Counter() # batch size -> number of model calls with that size
+        self.texts_embedded = 0
+
+    def ensure_started(self) -> None:
+        # the queue and the worker task have to live in the running event loop, so they are created lazily
+        if self.worker is None or self.worker.done():
+            self.queue = asyncio.Queue()
+            self.worker = asyncio.get_running_loop().create_task(self.run())
+
+    async def embed_query(self, text: str) -> List[float]:
+        self.ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((text, future))
+        return await future
+
+    async def collect_batch(self) -> List[Tuple[str, asyncio.Future]]:
+        """
+        waits for the first text, then keeps collecting until the window closes or the batch is full.
+        """
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def run(self) -> None:
+        while True:
+            batch = await self.collect_batch()
+            texts = [text for text, _ in batch]
+            try:
+                vectors = await self.executor.run(self.embedder.embed_documents, texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batch_sizes[len(batch)] += 1
+            self.texts_embedded += len(batch)
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done(): # the caller may have been cancelled while waiting
+                    future.set_result(vector)
+
+    async def close(self) -> None:
+        if self.worker is not None:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+            self.worker = None
+
+    def metrics(self) -> Dict:
+        """
+        batch-size distribution of the model calls made so far.
+        """
+        calls = sum(self.batch_sizes.values())
+        return {
+            "window_ms": self.window * 1000.0,
+            "max_batch_size": self.max_batch_size,
+            "model_calls": calls,
+            "texts_embedded": self.texts_embedded,
+            "mean_batch_size": self.texts_embedded / calls if calls else 0.0,
+            "batch_size_distribution": dict(sorted(self.batch_sizes.items())),
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+        }
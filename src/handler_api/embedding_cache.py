@@ -0,0 +1,84 @@
+from typing import List, Dict, Union
+from collections import OrderedDict
+import time
+
+
+TAGS_MARKER = "\nrecipe_tags_formatted"
+
+
+def normalize_terms(terms: List[str]) -> List[str]:
+    """
+    lower-cases, trims, drops empty items and duplicates, then sorts, so ordering and casing do not matter.
+    """
+    return sorted({term.strip().lower() for term in terms if term and term.strip()})
+
+
+def build_query(ingredients: List[str], tags: List[str]) -> str:
+    """
+    canonical form of the query string main_api.get_recipe sends to the retriever.
+    """
+    return f"{'|'.join(normalize_terms(ingredients))}{TAGS_MARKER}{'|'.join(normalize_terms(tags))}"
+
+
+def canonicalize_query(query: str) -> str:
+    """
+    parses a query built like "ingredient|ingredient\\nrecipe_tags_formatted tag|tag" and rebuilds it in canonical form.
+    queries without the tags marker are treated as a plain "|" separated ingredient list.
+    """
+    ingredients_text, _, tags_text = query.partition(TAGS_MARKER)
+    tags_text = tags_text[1:] if tags_text.startswith(":") else tags_text
+    return build_query(ingredients_text.split("|"), tags_text.split("|"))
+
+
+class EmbeddingCache:
+    """
+    bounded LRU cache for query embeddings with an optional time-to-live.
+    keys are canonical query strings (see canonicalize_query), so "Chicken|rice" and "rice| chicken" share one entry.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: Union[float, None] = None) -> None:
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds or None # 0 disables expiry as well
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict() # key -> (stored_at, vector)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: str) -> Union[List[float], None]:
+        entry = self.entries.get(key)
+        if entry is not None and self.ttl_seconds is not None and time.monotonic() - entry[0] > self.ttl_seconds:
+            del self.entries[key] # expired
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: str, vector: List[float]) -> None:
+        self.entries[key] = (time.monotonic(), vector)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def metrics(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
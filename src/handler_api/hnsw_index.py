@@ -0,0 +1,331 @@
+from typing import List, Tuple, Union, Dict
+import numpy as np
+import heapq
+import json
+import math
+import os
+
+
+HNSW_META_FILE_NAME = "hnsw_meta.json"
+HNSW_LEVELS_FILE_NAME = "hnsw_levels.npy"
+HNSW_LEVEL0_FILE_NAME = "hnsw_level0.npy"
+HNSW_UPPER_FILE_NAME = "hnsw_upper.npy"
+HNSW_UPPER_OFFSETS_FILE_NAME = "hnsw_upper_offsets.npy"
+HNSW_DELETED_FILE_NAME = "hnsw_deleted.npy"
+HNSW_VECTORS_FILE_NAME = "hnsw_vectors.npy"
+FILTERED_EXPANSION_SLACK = 2 # a filtered search expands at most slack * ef / allowed fraction nodes
+
+
+class HNSWIndex:
+    """
+    hierarchical navigable small world graph over L2-normalized vectors (distance = 1 - dot product).
+
+    on-disk layout, every array is a plain .npy file so a read-only index can be opened with mmap
+    and shared by all uvicorn workers through the page cache:
+        - hnsw_levels.npy        (n,)            top layer of every node
+        - hnsw_level0.npy        (n, 2*M)        layer-0 neighbours, -1 padded
+        - hnsw_upper.npy         (rows, M)       neighbours on layers >= 1, one row per (node, layer)
+        - hnsw_upper_offsets.npy (n,)            first row of the node in hnsw_upper.npy, -1 for layer-0-only nodes
+        - hnsw_deleted.npy       (n,)            tombstones, see mark_deleted
+        - hnsw_meta.json                         M, ef_construction, ef_search, entry point
+    the vectors themselves are not duplicated, the owner (LocalVectorIndex) passes its matrix in. a graph with tombstones
+    also saves hnsw_vectors.npy (n, dim), the owner only keeps the vectors of the live nodes.
+    """
+
+    def __init__(self, dim: int, M: int = 16, ef_construction: int = 200, ef_search: int = 64, seed: int = 42) -> None:
+        self.dim = dim
+        self.M = M
+        self.max_M0 = 2 * M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.level_mult = 1 / math.log(M)
+        self.rng = np.random.default_rng(seed)
+
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+        self.levels: List[int] = []
+        self.links: List[List[List[int]]] = [] # links[node][layer] -> neighbour list, used while building
+        self.deleted = np.zeros(0, dtype=bool) # tombstones: still walked through, never returned
+        self.n_deleted = 0
+        self.entry_point = -1
+        self.max_level = -1
+        self.read_only = False
+        # packed arrays, set when the index is opened read-only
+        self.level0 = None
+        self.upper = None
+        self.upper_offsets = None
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    #GRAPH ACCESS
+    def neighbours(self, node: int, layer: int) -> np.ndarray:
+        if not self.read_only:
+            return np.asarray(self.links[node][layer], dtype=np.int64)
+        if layer == 0:
+            row = self.level0[node]
+        else:
+            row = self.upper[self.upper_offsets[node] + layer - 1]
+        return row[row >= 0]
+
+    #SEARCH
+    def search_layer(self, query: np.ndarray, entry_points: List[int], ef: int, layer: int, mask: np.ndarray = None,
+                     max_expansions: int = None) -> List[Tuple[float, int]]:
+        """
+        best-first search on one layer, returns up to ef (distance, node) pairs sorted by distance.
+        when a mask is given the graph is still traversed through every node, but only allowed nodes enter the result set.
+        max_expansions stops the walk early, the result set may then hold fewer than ef nodes.
+        """
+        visited = set(entry_points)
+        candidates = []
+        results = [] # max-heap on distance via negation
+        for node in entry_points:
+            distance = 1.0 - float(self.vectors[node] @ query)
+            heapq.heappush(candidates, (distance, node))
+            if mask is None or mask[node]:
+                heapq.heappush(results, (-distance, node))
+
+        expansions = 0
+        while candidates:
+            distance, node = heapq.heappop(candidates)
+            if len(results) >= ef and distance > -results[0][0]:
+                break
+            if max_expansions is not None and expansions >= max_expansions:
+                break
+            expansions += 1
+
+            neighbours = [n for n in self.neighbours(node, layer).tolist() if n not in visited]
+            if not neighbours:
+                continue
+            visited.update(neighbours)
+            distances = 1.0 - self.vectors[neighbours] @ query # one vectorized product per expansion
+
+            for neighbour, neighbour_distance in zip(neighbours, distances.tolist()):
+                if len(results) < ef or neighbour_distance < -results[0][0]:
+                    heapq.heappush(candidates, (neighbour_distance, neighbour))
+                    if mask is None or mask[neighbour]:
+                        heapq.heappush(results, (-neighbour_distance, neighbour))
+                        if len(results) > ef:
+                            heapq.heappop(results)
+
+        return sorted((-d, n) for d, n in results)
+
+    def greedy_descend(self, query: np.ndarray, target_level: int) -> int:
+        """
+        walks the upper layers with ef=1 down to target_level + 1 and returns the closest node found.
+        """
+        entry = self.entry_point
+        for layer in range(self.max_level, target_level, -1):
+            entry = self.search_layer(query, [entry], 1, layer)[0][1]
+        return entry
+
+    def search(self, query: Union[np.ndarray, List[float]], k: int, ef: int = None, mask: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        approximate k nearest neighbours of a normalized query.
+        returns node ids and cosine scores, best first.
+        a filtered search fills its result set about once every 1 / allowed fraction expansions, so it is capped at
+        FILTERED_EXPANSION_SLACK * ef / allowed fraction expansions instead of walking the whole graph when the allowed
+        nodes are far from the query. it can then return fewer than k nodes, the caller should fall back to an exact scan.
+        tombstoned nodes are left out like nodes outside the mask.
+        """
+        if len(self) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        query = np.asarray(query, dtype=np.float32)
+        ef = max(ef or self.ef_search, k)
+        if self.n_deleted:
+            mask = ~self.deleted if mask is None else mask & ~self.deleted
+        entry = self.greedy_descend(query, 0)
+        max_expansions = None
+        if mask is not None:
+            allowed = int(np.count_nonzero(mask))
+            if allowed == 0:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            max_expansions = math.ceil(FILTERED_EXPANSION_SLACK * ef * len(self) / allowed)
+        found = self.search_layer(query, [entry], ef, 0, mask, max_expansions)[:k]
+        nodes = np.array([node for _, node in found], dtype=np.int64)
+        scores = np.array([1.0 - distance for distance, _ in found], dtype=np.float32)
+        return nodes, scores
+
+    def exact_search(self, query: Union[np.ndarray, List[float]], k: int) -> np.ndarray:
+        scores = self.vectors @ np.asarray(query, dtype=np.float32)
+        if self.n_deleted:
+            scores[self.deleted] = -np.inf
+        k = min(k, len(scores) - self.n_deleted)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        rows = np.argpartition(-scores, k - 1)[:k]
+        return rows[np.argsort(-scores[rows])]
+
+    def recall(self, queries: np.ndarray, k: int = 10, ef: int = None) -> float:
+        """
+        fraction of the exact top-k that the graph search returns, averaged over the queries.
+        use it to pick ef_search per deployment: higher ef -> better recall, slower search.
+        """
+        hits = 0
+        for query in np.asarray(queries, dtype=np.float32):
+            approximate, _ = self.search(query, k, ef=ef)
+            hits += len(np.intersect1d(approximate, self.exact_search(query, k)))
+        return hits / float(len(queries) * k)
+
+    #CONSTRUCTION
+    def random_level(self) -> int:
+        return int(-math.log(1.0 - self.rng.random()) * self.level_mult)
+
+    def select_neighbours(self, candidates: List[Tuple[float, int]], max_links: int) -> List[int]:
+        """
+        keeps the closest candidates that are not closer to an already selected neighbour than to the base node
+        (the hnsw paper heuristic), then tops the list up with the remaining closest ones.
+        """
+        selected, skipped = [], []
+        for distance, node in candidates:
+            if len(selected) >= max_links:
+                break
+            if selected and np.max(self.vectors[selected] @ self.vectors[node]) > 1.0 - distance:
+                skipped.append(node)
+            else:
+                selected.append(node)
+        return selected + skipped[:max_links - len(selected)]
+
+    def shrink(self, node: int, layer: int) -> None:
+        max_links = self.max_M0 if layer == 0 else self.M
+        links = self.links[node][layer]
+        if len(links) <= max_links:
+            return
+        distances = 1.0 - self.vectors[links] @ self.vectors[node]
+        ordered = sorted(zip(distances.tolist(), links))
+        self.links[node][layer] = self.select_neighbours(ordered, max_links)
+
+    def insert(self, node: int) -> None:
+        query = self.vectors[node]
+        level = self.random_level()
+        self.levels.append(level)
+        self.links.append([[] for _ in range(level + 1)])
+
+        if self.entry_point < 0:
+            self.entry_point, self.max_level = node, level
+            return
+
+        entry = self.greedy_descend(query, level)
+        entry_points = [entry]
+        for layer in range(min(level, self.max_level), -1, -1):
+            candidates = self.search_layer(query, entry_points, self.ef_construction, layer)
+            neighbours = self.select_neighbours(candidates, self.M)
+            self.links[node][layer] = neighbours
+            for neighbour in neighbours:
+                self.links[neighbour][layer].append(node)
+                self.shrink(neighbour, layer)
+            entry_points = [n for _, n in candidates]
+
+        if level > self.max_level:
+            self.entry_point, self.max_level = node, level
+
+    def add_items(self, vectors: np.ndarray) -> None:
+        """
+        incrementally inserts normalized vectors, node ids continue from the current size.
+        """
+        if self.read_only:
+            raise ValueError("index was opened read-only, load it with mmap=False to add items")
+
+        start = len(self)
+        self.vectors = np.ascontiguousarray(np.vstack([self.vectors, np.asarray(vectors, dtype=np.float32)]))
+        self.deleted = np.concatenate([self.deleted, np.zeros(len(self) - start, dtype=bool)])
+        for node in range(start, len(self)):
+            self.insert(node)
+
+    def mark_deleted(self, nodes: List[int]) -> None:
+        """
+        tombstones nodes instead of unlinking them: searches still walk through them, so the graph stays connected,
+        but never return them. changed vectors are tombstoned and inserted again as new nodes; the owner rebuilds the
+        graph once the tombstones make up too much of it.
+        """
+        if self.read_only:
+            raise ValueError("index was opened read-only, load it with mmap=False to delete items")
+        self.deleted[np.asarray(nodes, dtype=np.int64)] = True
+        self.n_deleted = int(np.count_nonzero(self.deleted))
+
+    #PERSISTENCE
+    def save(self, index_dir: str) -> None:
+        """
+        packs the graph into fixed-width arrays, the vectors are saved by the owner.
+        """
+        os.makedirs(index_dir, exist_ok=True)
+        n = len(self)
+        levels = np.asarray(self.levels, dtype=np.int8)
+        level0 = np.full((n, self.max_M0), -1, dtype=np.int32)
+        upper_offsets = np.full(n, -1, dtype=np.int64)
+        upper_rows = int(np.sum(levels)) if n else 0
+        upper = np.full((upper_rows, self.M), -1, dtype=np.int32)
+
+        row = 0
+        for node in range(n):
+            links = self.neighbours(node, 0)
+            level0[node, :len(links)] = links
+            if levels[node] > 0:
+                upper_offsets[node] = row
+                for layer in range(1, int(levels[node]) + 1):
+                    links = self.neighbours(node, layer)
+                    upper[row, :len(links)] = links
+                    row += 1
+
+        np.save(os.path.join(index_dir, HNSW_LEVELS_FILE_NAME), levels)
+        np.save(os.path.join(index_dir, HNSW_LEVEL0_FILE_NAME), level0)
+        np.save(os.path.join(index_dir, HNSW_UPPER_FILE_NAME), upper)
+        np.save(os.path.join(index_dir, HNSW_UPPER_OFFSETS_FILE_NAME), upper_offsets)
+        np.save(os.path.join(index_dir, HNSW_DELETED_FILE_NAME), self.deleted)
+        vectors_path = os.path.join(index_dir, HNSW_VECTORS_FILE_NAME)
+        if self.n_deleted:
+            np.save(vectors_path, np.ascontiguousarray(self.vectors, dtype=np.float32))
+        elif os.path.exists(vectors_path): # left over from before the last compaction
+            os.remove(vectors_path)
+        with open(os.path.join(index_dir, HNSW_META_FILE_NAME), "w") as f:
+            json.dump({"dim": self.dim, "M": self.M, "ef_construction": self.ef_construction, "ef_search": self.ef_search,
+                       "entry_point": int(self.entry_point), "max_level": int(self.max_level), "count": n}, f)
+
+    @staticmethod
+    def exists(index_dir: str) -> bool:
+        return os.path.exists(os.path.join(index_dir, HNSW_META_FILE_NAME))
+
+    @classmethod
+    def load(cls, index_dir: str, vectors: np.ndarray, mmap: bool = True, ef_search: int = None) -> "HNSWIndex":
+        """
+        mmap=True opens the graph read-only and memory-mapped, which is what the retriever pipelines want.
+        mmap=False unpacks it into lists so more items can be added.
+        a graph saved with tombstones reads its own vectors file, the given vectors are then those of the live nodes.
+        """
+        with open(os.path.join(index_dir, HNSW_META_FILE_NAME), "r") as f:
+            meta = json.load(f)
+        mmap_mode = "r" if mmap else None
+        vectors_path = os.path.join(index_dir, HNSW_VECTORS_FILE_NAME)
+        if os.path.exists(vectors_path):
+            vectors = np.load(vectors_path, mmap_mode=mmap_mode)
+        if meta["count"] != len(vectors):
+            raise ValueError(f"hnsw graph has {meta['count']} nodes but {len(vectors)} vectors were given")
+
+        index = cls(meta["dim"], M=meta["M"], ef_construction=meta["ef_construction"], ef_search=ef_search or meta["ef_search"])
+        index.vectors = vectors
+        index.entry_point = meta["entry_point"]
+        index.max_level = meta["max_level"]
+
+        index.levels = np.load(os.path.join(index_dir, HNSW_LEVELS_FILE_NAME), mmap_mode=mmap_mode)
+        index.level0 = np.load(os.path.join(index_dir, HNSW_LEVEL0_FILE_NAME), mmap_mode=mmap_mode)
+        index.upper = np.load(os.path.join(index_dir, HNSW_UPPER_FILE_NAME), mmap_mode=mmap_mode)
+        index.upper_offsets = np.load(os.path.join(index_dir, HNSW_UPPER_OFFSETS_FILE_NAME), mmap_mode=mmap_mode)
+        deleted_path = os.path.join(index_dir, HNSW_DELETED_FILE_NAME)
+        # graphs saved before tombstones existed have none
+        index.deleted = np.load(deleted_path) if os.path.exists(deleted_path) else np.zeros(len(vectors), dtype=bool)
+        index.n_deleted = int(np.count_nonzero(index.deleted))
+        index.read_only = True
+
+        if not mmap:
+            # unpack into mutable lists for incremental construction
+            index.links = [[index.neighbours(node, layer).tolist() for layer in range(int(index.levels[node]) + 1)]
+                           for node in range(len(vectors))]
+            index.levels = [int(level) for level in index.levels]
+            index.vectors = np.array(vectors, dtype=np.float32)
+            index.level0 = index.upper = index.upper_offsets = None
+            index.read_only = False
+        return index
+
+    def stats(self) -> Dict:
+        return {"count": len(self), "deleted": self.n_deleted, "M": self.M, "ef_construction": self.ef_construction, "ef_search": self.ef_search,
+                "max_level": int(self.max_level), "read_only": self.read_only}
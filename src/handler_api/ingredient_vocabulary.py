@@ -0,0 +1,222 @@
+from src.handler_api.bitmap_index import normalize_token
+from src.handler_api.recipe_models import parse_payload_field
+from typing import List, Dict, Iterable, Tuple
+import numpy as np
+import json
+import re
+import os
+
+
+INGREDIENT_IDS_FILE_NAME = "ingredient_ids.npy"
+INGREDIENT_OFFSETS_FILE_NAME = "ingredient_offsets.npy"
+
+UNITS = {
+    "cup", "tablespoon", "tbsp", "tbs", "teaspoon", "tsp", "ounce", "oz", "pound", "lb", "gram", "kg", "ml", "liter",
+    "litre", "pint", "quart", "gallon", "stick", "can", "package", "pkg", "jar", "bottle", "bag", "box", "slice",
+    "piece", "clove", "sprig", "bunch", "head", "pinch", "dash", "handful", "splash", "drizzle", "container", "tub",
+    "envelope", "sheet", "strip", "cube", "scoop", "leave", "leaf", "stalk", "round", "heaping", "level",
+}
+DESCRIPTORS = {
+    "chopped", "minced", "diced", "sliced", "grated", "shredded", "torn", "beaten", "toasted", "fresh", "freshly",
+    "ground", "large", "small", "medium", "unsalted", "salted", "kosher", "coarse", "coarsely", "fine", "finely",
+    "extra", "virgin", "all", "purpose", "boneless", "skinless", "ripe", "vine", "store", "bought", "prepared",
+    "packed", "whole", "halved", "peeled", "seeded", "crushed", "drained", "rinsed", "cubed", "melted", "softened",
+    "cold", "warm", "hot", "room", "temperature", "thinly", "thick", "thin", "inch", "roughly", "cooked", "uncooked",
+    "frozen", "thawed", "canned", "dried", "bulk", "grade", "baby", "good", "quality", "lightly", "well", "trimmed",
+    "plain", "pure", "organic", "homemade", "storebought", "skinned", "pitted", "split",
+}
+STOPWORDS = {
+    "a", "an", "the", "of", "about", "to", "from", "for", "with", "into", "plus", "more", "than", "no", "at", "in",
+    "your", "each", "such", "as", "needed", "optional", "recommended", "available", "market", "if", "desired", "taste",
+    "garnish", "serving", "frying", "some", "few", "little", "additional", "other", "any", "like", "cut", "very",
+    "one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten", "eleven", "twelve", "dozen", "half",
+    "quarter",
+}
+IGNORED_WORDS = UNITS | DESCRIPTORS | STOPWORDS
+WORD_PATTERN = re.compile(r"[a-z]+")
+PARENTHESES_PATTERN = re.compile(r"\([^)]*\)")
+ALTERNATIVES_PATTERN = re.compile(r"\b(?:or|and)\b|/|&")
+MAX_NAME_WORDS = 2 # keep the head of the name: "green bell pepper" -> "bell pepper"
+
+
+def canonicalize_ingredient(line: str) -> List[str]:
+    """
+    canonical ingredient names in one recipe line, e.g.
+        "1 1/2 sticks (12 tablespoons) unsalted butter" -> ["butter"]
+        "1 tablespoon minced shallots or red onion"     -> ["shallot", "red onion"]
+    drops quantities, units, preparation words and everything after the first comma, singularizes the rest
+    and keeps the last MAX_NAME_WORDS words of every alternative. returns [] for lines with nothing left.
+    """
+    text = PARENTHESES_PATTERN.sub(" ", line.lower())
+    text = re.split(r",|;|:| – | - ", text, maxsplit=1)[0]
+    names = []
+    for alternative in ALTERNATIVES_PATTERN.split(text):
+        words = [normalize_token(word) for word in WORD_PATTERN.findall(alternative)]
+        words = [word for word in words if word not in IGNORED_WORDS and len(word) > 1]
+        if words:
+            name = " ".join(words[-MAX_NAME_WORDS:])
+            if name not in names:
+                names.append(name)
+    return names
+
+
+class IngredientVocabulary:
+    """
+    corpus-wide, append-only mapping from canonical ingredient names to integer ids, built at ingestion time.
+    ids never change once assigned, so ids stored in existing payloads stay valid while new files grow the vocabulary.
+    the query side maps user input to the same ids (query_ids), downstream code then compares small int sets.
+    tokens are the raw ingredient/tag words of the corpus (the recipe_tokens payload field), kept to expand allergens.
+    """
+
+    def __init__(self, names: List[str] = None, tokens: Iterable[str] = None) -> None:
+        self.names: List[str] = []
+        self.ids: Dict[str, int] = {}
+        self.word_ids: Dict[str, set] = {} # word -> ids of the names containing it
+        self.tokens = set(tokens or [])
+        for name in names or []:
+            self.add(name)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add(self, name: str) -> int:
+        ingredient_id = self.ids.get(name)
+        if ingredient_id is None:
+            ingredient_id = self.ids[name] = len(self.names)
+            self.names.append(name)
+            for word in name.split():
+                self.word_ids.setdefault(word, set()).add(ingredient_id)
+        return ingredient_id
+
+    def line_ids(self, line: str, grow: bool = True) -> List[int]:
+        names = canonicalize_ingredient(line)
+        if grow:
+            return [self.add(name) for name in names]
+        return [self.ids[name] for name in names if name in self.ids]
+
+    def recipe_ids(self, lines: Iterable[str], grow: bool = True) -> List[List[int]]:
+        """
+        ids per ingredient line, aligned with the lines (a line can name alternatives, hence a list per line).
+        """
+        return [self.line_ids(str(line), grow) for line in lines]
+
+    def query_ids(self, terms: Iterable[str]) -> set:
+        """
+        ids the user's ingredients (or allergens) cover: the exact canonical name, plus every name containing all of
+        its words, so "chicken" covers "chicken breast" and "pepper" covers "bell pepper".
+        """
+        ids = set()
+        for term in terms:
+            for name in canonicalize_ingredient(term):
+                if name in self.ids:
+                    ids.add(self.ids[name])
+                word_sets = [self.word_ids.get(word, set()) for word in name.split()]
+                if word_sets:
+                    ids.update(set.intersection(*word_sets))
+        return ids
+
+    def unknown_terms(self, terms: Iterable[str]) -> List[str]:
+        """
+        the terms no id here covers.
+        """
+        return [term for term in terms if term.strip() and not self.query_ids([term])]
+
+    def text_covered_lines(self, terms: Iterable[str], lines: List[str], line_ids: List[List[int]]) -> List[bool]:
+        """
+        per recipe line, whether one of the user's terms appears in its text where ids cannot decide: terms without an
+        id here (missing or older vocabulary file) are looked up in every line, all terms in lines carrying ids this
+        vocabulary has not seen yet (assigned by a later ingestion).
+        """
+        terms = [term.strip().lower() for term in terms if term.strip()]
+        unknown = self.unknown_terms(terms)
+        covered = []
+        for line, ids in zip(lines, line_ids):
+            candidates = terms if any(i >= len(self) for i in ids) else unknown
+            text = str(line).lower()
+            covered.append(any(term in text for term in candidates))
+        return covered
+
+    def matching_tokens(self, token: str) -> List[str]:
+        """
+        every corpus token containing the token, e.g. "milk" -> "buttermilk", so keyword exclusions stay as strict as the
+        substring text match they replace.
+        """
+        return sorted({word for word in self.tokens if token in word} | {token})
+
+    #PERSISTENCE
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"names": self.names, "tokens": sorted(self.tokens)}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> "IngredientVocabulary":
+        with open(path, "r") as f:
+            data = json.load(f)
+        if isinstance(data, list): # files written before tokens were kept
+            return cls(data)
+        return cls(data["names"], data["tokens"])
+
+    @classmethod
+    def load_or_create(cls, path: str) -> "IngredientVocabulary":
+        return cls.load(path) if os.path.exists(path) else cls()
+
+
+class IngredientSets:
+    """
+    the distinct ingredient ids of every row of a LocalVectorIndex in CSR form:
+    ids[offsets[row]:offsets[row + 1]] is the sorted int32 id set of the row.
+    """
+
+    def __init__(self, ids: np.ndarray, offsets: np.ndarray) -> None:
+        self.ids = ids
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def row(self, row: int) -> np.ndarray:
+        return self.ids[self.offsets[row]:self.offsets[row + 1]]
+
+    def gather(self, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        id sets of the given rows in flat form: (concatenated ids, per-row lengths), without a python loop.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        starts = self.offsets[rows]
+        lengths = self.offsets[rows + 1] - starts
+        flat = np.arange(int(lengths.sum())) + np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return np.asarray(self.ids[flat]), lengths
+
+    @staticmethod
+    def flatten(id_sets: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        lengths = np.array([len(ids) for ids in id_sets], dtype=np.int64)
+        return (np.concatenate(id_sets) if id_sets else np.empty(0, dtype=np.int32)), lengths
+
+    @staticmethod
+    def payload_ids(payload: Dict) -> np.ndarray:
+        metadata = payload.get("metadata") or {}
+        per_line = parse_payload_field(metadata.get("recipe_ingredient_ids"), list)
+        return np.unique(np.fromiter((i for line in per_line for i in line), dtype=np.int32))
+
+    @classmethod
+    def from_payloads(cls, payloads: List[Dict]) -> "IngredientSets":
+        rows = [cls.payload_ids(payload) for payload in payloads]
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum([len(row) for row in rows], out=offsets[1:])
+        ids = np.concatenate(rows) if rows else np.empty(0, dtype=np.int32)
+        return cls(ids.astype(np.int32), offsets)
+
+    def save(self, index_dir: str) -> None:
+        np.save(os.path.join(index_dir, INGREDIENT_IDS_FILE_NAME), self.ids)
+        np.save(os.path.join(index_dir, INGREDIENT_OFFSETS_FILE_NAME), self.offsets)
+
+    @staticmethod
+    def exists(index_dir: str) -> bool:
+        return os.path.exists(os.path.join(index_dir, INGREDIENT_OFFSETS_FILE_NAME))
+
+    @classmethod
+    def load(cls, index_dir: str, mmap: bool = True) -> "IngredientSets":
+        mmap_mode = "r" if mmap else None
+        return cls(np.load(os.path.join(index_dir, INGREDIENT_IDS_FILE_NAME), mmap_mode=mmap_mode),
+                   np.load(os.path.join(index_dir, INGREDIENT_OFFSETS_FILE_NAME), mmap_mode=mmap_mode))
@@ -0,0 +1,316 @@
+from src.logger import AppLogger
+from src.constants import pipeline_constants
+from src.handler_api.request_hedger import RequestHedger, Deadline
+from src.handler_api.circuit_breaker import CircuitBreaker, CircuitOpenError
+from src.handler_api.prompt_builder import prompt_builder
+from dotenv import load_dotenv
+from typing import Dict, List, Union, AsyncIterator
+import openai
+import asyncio
+import logging
+import httpx
+import orjson
+import time
+import os
+
+
+app_logger = AppLogger("LLMHandler")
+
+load_dotenv(override=True)
+openai_api_key = os.getenv("OPENAI_API_KEY")
+openai.api_key = openai_api_key
+# point this at a local stub server (src/handler_api/stub_llm_server.py) to run without the real API
+openai_base_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+
+instruction_prompt = """
+you are an helpful assistant that will format and translate the recipes provided to you as JSON. given the recipes, your strict- final format should be a JSON object:
+ {"recipe_name":str,
+    "recipe_ingredients":List[str],
+    "recipe_directions":List[str],
+    "recipe_details":{"Prep_time":str, "CookTime":str, "TotalTime":str, "Servings":str},
+    "recipe_nutrition_details":{"Calories":str,"Total Fat":str,"Carbohydrates":str,"Protein":str}}
+  1- "recipe_details" and "recipe_nutrition_details" are usually given in the final format already: keep their keys and numbers as they are. Only if they are given as raw text, extract the values from it, leave out the values it does not state, never make them up.
+  2- you 'have to' satisfy the datatypes specified for each key-value pair! "recipe_ingredients" must keep exactly one item per input ingredient, in the same order.
+  3- then you will translate this recipe to 'target' language." Keep the top-level keys above in english, translate the keys inside "recipe_details" and "recipe_nutrition_details" and 'all the values', use a natural kitchen language.
+  4- provide only the translated recipe as a single JSON object. dont add any additional text since it will be used in production.
+  YOU HAVE TO SATISFY ALL 4 CONDITION. STEP BACK AND EVALUATE YOUR RESULT, ITS CRUCIAL.
+"""
+
+# fallback for shopping lists when the formatted ingredient list does not line up with the stored one
+item_translation_prompt = """
+translate every ingredient line of the JSON list provided to you to the 'target' language, use a natural kitchen language.
+answer only with a JSON object {"items": List[str]} holding exactly one translated line per input line, in the same order.
+"""
+
+
+def build_instruction(country: str) -> str:
+    """
+    system message for formatting + translating a recipe into the language of the given country.
+    """
+    return instruction_prompt+"\nTRANSLATION LANGUAGE: "+country+"\n"
+
+
+def prompt_templates() -> List[str]:
+    """
+    every template that shapes a cached LLM answer, the translation cache is keyed on their hash.
+    """
+    return [instruction_prompt, build_instruction("{country}"), item_translation_prompt, prompt_builder.template_signature()]
+
+
+url = f"{openai_base_url}/chat/completions"
+
+headers = {
+    'Authorization': f'Bearer {openai_api_key}',
+    'Content-Type': 'application/json',}
+
+
+class LLMClient:
+    """
+    application-scoped, pooled http client for the chat completions API.
+    one httpx.AsyncClient is created per process (FastAPI lifespan hook) and reused by every call, so TCP/TLS setup
+    is paid once per connection instead of once per request. connections are kept alive and multiplexed over HTTP/2.
+    httpx timeouts are per phase (connect / read / write / pool), the total budget is enforced around the whole call.
+    """
+
+    def __init__(self, max_connections: int = pipeline_constants.LLM_MAX_CONNECTIONS,
+                 max_keepalive_connections: int = pipeline_constants.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                 keepalive_expiry: float = pipeline_constants.LLM_KEEPALIVE_EXPIRY_SECONDS,
+                 connect_timeout: float = pipeline_constants.LLM_CONNECT_TIMEOUT_SECONDS,
+                 read_timeout: float = pipeline_constants.LLM_READ_TIMEOUT_SECONDS,
+                 total_timeout: float = pipeline_constants.LLM_TOTAL_TIMEOUT_SECONDS,
+                 http2: bool = pipeline_constants.LLM_HTTP2) -> None:
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections,
+                                   keepalive_expiry=keepalive_expiry)
+        self.timeout = httpx.Timeout(connect=connect_timeout, read=read_timeout, write=connect_timeout, pool=connect_timeout)
+        self.total_timeout = total_timeout
+        self.http2 = http2
+        self.client: httpx.AsyncClient = None
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.errors = 0
+
+    async def start(self) -> None:
+        if self.client is not None:
+            return
+        try:
+            self.client = httpx.AsyncClient(http2=self.http2, limits=self.limits, timeout=self.timeout, headers=headers)
+        except ImportError: # http2 needs the h2 package (httpx[http2])
+            app_logger.handle_logging("h2 is not installed, falling back to HTTP/1.1 keep-alive", logging.WARNING)
+            self.http2 = False
+            self.client = httpx.AsyncClient(http2=False, limits=self.limits, timeout=self.timeout, headers=headers)
+
+    async def close(self) -> None:
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def call_timeout(self, total_timeout: float = None) -> float:
+        """
+        the budget of one call: total_timeout when given (an exhausted 0 included), the client default otherwise.
+        a call without budget left fails at once instead of being sent.
+        """
+        timeout = self.total_timeout if total_timeout is None else total_timeout
+        if timeout <= 0:
+            raise asyncio.TimeoutError("no time left for the LLM call")
+        return timeout
+
+    async def post(self, payload: Dict, total_timeout: float = None) -> httpx.Response:
+        timeout = self.call_timeout(total_timeout)
+        await self.start() # lazily, for scripts that run without the lifespan hook
+        self.requests += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            return await asyncio.wait_for(self.client.post(url, content=orjson.dumps(payload)), timeout=timeout)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    async def stream(self, payload: Dict, total_timeout: float = None) -> AsyncIterator[str]:
+        """
+        posts the payload in streaming mode and yields the content deltas as they arrive (server-sent events).
+        every read waits at most for what is left of total_timeout, so a stream that stalls mid-response is cut off in time.
+        """
+        deadline = Deadline(self.call_timeout(total_timeout))
+        await self.start()
+        self.requests += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            # the wait for the response headers is bound by the read timeout of this request
+            timeout = httpx.Timeout(self.timeout.connect, read=min(self.timeout.read, deadline.remaining()), write=self.timeout.write, pool=self.timeout.pool)
+            async with self.client.stream("POST", url, content=orjson.dumps({**payload, "stream": True}), timeout=timeout) as response:
+                response.raise_for_status()
+                lines = response.aiter_lines()
+                while True:
+                    try:
+                        line = await asyncio.wait_for(lines.__anext__(), timeout=deadline.remaining())
+                    except StopAsyncIteration:
+                        break
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = orjson.loads(data)
+                    if chunk.get("usage"): # last chunk when stream_options.include_usage is set, it has no choices
+                        log_usage(chunk["usage"], payload.get("model"))
+                    choices = chunk.get("choices") or []
+                    delta = choices[0].get("delta", {}).get("content") if choices else None
+                    if delta:
+                        yield delta
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    def metrics(self) -> Dict:
+        pool = getattr(getattr(self.client, "_transport", None), "_pool", None) # httpcore pool, not public api
+        open_connections = len(getattr(pool, "connections", []) or [])
+        return {
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "open_connections": open_connections,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "pool_utilisation": self.in_flight / self.limits.max_connections if self.limits.max_connections else 0.0,
+            "requests": self.requests,
+            "errors": self.errors,
+        }
+
+
+llm_client = LLMClient()
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    timeouts, connection errors, rate limits and server errors are worth another attempt, other 4xx are not.
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return isinstance(error, (httpx.TransportError, asyncio.TimeoutError))
+
+
+llm_hedger = RequestHedger(
+    hedge_percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", pipeline_constants.LLM_HEDGE_PERCENTILE)),
+    min_hedge_delay=float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", pipeline_constants.LLM_HEDGE_MIN_DELAY_SECONDS)),
+    default_hedge_delay=float(os.getenv("LLM_HEDGE_DEFAULT_DELAY_SECONDS", pipeline_constants.LLM_HEDGE_DEFAULT_DELAY_SECONDS)),
+    min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES", pipeline_constants.LLM_HEDGE_MIN_SAMPLES)),
+    window=int(os.getenv("LLM_HEDGE_WINDOW", pipeline_constants.LLM_HEDGE_WINDOW)),
+    max_hedge_rate=float(os.getenv("LLM_HEDGE_MAX_RATE", pipeline_constants.LLM_HEDGE_MAX_RATE)),
+    max_attempts=int(os.getenv("LLM_MAX_ATTEMPTS", pipeline_constants.LLM_MAX_ATTEMPTS)),
+    backoff_base=float(os.getenv("LLM_BACKOFF_BASE_SECONDS", pipeline_constants.LLM_BACKOFF_BASE_SECONDS)),
+    backoff_max=float(os.getenv("LLM_BACKOFF_MAX_SECONDS", pipeline_constants.LLM_BACKOFF_MAX_SECONDS)),
+    retryable=is_retryable)
+
+# trips on upstream error rate / latency, calls are then refused at once instead of queuing behind a dead API
+llm_breaker = CircuitBreaker(
+    window=int(os.getenv("LLM_BREAKER_WINDOW", pipeline_constants.LLM_BREAKER_WINDOW)),
+    min_calls=int(os.getenv("LLM_BREAKER_MIN_CALLS", pipeline_constants.LLM_BREAKER_MIN_CALLS)),
+    failure_rate_threshold=float(os.getenv("LLM_BREAKER_FAILURE_RATE", pipeline_constants.LLM_BREAKER_FAILURE_RATE)),
+    slow_call_seconds=float(os.getenv("LLM_BREAKER_SLOW_CALL_SECONDS", pipeline_constants.LLM_BREAKER_SLOW_CALL_SECONDS)),
+    slow_call_rate_threshold=float(os.getenv("LLM_BREAKER_SLOW_CALL_RATE", pipeline_constants.LLM_BREAKER_SLOW_CALL_RATE)),
+    open_seconds=float(os.getenv("LLM_BREAKER_OPEN_SECONDS", pipeline_constants.LLM_BREAKER_OPEN_SECONDS)),
+    half_open_calls=int(os.getenv("LLM_BREAKER_HALF_OPEN_CALLS", pipeline_constants.LLM_BREAKER_HALF_OPEN_CALLS)))
+
+
+def log_usage(usage: Union[Dict, None], model_name: str) -> None:
+    if usage:
+        app_logger.handle_logging(f"{model_name} tokens: input={usage.get('prompt_tokens')}, output={usage.get('completion_tokens')}")
+
+
+async def call_gpt_2(instruction: str, prompt: str, model_name: str = "gpt-3.5-turbo", timeout_duration: int = 70,
+                     deadline: Deadline = None, hedger: RequestHedger = None) -> str:
+    """
+    JSON-mode completion, None on failure or while the circuit breaker is open. the call is hedged and retried
+    (llm_hedger, or the given hedger) within the deadline, a request without one gets timeout_duration seconds.
+    """
+    if not llm_breaker.allow():
+        app_logger.handle_logging("LLM circuit breaker is open, call skipped", logging.WARNING)
+        return None
+    app_logger.handle_logging("Calling GPT for final processing.")
+    payload = {
+        "model": model_name,
+        "messages": [
+            {"role": "system", "content": instruction},
+            {"role": "user", "content": prompt}
+        ],
+        "response_format": {"type": "json_object"}, # JSON mode, the output is parsed with orjson instead of eval
+    }
+    
+    async def attempt(timeout: float) -> Dict:
+        response = await llm_client.post(payload, total_timeout=timeout)
+        response.raise_for_status()
+        return orjson.loads(response.content)
+
+    started = time.monotonic()
+    success = False
+    try:
+        data = await (hedger or llm_hedger).run(attempt, deadline or Deadline(timeout_duration))
+        success = True
+        log_usage(data.get("usage"), model_name)
+        text = data["choices"][0]["message"]["content"]
+        return text
+    except Exception as e:
+        app_logger.handle_logging(f"LLM call failed: {e!r}", logging.ERROR)
+        return None
+    finally:
+        llm_breaker.record(success, time.monotonic() - started)
+
+
+async def stream_gpt(instruction: str, prompt: str, model_name: str = "gpt-3.5-turbo", timeout_duration: int = 70,
+                     deadline: Deadline = None) -> AsyncIterator[str]:
+    """
+    same request as call_gpt_2 in the provider's streaming mode, yields the output text incrementally.
+    bound by the deadline but neither hedged nor retried, the deltas already sent to the client cannot be taken back.
+    raises CircuitOpenError while the circuit breaker is open.
+    """
+    if not llm_breaker.allow():
+        raise CircuitOpenError("LLM circuit breaker is open")
+    app_logger.handle_logging("Streaming GPT for final processing.")
+    payload = {
+        "model": model_name,
+        "messages": [
+            {"role": "system", "content": instruction},
+            {"role": "user", "content": prompt}
+        ],
+        "response_format": {"type": "json_object"},
+        "stream_options": {"include_usage": True},
+    }
+    started = time.monotonic()
+    success = False
+    try:
+        async for delta in llm_client.stream(payload, total_timeout=deadline.remaining() if deadline else timeout_duration):
+            yield delta
+        success = True
+    finally:
+        llm_breaker.record(success, time.monotonic() - started)
+
+
+async def translate_items(items: List[str], country: str, model_name: str = "gpt-3.5-turbo", timeout_duration: int = 30,
+                          deadline: Deadline = None) -> Union[List[str], None]:
+    """
+    translates short ingredient lines in one JSON-mode call, None when the call fails or the answer does not line up.
+    """
+    text = await call_gpt_2(instruction=item_translation_prompt+"\nTRANSLATION LANGUAGE: "+country+"\n",
+                            prompt=orjson.dumps(items).decode("utf-8"), model_name=model_name, timeout_duration=timeout_duration,
+                            deadline=deadline)
+    try:
+        translated = orjson.loads(text)["items"] if text else None
+    except (orjson.JSONDecodeError, KeyError, TypeError):
+        return None
+    if not isinstance(translated, list) or len(translated) != len(items):
+        return None
+    return [str(item) for item in translated]
+
+
+async def call_gpt(instruction: str, prompt: str, model_name: str = "gpt-3.5-turbo", timeout_duration: int = 70) -> str:
+    """
+    legacy entry point, kept for old callers. it used a blocking requests.post inside async code,
+    now it goes through the same pooled client as call_gpt_2.
+    """
+    return await call_gpt_2(instruction, prompt, model_name=model_name, timeout_duration=timeout_duration)
@@ -0,0 +1,479 @@
+from langchain.schema.document import Document
+from src.handler_api.hnsw_index import HNSWIndex
+from src.handler_api.bitmap_index import BitmapIndex, tokenize
+from src.handler_api.ingredient_vocabulary import IngredientSets
+from src.handler_api.bm25_index import BM25Index, reciprocal_rank_fusion
+from src.handler_api.recipe_store import point_key
+from typing import List, Tuple, Union, Any, Dict, Optional
+import numpy as np
+import json
+import os
+
+
+VECTORS_FILE_NAME = "vectors.npy"
+PAYLOADS_FILE_NAME = "payloads.json"
+IDS_FILE_NAME = "ids.json"
+ANN_MIN_ROWS = 50000 # below this many rows the exact numpy scan beats the python graph walk in both latency and recall
+ANN_MIN_ALLOWED_FRACTION = 0.2 # below this share of allowed rows a filtered exact scan is cheaper than walking the graph
+ANN_MAX_DELETED_FRACTION = 0.2 # removals tombstone graph nodes, the graph is rebuilt once tombstones exceed this share of it
+
+
+def maximal_marginal_relevance(scores: np.ndarray, candidates: np.ndarray, k: int, lambda_mult: float = 0.5) -> List[int]:
+    """
+    mmr selection over candidates sorted best first (scores = cosine similarity to the query,
+    candidates = their L2-normalized vectors), same selection rule langchain applies. returns candidate positions.
+    """
+    if len(candidates) == 0:
+        return []
+    pairwise = candidates @ candidates.T
+    selected = [0]
+    max_redundancy = pairwise[0].copy()
+    while len(selected) < min(k, len(candidates)):
+        mmr_scores = lambda_mult * scores - (1 - lambda_mult) * max_redundancy
+        mmr_scores[selected] = -np.inf
+        best = int(np.argmax(mmr_scores))
+        selected.append(best)
+        np.maximum(max_redundancy, pairwise[best], out=max_redundancy)
+    return selected
+
+
+class LocalVectorIndex:
+    """
+    in-process replacement for the remote qdrant collection.
+    keeps every recipe vector in one contiguous float32 matrix and the qdrant payloads in a list with the same row order.
+    rows are L2-normalized when the index is built, so a single matrix-vector product gives the cosine scores qdrant would return.
+    exposes the same search methods the langchain Qdrant store does, so QdrantVectorRetrieverPipeline can use it as its vector_store.
+    when an HNSWIndex is attached (ann_index) and the index has at least ann_min_rows rows, unfiltered and lightly filtered
+    searches walk the graph instead of scanning every row.
+    removed rows stay in the graph as tombstones, the rows are then its live nodes in node order (see map_ann_nodes).
+    page_content text filters (preferences / allergens) are answered from the BitmapIndex built with the snapshot.
+    ingredient_sets holds every row's canonical ingredient id set (see IngredientVocabulary) for set-based scoring.
+    bm25_index is the sparse lexical index over page_content used by the hybrid (dense + bm25) retrieval mode.
+    """
+
+    def __init__(self, vectors: np.ndarray, payloads: List[Dict], ids: List[Union[str, int]], embedder: Any = None,
+                 ann_index: HNSWIndex = None, bitmap_index: BitmapIndex = None, ingredient_sets: IngredientSets = None,
+                 bm25_index: BM25Index = None) -> None:
+        if len(vectors) != len(payloads) or len(payloads) != len(ids):
+            raise ValueError("vectors, payloads and ids must have the same length")
+
+        self.vectors = vectors
+        self.payloads = payloads
+        self.ids = ids
+        self.embedder = embedder
+        self.ann_index = ann_index
+        self.ann_min_rows = ANN_MIN_ROWS
+        self.bitmap_index = bitmap_index if bitmap_index is not None else BitmapIndex.from_payloads(payloads)
+        self.ingredient_sets = ingredient_sets if ingredient_sets is not None else IngredientSets.from_payloads(payloads)
+        self.bm25_index = bm25_index if bm25_index is not None else BM25Index.from_payloads(payloads)
+        # page_content column is scanned by every text-match condition, keep it as a plain list.
+        self.page_contents = [payload.get("page_content", "") or "" for payload in payloads]
+        self.numeric_columns: Dict[str, np.ndarray] = {} # payload key -> float column (nan when missing), built on first range filter
+        self.ann_live_nodes: Optional[np.ndarray] = None # row -> graph node, None while they are the same
+        self.ann_node_rows: Optional[np.ndarray] = None # graph node -> row, -1 for tombstones
+        self.map_ann_nodes()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @staticmethod
+    def normalize(vectors: np.ndarray) -> np.ndarray:
+        """
+        returns a contiguous float32 copy of the vectors with unit L2 norm per row.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    @classmethod
+    def from_documents(cls, documents: List[Document], embedder: Any, ids: List[Union[str, int]] = None) -> "LocalVectorIndex":
+        """
+        embeds the documents and builds the index, payloads follow the langchain Qdrant layout.
+        """
+        vectors = cls.normalize(np.array(embedder.embed_documents([doc.page_content for doc in documents])))
+        payloads = [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in documents]
+        ids = ids if ids is not None else list(range(len(documents)))
+        return cls(vectors, payloads, ids, embedder)
+
+    @classmethod
+    def from_qdrant(cls, client: Any, collection_name: str, embedder: Any = None, batch_size: int = 256) -> "LocalVectorIndex":
+        """
+        scrolls the whole qdrant collection (payloads + vectors) and builds the index from it.
+        """
+        vectors, payloads, ids = [], [], []
+        offset = None
+        while True:
+            points, offset = client.scroll(collection_name=collection_name, limit=batch_size, offset=offset,
+                                           with_payload=True, with_vectors=True)
+            for point in points:
+                vectors.append(point.vector)
+                payloads.append(point.payload)
+                ids.append(point.id)
+            if offset is None:
+                break
+
+        return cls(cls.normalize(np.array(vectors)), payloads, ids, embedder)
+
+    @staticmethod
+    def exists(index_dir: str) -> bool:
+        return os.path.exists(os.path.join(index_dir, VECTORS_FILE_NAME))
+
+    @classmethod
+    def empty(cls, dim: int, embedder: Any = None, hnsw_params: Dict = None) -> "LocalVectorIndex":
+        """
+        starting point for incremental builds, pass hnsw_params (M, ef_construction, ef_search) to grow a graph alongside.
+        """
+        ann_index = HNSWIndex(dim, **hnsw_params) if hnsw_params is not None else None
+        return cls(np.empty((0, dim), dtype=np.float32), [], [], embedder, ann_index)
+
+    def add(self, vectors: np.ndarray, payloads: List[Dict], ids: List[Union[str, int]]) -> None:
+        """
+        appends rows (and graph nodes when an ann_index is attached), the index must not be memory-mapped.
+        """
+        vectors = self.normalize(vectors)
+        if self.ann_index is not None:
+            self.ann_index.add_items(vectors)
+        if self.ann_index is not None and not self.ann_index.n_deleted:
+            self.vectors = self.ann_index.vectors # the graph owns the grown matrix, share it instead of copying
+        else:
+            self.vectors = np.ascontiguousarray(np.vstack([self.vectors, vectors]))
+        self.payloads.extend(payloads)
+        self.ids.extend(ids)
+        self.page_contents.extend(payload.get("page_content", "") or "" for payload in payloads)
+        self.rebuild_row_indexes()
+        self.map_ann_nodes()
+
+    def remove(self, ids: List[Union[str, int]], max_deleted_fraction: float = ANN_MAX_DELETED_FRACTION) -> int:
+        """
+        drops the rows of the given point ids and returns how many there were, the index must not be memory-mapped.
+        their graph nodes are tombstoned, the graph is only rebuilt over the remaining rows once more than
+        max_deleted_fraction of its nodes are tombstones.
+        """
+        removed = {point_key(point_id) for point_id in ids}
+        keep = [row for row, point_id in enumerate(self.ids) if point_key(point_id) not in removed]
+        n_removed = len(self) - len(keep)
+        if not n_removed:
+            return 0
+        if self.ann_index is not None:
+            removed_rows = np.setdiff1d(np.arange(len(self)), keep)
+            self.ann_index.mark_deleted(removed_rows if self.ann_live_nodes is None else self.ann_live_nodes[removed_rows])
+        self.vectors = np.ascontiguousarray(self.vectors[keep])
+        self.payloads = [self.payloads[row] for row in keep]
+        self.ids = [self.ids[row] for row in keep]
+        self.page_contents = [self.page_contents[row] for row in keep]
+        self.rebuild_row_indexes()
+        if self.ann_index is not None and self.ann_index.n_deleted > max_deleted_fraction * len(self.ann_index):
+            self.build_ann_index(M=self.ann_index.M, ef_construction=self.ann_index.ef_construction, ef_search=self.ann_index.ef_search)
+        self.map_ann_nodes()
+        return n_removed
+
+    def map_ann_nodes(self) -> None:
+        """
+        row <-> graph node maps once the graph has tombstones. rows keep the order of their nodes, so the live nodes
+        are the rows and nothing but the tombstones has to be persisted.
+        """
+        if self.ann_index is None or not self.ann_index.n_deleted:
+            self.ann_live_nodes = self.ann_node_rows = None
+            return
+        live = ~np.asarray(self.ann_index.deleted)
+        self.ann_live_nodes = np.flatnonzero(live)
+        self.ann_node_rows = np.where(live, np.cumsum(live) - 1, -1)
+
+    def rebuild_row_indexes(self) -> None:
+        """
+        the per-row side indexes, after rows were added or removed.
+        """
+        self.numeric_columns = {}
+        self.bitmap_index = BitmapIndex.from_payloads(self.payloads) # postings are sorted by row, rebuilding is simpler than merging
+        self.ingredient_sets = IngredientSets.from_payloads(self.payloads)
+        self.bm25_index = BM25Index.from_payloads(self.payloads) # idf and average length change with every row
+
+    def save(self, index_dir: str) -> None:
+        """
+        persists the index as a raw .npy matrix plus json side files, and the hnsw graph files when there is one.
+        """
+        os.makedirs(index_dir, exist_ok=True)
+        np.save(os.path.join(index_dir, VECTORS_FILE_NAME), np.ascontiguousarray(self.vectors, dtype=np.float32))
+        with open(os.path.join(index_dir, PAYLOADS_FILE_NAME), "w") as f:
+            json.dump(self.payloads, f)
+        with open(os.path.join(index_dir, IDS_FILE_NAME), "w") as f:
+            json.dump(self.ids, f)
+        self.bitmap_index.save(index_dir)
+        self.ingredient_sets.save(index_dir)
+        self.bm25_index.save(index_dir)
+        if self.ann_index is not None:
+            self.ann_index.save(index_dir)
+
+    @classmethod
+    def load(cls, index_dir: str, embedder: Any = None, mmap: bool = False, ef_search: int = None) -> "LocalVectorIndex":
+        """
+        loads an index written by save. pass mmap=True to share the vector matrix and the hnsw graph between processes
+        via the page cache (read-only), mmap=False to load a writable copy that add can grow.
+        """
+        vectors = np.load(os.path.join(index_dir, VECTORS_FILE_NAME), mmap_mode="r" if mmap else None)
+        with open(os.path.join(index_dir, PAYLOADS_FILE_NAME), "r") as f:
+            payloads = json.load(f)
+        with open(os.path.join(index_dir, IDS_FILE_NAME), "r") as f:
+            ids = json.load(f)
+
+        ann_index = None
+        if HNSWIndex.exists(index_dir):
+            ann_index = HNSWIndex.load(index_dir, vectors, mmap=mmap, ef_search=ef_search)
+            if not ann_index.n_deleted:
+                vectors = ann_index.vectors
+        # snapshots written before the bitmap index existed get one built from their payloads
+        bitmap_index = BitmapIndex.load(index_dir, mmap=mmap) if BitmapIndex.exists(index_dir) else None
+        ingredient_sets = IngredientSets.load(index_dir, mmap=mmap) if IngredientSets.exists(index_dir) else None
+        bm25_index = BM25Index.load(index_dir, mmap=mmap) if BM25Index.exists(index_dir) else None
+        return cls(vectors, payloads, ids, embedder, ann_index, bitmap_index, ingredient_sets, bm25_index)
+
+    def build_ann_index(self, M: int = 16, ef_construction: int = 200, ef_search: int = 64) -> HNSWIndex:
+        """
+        builds an hnsw graph over the rows that are already in the index.
+        """
+        self.ann_index = HNSWIndex(self.vectors.shape[1], M=M, ef_construction=ef_construction, ef_search=ef_search)
+        self.ann_index.add_items(self.vectors)
+        self.vectors = self.ann_index.vectors
+        self.map_ann_nodes()
+        return self.ann_index
+
+    def ann_recall(self, k: int = 10, sample_size: int = 200, ef: int = None, seed: int = 0) -> float:
+        """
+        recall@k of the hnsw graph against exact search, using stored vectors as queries.
+        """
+        if self.ann_index is None:
+            raise ValueError("no ann index attached")
+        rng = np.random.default_rng(seed)
+        rows = rng.choice(len(self), size=min(sample_size, len(self)), replace=False)
+        return self.ann_index.recall(np.asarray(self.vectors[rows]), k=k, ef=ef)
+
+    #FILTERING
+    @staticmethod
+    def get_payload_value(payload: Dict, key: str) -> Any:
+        """
+        resolves dotted qdrant keys like "metadata.recipe_name" against a payload.
+        """
+        value = payload
+        for part in key.split("."):
+            if not isinstance(value, dict):
+                return None
+            value = value.get(part)
+        return value
+
+    def numeric_column(self, key: str) -> np.ndarray:
+        column = self.numeric_columns.get(key)
+        if column is None:
+            values = (self.get_payload_value(payload, key) for payload in self.payloads)
+            column = np.fromiter((value if isinstance(value, (int, float)) else np.nan for value in values), dtype=np.float64, count=len(self))
+            self.numeric_columns[key] = column
+        return column
+
+    def condition_mask(self, condition: Dict, negated: bool = False) -> np.ndarray:
+        """
+        evaluates one qdrant condition over all rows: a nested filter, a range (rows without the number never match) or a
+        match. supports match.text (substring, like qdrant without a full-text index), match.value and match.any.
+        page_content text matches are read from the bitmap index, with substring semantics when negated (must_not).
+        """
+        if "key" not in condition:
+            mask = self.filter_mask(condition)
+            return mask if mask is not None else np.ones(len(self), dtype=bool)
+
+        key = condition["key"]
+        match = condition.get("match", {})
+
+        if "range" in condition:
+            column = self.numeric_column(key)
+            mask = ~np.isnan(column)
+            with np.errstate(invalid="ignore"):
+                for op, compare in (("gt", np.greater), ("gte", np.greater_equal), ("lt", np.less), ("lte", np.less_equal)):
+                    if condition["range"].get(op) is not None:
+                        mask &= compare(column, condition["range"][op])
+            return mask
+
+        if key == "page_content" and "text" in match:
+            if negated and not tokenize(match["text"]):
+                return self.unindexed_text_mask(match["text"])
+            if self.bitmap_index is not None:
+                return self.bitmap_index.to_mask(self.bitmap_index.term_bitmap(match["text"], substring=negated))
+            text = match["text"]
+            return np.fromiter((text in content for content in self.page_contents), dtype=bool, count=len(self))
+
+        any_values = set(match.get("any") or [])
+
+        def matches(value: Any) -> bool:
+            values = value if isinstance(value, list) else [value]
+            if "text" in match:
+                return any(isinstance(v, str) and match["text"] in v for v in values)
+            if "value" in match:
+                return match["value"] in values
+            if "any" in match:
+                return any(v in any_values for v in values)
+            raise ValueError(f"unsupported match condition: {match}")
+
+        return np.fromiter((matches(self.get_payload_value(payload, key)) for payload in self.payloads), dtype=bool, count=len(self))
+
+    def filter_mask(self, filter: Dict = None) -> Union[np.ndarray, None]:
+        """
+        turns a filter dict ("must" / "must_not" / "should" lists, see payload_schema.compile_filter) into a boolean row mask.
+        returns None when there is nothing to filter.
+        """
+        if not filter:
+            return None
+
+        bitmap_mask = self.bitmap_filter_mask(filter)
+        if bitmap_mask is not None:
+            return bitmap_mask
+
+        mask = np.ones(len(self), dtype=bool)
+        for condition in filter.get("must") or []:
+            mask &= self.condition_mask(condition)
+        for condition in filter.get("must_not") or []:
+            mask &= ~self.condition_mask(condition, negated=True)
+        should = filter.get("should") or []
+        if should:
+            any_mask = np.zeros(len(self), dtype=bool)
+            for condition in should:
+                any_mask |= self.condition_mask(condition)
+            mask &= any_mask
+        return mask
+
+    def bitmap_filter_mask(self, filter: Dict) -> Union[np.ndarray, None]:
+        """
+        fast path for filters made only of page_content text matches (the preference / allergen filter of get_recipe):
+        evaluated as AND / ANDNOT over the packed term bitmaps. returns None when the filter needs the generic path.
+        matches whole tags and words rather than raw substrings, so "egg" no longer matches "eggplant".
+        """
+        terms = {}
+        for clause in ("must", "must_not", "should"):
+            conditions = filter.get(clause) or []
+            if any(condition.get("key") != "page_content" or "text" not in condition.get("match", {}) for condition in conditions):
+                return None
+            terms[clause] = [condition["match"]["text"] for condition in conditions]
+        mask = self.bitmap_index.to_mask(self.bitmap_index.evaluate(**terms))
+        for term in terms["must_not"]:
+            if not tokenize(term):
+                mask &= ~self.unindexed_text_mask(term)
+        return mask
+
+    def unindexed_text_mask(self, text: str) -> np.ndarray:
+        """
+        rows whose page_content contains the text, case-insensitive. exclusions without a word the bitmap index keeps
+        (two letters, non-ascii like "süt") are matched this way, as the substring filter before the bitmap index did.
+        """
+        text = text.strip().lower()
+        if not text:
+            return np.zeros(len(self), dtype=bool)
+        return np.fromiter((text in content.lower() for content in self.page_contents), dtype=bool, count=len(self))
+
+    #SEARCH
+    def to_document(self, row: int) -> Document:
+        payload = self.payloads[row]
+        return Document(page_content=payload.get("page_content", ""), metadata=payload.get("metadata") or {})
+
+    def top_rows(self, embedding: List[float], k: int, filter: Dict = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        returns the row numbers and cosine scores of the k best matching rows, best first.
+        """
+        return self.dense_rows(embedding, k, self.filter_mask(filter))
+
+    def dense_rows(self, embedding: List[float], k: int, mask: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        query = self.normalize(np.asarray(embedding))
+        found = self.ann_rows(query, k, mask)
+        if found is not None:
+            return found
+        return self.top_scores(self.vectors @ query, k, mask)
+
+    def ann_rows(self, query: np.ndarray, k: int, mask: np.ndarray = None) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        walks the hnsw graph when it can serve the query, None when an exact scan should answer it instead:
+        no graph, too few rows for the walk to pay off, a filter allowing too few rows, or a walk (filtered, or past tombstones) that hit its expansion cap
+        before finding k rows.
+        """
+        if self.ann_index is None or len(self) < self.ann_min_rows:
+            return None
+        allowed = len(self) if mask is None else int(np.count_nonzero(mask))
+        if mask is not None and allowed < ANN_MIN_ALLOWED_FRACTION * len(mask):
+            return None
+        node_mask = mask
+        if mask is not None and self.ann_live_nodes is not None:
+            node_mask = np.zeros(len(self.ann_index), dtype=bool)
+            node_mask[self.ann_live_nodes] = mask
+        found = self.ann_index.search(query, k, mask=node_mask)
+        if len(found[0]) < min(k, allowed):
+            return None
+        return self.ann_rows_of(*found)
+
+    def ann_rows_of(self, nodes: np.ndarray, scores: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return (nodes if self.ann_node_rows is None else self.ann_node_rows[nodes]), scores
+
+    def dense_rows_batch(self, embeddings: List[List[float]], k: int, masks: List[np.ndarray]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        dense_rows for several queries. the exact scores of all queries come from one (n_rows, dim) @ (dim, n_queries)
+        product, so the vectors are read once per batch instead of once per query; queries the hnsw graph can serve still walk it.
+        """
+        queries = self.normalize(np.asarray(embeddings))
+        results = [None] * len(queries)
+        exact = []
+        for i, mask in enumerate(masks):
+            results[i] = self.ann_rows(queries[i], k, mask)
+            if results[i] is None:
+                exact.append(i)
+        if exact:
+            scores = self.vectors @ queries[exact].T
+            for column, i in enumerate(exact):
+                results[i] = self.top_scores(scores[:, column], k, masks[i])
+        return results
+
+    @staticmethod
+    def top_scores(scores: np.ndarray, k: int, mask: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows = np.argpartition(-scores, k - 1)[:k]
+        rows = rows[np.argsort(-scores[rows])]
+        rows = rows[np.isfinite(scores[rows])] # drop rows excluded by the filter
+        return rows, scores[rows]
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4, filter: Dict = None, **kwargs) -> List[Tuple[Document, float]]:
+        rows, scores = self.top_rows(embedding, k, filter)
+        return [(self.to_document(row), float(score)) for row, score in zip(rows, scores)]
+
+    def similarity_search(self, query: str, k: int = 4, filter: Dict = None, **kwargs) -> List[Document]:
+        embedding = self.embedder.embed_query(query)
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k=k, filter=filter)]
+
+    def mmr_rows(self, embedding: List[float], k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5, filter: Dict = None) -> np.ndarray:
+        """
+        maximal marginal relevance over the fetch_k nearest rows, same selection rule langchain applies.
+        """
+        rows, scores = self.top_rows(embedding, max(k, fetch_k), filter)
+        if len(rows) == 0:
+            return rows
+        return rows[maximal_marginal_relevance(scores, np.asarray(self.vectors[rows]), k, lambda_mult)]
+
+    def max_marginal_relevance_search_by_vector(self, embedding: List[float], k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5, filter: Dict = None, **kwargs) -> List[Document]:
+        return [self.to_document(row) for row in self.mmr_rows(embedding, k, fetch_k, lambda_mult, filter)]
+
+    def sparse_rows(self, query: str, k: int, filter: Dict = None) -> Tuple[np.ndarray, np.ndarray]:
+        return self.bm25_index.search(query, k, mask=self.filter_mask(filter))
+
+    def hybrid_rows(self, embedding: List[float], query: str, k: int = 4, fetch_k: int = 20, filter: Dict = None) -> List[int]:
+        """
+        fuses the fetch_k best dense rows and the fetch_k best bm25 rows with reciprocal rank fusion, returns the k best rows.
+        the filter mask is computed once and shared by both searches.
+        """
+        mask = self.filter_mask(filter)
+        dense, _ = self.dense_rows(embedding, max(k, fetch_k), mask)
+        sparse, _ = self.bm25_index.search(query, max(k, fetch_k), mask=mask)
+        return reciprocal_rank_fusion([dense.tolist(), sparse.tolist()])[:k]
+
+    def hybrid_search_by_vector(self, embedding: List[float], query: str, k: int = 4, fetch_k: int = 20, filter: Dict = None) -> List[Document]:
+        return [self.to_document(row) for row in self.hybrid_rows(embedding, query, k, fetch_k, filter)]
+
+    def max_marginal_relevance_search(self, query: str, k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5, filter: Dict = None, **kwargs) -> List[Document]:
+        embedding = self.embedder.embed_query(query)
+        return self.max_marginal_relevance_search_by_vector(embedding, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult, filter=filter)
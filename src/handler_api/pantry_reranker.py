@@ -0,0 +1,43 @@
+from typing import Dict
+import numpy as np
+
+
+class PantryReranker:
+    """
+    re-scores a pool of retrieved recipes by how much of each recipe the user can already cook:
+        score = vector_weight * relevance + coverage_weight * covered / n_ingredients - missing_weight * min(missing, max_missing) / max_missing
+    relevance is the retriever score (or rank) min-max scaled over the pool. recipes are given as canonical ingredient
+    id sets in flat form (ids + per-recipe lengths), so the whole pool is scored with one table lookup and one np.bincount.
+    recipes without ingredient ids (old payloads) keep only their relevance term.
+    """
+
+    def __init__(self, vector_weight: float = 0.5, coverage_weight: float = 0.35, missing_weight: float = 0.15, max_missing: int = 15) -> None:
+        self.vector_weight = vector_weight
+        self.coverage_weight = coverage_weight
+        self.missing_weight = missing_weight
+        self.max_missing = max_missing
+
+    def scores(self, ids: np.ndarray, lengths: np.ndarray, relevance: np.ndarray, user_ids: np.ndarray) -> np.ndarray:
+        n = len(lengths)
+        relevance = np.asarray(relevance, dtype=np.float32)
+        spread = float(relevance.max() - relevance.min()) if n else 0.0
+        relevance = (relevance - relevance.min()) / spread if spread > 0 else np.ones(n, dtype=np.float32)
+
+        # boolean lookup table over the id range instead of np.isin (no sorting)
+        lookup = np.zeros(int(max(ids.max(initial=-1), user_ids.max(initial=-1))) + 1, dtype=bool)
+        lookup[user_ids] = True
+        owner = np.repeat(np.arange(n), lengths) # candidate of every flat id
+        covered = np.bincount(owner, weights=lookup[ids], minlength=n)
+        coverage = np.divide(covered, lengths, out=np.zeros(n), where=lengths > 0)
+        missing = np.minimum(lengths - covered, self.max_missing) / self.max_missing
+        return self.vector_weight * relevance + self.coverage_weight * coverage - self.missing_weight * missing
+
+    def rerank(self, ids: np.ndarray, lengths: np.ndarray, relevance: np.ndarray, user_ids: np.ndarray) -> np.ndarray:
+        """
+        candidate positions, best first. ties keep the retriever order.
+        """
+        return np.argsort(-self.scores(ids, lengths, relevance, user_ids), kind="stable")
+
+    def config(self) -> Dict:
+        return {"vector_weight": self.vector_weight, "coverage_weight": self.coverage_weight,
+                "missing_weight": self.missing_weight, "max_missing": self.max_missing}
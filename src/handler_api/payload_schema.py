@@ -0,0 +1,104 @@
+from src.handler_api.ingredient_vocabulary import IngredientVocabulary
+from src.handler_api.bitmap_index import normalize_tag, tokenize
+from qdrant_client.http import models
+from typing import List, Dict, Any
+
+
+# typed payload fields and the qdrant index type of each, created by create_payload_indexes
+PAYLOAD_INDEXES = {
+    "metadata.recipe_tag_keys": models.PayloadSchemaType.KEYWORD,
+    "metadata.recipe_tokens": models.PayloadSchemaType.KEYWORD,
+    "metadata.recipe_ingredient_names": models.PayloadSchemaType.KEYWORD,
+    "metadata.recipe_prep_minutes": models.PayloadSchemaType.INTEGER,
+    "metadata.recipe_cook_minutes": models.PayloadSchemaType.INTEGER,
+    "metadata.recipe_total_minutes": models.PayloadSchemaType.INTEGER,
+    "metadata.recipe_servings": models.PayloadSchemaType.INTEGER,
+    "metadata.recipe_calories": models.PayloadSchemaType.INTEGER,
+    "metadata.recipe_fat_grams": models.PayloadSchemaType.FLOAT,
+    "metadata.recipe_carbohydrate_grams": models.PayloadSchemaType.FLOAT,
+    "metadata.recipe_protein_grams": models.PayloadSchemaType.FLOAT,
+}
+TYPED_PAYLOAD_MARKER = "recipe_tokens" # metadata key telling that a collection was ingested with the typed schema
+
+
+def keyword_fields(tags: List[Any], ingredients: List[Any], ingredient_ids: List[List[int]], vocabulary: IngredientVocabulary) -> Dict:
+    """
+    keyword array fields of a recipe: normalized tags, the words of its tags and ingredient lines (the terms the bitmap
+    index keeps per row) and its distinct canonical ingredient names. the words are added to the vocabulary's tokens.
+    """
+    tokens = sorted({token for text in [*tags, *ingredients] for token in tokenize(str(text))})
+    vocabulary.tokens.update(tokens)
+    ids = sorted({ingredient_id for line in ingredient_ids for ingredient_id in line})
+    return {
+        "recipe_tag_keys": sorted({normalize_tag(str(tag)) for tag in tags} - {""}),
+        "recipe_tokens": tokens,
+        "recipe_ingredient_names": [vocabulary.names[ingredient_id] for ingredient_id in ids],
+    }
+
+
+def create_payload_indexes(client: Any, collection_name: str) -> List[str]:
+    """
+    creates the PAYLOAD_INDEXES on the collection with the sync qdrant client. existing indexes are left as they are.
+    """
+    existing = client.get_collection(collection_name).payload_schema or {}
+    created = []
+    for field_name, field_schema in PAYLOAD_INDEXES.items():
+        if field_name not in existing:
+            client.create_payload_index(collection_name=collection_name, field_name=field_name, field_schema=field_schema)
+            created.append(field_name)
+    return created
+
+
+async def create_payload_indexes_async(client: Any, collection_name: str) -> List[str]:
+    """
+    create_payload_indexes with the async qdrant client.
+    """
+    existing = (await client.get_collection(collection_name)).payload_schema or {}
+    created = []
+    for field_name, field_schema in PAYLOAD_INDEXES.items():
+        if field_name not in existing:
+            await client.create_payload_index(collection_name=collection_name, field_name=field_name, field_schema=field_schema)
+            created.append(field_name)
+    return created
+
+
+def compile_filter(preferences: List[str], allergens: List[str], vocabulary: IngredientVocabulary, typed: bool = True,
+                   ranges: Dict[str, Dict[str, float]] = None) -> Dict:
+    """
+    turns the user's preferences, allergens and numeric limits into a qdrant filter (as a dict).
+    typed=True targets the indexed keyword/number fields, with the semantics of the local BitmapIndex:
+        - a preference matches the tag with its normalized name, or recipes containing all of its words
+        - an allergen excludes that tag and recipes containing all of its words, where a word also covers every corpus
+          token containing it ("milk" -> "buttermilk"), as strict as the substring text match it replaces.
+          allergens without an indexable word ("ox", "süt"), and every allergen while the vocabulary has no corpus
+          tokens to expand with (file missing), keep the page_content text match instead of being dropped
+        - ranges, e.g. {"recipe_total_minutes": {"lte": 30}}, become range conditions on the numeric fields
+    typed=False builds the legacy page_content text filter for collections ingested without the typed fields, ranges are then dropped.
+    """
+    if not typed:
+        return {
+            "must": [{"key": "page_content", "match": {"text": tag}} for tag in preferences],
+            "must_not": [{"key": "page_content", "match": {"text": ingredient}} for ingredient in allergens],
+        }
+
+    must = []
+    for preference in preferences:
+        tokens = tokenize(preference)
+        if tokens: # nothing indexable in the preference, it cannot restrict anything
+            must.append({"should": [
+                {"key": "metadata.recipe_tag_keys", "match": {"value": normalize_tag(preference)}},
+                {"must": [{"key": "metadata.recipe_tokens", "match": {"value": token}} for token in tokens]}]})
+    for field, bounds in (ranges or {}).items():
+        bounds = {op: value for op, value in bounds.items() if value is not None}
+        if bounds:
+            must.append({"key": f"metadata.{field}", "range": bounds})
+
+    must_not = []
+    for allergen in allergens:
+        tokens = tokenize(allergen)
+        if tokens:
+            must_not.append({"key": "metadata.recipe_tag_keys", "match": {"value": normalize_tag(allergen)}})
+            must_not.append({"must": [{"key": "metadata.recipe_tokens", "match": {"any": vocabulary.matching_tokens(token)}} for token in tokens]})
+        if allergen.strip() and (not tokens or not vocabulary.tokens):
+            must_not.append({"key": "page_content", "match": {"text": allergen}})
+    return {"must": must, "must_not": must_not}
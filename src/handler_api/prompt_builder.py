@@ -0,0 +1,125 @@
+from src.handler_api.recipe_models import RecipeResult
+from src.constants import pipeline_constants
+from src.logger import AppLogger
+from typing import List, Dict, Union
+import logging
+import orjson
+import os
+
+try:
+    import tiktoken
+except ImportError: # listed in requirements.txt, without it token counts fall back to a length based estimate
+    tiktoken = None
+
+
+NULL_VALUES = {"", "none", "null", "n/a"}
+PROMPT_FORMAT_VERSION = 1 # bump when recipe_fields or the trimming steps change, cached translations are then produced again
+
+
+def compact_text(text: str) -> str:
+    return " ".join(str(text).split())
+
+
+def compact_lines(lines: List[str]) -> List[str]:
+    """
+    whitespace-collapsed lines without empty, null-like and repeated entries.
+    """
+    return [line for line in dict.fromkeys(compact_text(line) for line in lines) if line.lower() not in NULL_VALUES]
+
+
+def compact_details(details: Union[Dict, List]) -> Union[Dict, List]:
+    if isinstance(details, dict):
+        details = {compact_text(key): compact_text(value) for key, value in details.items() if value is not None}
+        return {key: value for key, value in details.items() if value.lower() not in NULL_VALUES}
+    return compact_lines(details)
+
+
+class PromptBuilder:
+    """
+    builds the user message of the formatting/translation call from a retrieved recipe.
+    keeps only the fields the output schema needs (no urls, tags or ids), collapses the whitespace noise of scraped
+    details/nutrition text and enforces an input token budget (instruction + recipe) by shortening, then dropping,
+    the least essential parts. ingredient lines are never dropped, the shopping list relies on their order.
+    tokens are counted with tiktoken (exact for the gpt-3.5/4 family). only when it is missing or its encoding file cannot
+    be loaded (downloaded on first use, set TIKTOKEN_CACHE_DIR to run offline) they are estimated as characters / 4.
+    """
+
+    def __init__(self, max_input_tokens: int = pipeline_constants.LLM_MAX_INPUT_TOKENS,
+                 encoding_name: str = pipeline_constants.LLM_TOKENIZER_ENCODING,
+                 max_direction_chars: int = pipeline_constants.LLM_MAX_DIRECTION_CHARS) -> None:
+        self.log_writer = AppLogger("PromptBuilder")
+        self.max_input_tokens = max_input_tokens
+        self.max_direction_chars = max_direction_chars
+        self.encoding_name = encoding_name
+        self.encoding = self.load_encoding(encoding_name)
+
+    def load_encoding(self, encoding_name: str) -> Union["tiktoken.Encoding", None]:
+        if tiktoken is None:
+            self.log_writer.handle_logging("tiktoken is not installed, prompt tokens are estimated as characters / 4", logging.WARNING)
+            return None
+        try:
+            return tiktoken.get_encoding(encoding_name)
+        except Exception as e:
+            self.log_writer.handle_logging(f"tiktoken encoding {encoding_name} could not be loaded ({e!r}), prompt tokens are estimated as characters / 4", logging.WARNING)
+            return None
+
+    def template_signature(self) -> str:
+        """
+        everything besides the recipe that decides the prompt built for it.
+        """
+        return (f"prompt_format={PROMPT_FORMAT_VERSION} max_input_tokens={self.max_input_tokens} "
+                f"max_direction_chars={self.max_direction_chars} encoding={self.encoding_name}")
+
+    def count_tokens(self, text: str) -> int:
+        if self.encoding is not None:
+            return len(self.encoding.encode(text))
+        return (len(text) + 3) // 4
+
+    @staticmethod
+    def recipe_fields(recipe: RecipeResult) -> Dict:
+        return {
+            "recipe_name": compact_text(recipe.recipe_name),
+            "recipe_ingredients": [compact_text(line) for line in recipe.recipe_ingredients],
+            "recipe_directions": compact_lines(recipe.recipe_directions),
+            # parsed at ingestion when available, the LLM then only translates them
+            "recipe_details": recipe.structured_details() or compact_details(recipe.recipe_details),
+            "recipe_nutrition_details": recipe.structured_nutrition() or compact_details(recipe.recipe_nutrition_details),
+        }
+
+    def build(self, recipe: RecipeResult, instruction: str) -> str:
+        fields = self.recipe_fields(recipe)
+        instruction_tokens = self.count_tokens(instruction)
+
+        def render() -> str:
+            return orjson.dumps(fields).decode("utf-8")
+
+        def over_budget(prompt: str) -> bool:
+            return instruction_tokens + self.count_tokens(prompt) > self.max_input_tokens
+
+        prompt = render()
+        steps = []
+        if over_budget(prompt):
+            steps.append("shortened directions")
+            fields["recipe_directions"] = [line[:self.max_direction_chars].rstrip() for line in fields["recipe_directions"]]
+            prompt = render()
+        for key in ("recipe_nutrition_details", "recipe_details"):
+            if over_budget(prompt) and isinstance(fields[key], list): # raw scraped text, the LLM can make values up
+                steps.append(f"dropped raw {key}")
+                fields[key] = {}
+                prompt = render()
+        while over_budget(prompt) and len(fields["recipe_directions"]) > 1:
+            fields["recipe_directions"].pop()
+            prompt = render()
+            if "dropped trailing directions" not in steps:
+                steps.append("dropped trailing directions")
+
+        prompt_tokens = self.count_tokens(prompt)
+        self.log_writer.handle_logging(f"prompt for {recipe.recipe_url}: instruction tokens={instruction_tokens}, "
+                                       f"recipe tokens={prompt_tokens}, budget={self.max_input_tokens}"
+                                       + (f", trimmed: {', '.join(steps)}" if steps else ""))
+        if instruction_tokens + prompt_tokens > self.max_input_tokens:
+            self.log_writer.handle_logging(f"prompt for {recipe.recipe_url} is still over the input token budget", logging.WARNING)
+        return prompt
+
+
+prompt_builder = PromptBuilder(max_input_tokens=int(os.getenv("LLM_MAX_INPUT_TOKENS", pipeline_constants.LLM_MAX_INPUT_TOKENS)))
@@ -6,13 +6,43 @@ from langchain.schema.document import Document
 import json 
 from langchain.embeddings import HuggingFaceEmbeddings, SentenceTransformerEmbeddings
 from typing import List,Tuple ,Union, Any, Dict
+from src.handler_api.local_vector_index import LocalVectorIndex, maximal_marginal_relevance
+from src.handler_api.bm25_index import reciprocal_rank_fusion
+from src.handler_api.ingredient_vocabulary import IngredientVocabulary, IngredientSets
+from src.handler_api.pantry_reranker import PantryReranker
+from src.handler_api.payload_schema import create_payload_indexes, compile_filter, TYPED_PAYLOAD_MARKER
+from src.handler_api.recipe_store import RecipeStore, initialize_recipe_store, point_key
+from src.handler_api.embedding_batcher import EmbeddingBatcher
+from src.handler_api.bounded_executor import BoundedExecutor
+from src.handler_api.embedding_cache import EmbeddingCache, canonicalize_query
+from src.handler_api.recipe_models import RecipeResult, parse_payload_field
+from src.constants import pipeline_constants
+from qdrant_client.http import models
 import qdrant_client
+import numpy as np
+import asyncio
+import time
 import os 
 import logging 
 
 
 
 
+def format_recipe(metadata: Dict) -> RecipeResult:
+    """
+    maps stored document metadata to the typed recipe the endpoints (and the LLM prompt) work with.
+    """
+    return RecipeResult.from_metadata(metadata)
+
+
+def payload_to_document(payload: Dict) -> Document:
+    return Document(page_content=payload.get("page_content", ""), metadata=payload.get("metadata") or {})
+
+
+def point_to_document(point: Any) -> Document:
+    return payload_to_document(point.payload)
+
+
 class QdrantVectorRetrieverPipeline:
 
     @handle_exceptions
@@ -24,11 +54,48 @@ class QdrantVectorRetrieverPipeline:
         
         self.log_writer = AppLogger("DocumentToQdrantPipeline")
         self.client = None
-        self.vector_store = Union[Qdrant, None] # update this to be Qdrant
+        self.async_client = None
+        self.collection_name = None
+        self.retrieval_mode = "dense" # "dense" (mmr) or "hybrid" (dense + bm25, rrf)
+        self.sparse_index = None # local snapshot providing bm25 for the remote backend in hybrid mode
+        self.typed_payload = False # the collection carries the typed keyword/number fields, filters are compiled against them
+        self.recipe_store: Union[RecipeStore, None] = None # full recipe bodies by point id, searches then fetch lean payloads
+        self.vector_store = Union[Qdrant, LocalVectorIndex, None] # update this to be Qdrant
         self.model_name = model_name
         self.model_kwargs = model_kwargs
         self.encode_kwargs = encode_kwargs
         self.embedder = self.initialize_embedding_func()
+        # embedding is CPU-bound, it runs on a small dedicated pool so the event loop never waits on the model
+        self.embedding_executor = BoundedExecutor(
+            max_workers=int(os.getenv("EMBEDDING_EXECUTOR_WORKERS", pipeline_constants.EMBEDDING_EXECUTOR_WORKERS)),
+            max_queue=int(os.getenv("EMBEDDING_EXECUTOR_MAX_QUEUE", pipeline_constants.EMBEDDING_EXECUTOR_MAX_QUEUE)),
+            thread_name_prefix="query-embedder")
+        # local index searches (matrix products, graph walks, bm25) run on their own pool, off the event loop
+        self.search_executor = BoundedExecutor(
+            max_workers=int(os.getenv("SEARCH_EXECUTOR_WORKERS", pipeline_constants.SEARCH_EXECUTOR_WORKERS)),
+            max_queue=int(os.getenv("SEARCH_EXECUTOR_MAX_QUEUE", pipeline_constants.SEARCH_EXECUTOR_MAX_QUEUE)),
+            thread_name_prefix="local-search")
+        self.embedding_batcher = EmbeddingBatcher(
+            self.embedder,
+            executor=self.embedding_executor,
+            window_ms=float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", pipeline_constants.EMBEDDING_BATCH_WINDOW_MS)),
+            max_batch_size=int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", pipeline_constants.EMBEDDING_MAX_BATCH_SIZE)))
+        # maps user ingredients to the canonical ids stored with every recipe, read-only at query time and reloaded
+        # when ingestion rewrites the file (see refresh_ingredient_vocabulary)
+        self.ingredient_vocabulary_path = os.getenv("INGREDIENT_VOCABULARY_PATH", pipeline_constants.INGREDIENT_VOCABULARY_PATH)
+        self.ingredient_vocabulary_reload_seconds = float(os.getenv("INGREDIENT_VOCABULARY_RELOAD_SECONDS", pipeline_constants.INGREDIENT_VOCABULARY_RELOAD_SECONDS))
+        self.ingredient_vocabulary_mtime = self.vocabulary_file_mtime()
+        self.ingredient_vocabulary_checked_at = time.monotonic()
+        self.ingredient_vocabulary = IngredientVocabulary.load_or_create(self.ingredient_vocabulary_path)
+        self.rerank_pool_size = int(os.getenv("RERANK_POOL_SIZE", pipeline_constants.RERANK_POOL_SIZE))
+        self.reranker = PantryReranker(
+            vector_weight=float(os.getenv("RERANK_VECTOR_WEIGHT", pipeline_constants.RERANK_VECTOR_WEIGHT)),
+            coverage_weight=float(os.getenv("RERANK_COVERAGE_WEIGHT", pipeline_constants.RERANK_COVERAGE_WEIGHT)),
+            missing_weight=float(os.getenv("RERANK_MISSING_WEIGHT", pipeline_constants.RERANK_MISSING_WEIGHT)),
+            max_missing=int(os.getenv("RERANK_MAX_MISSING", pipeline_constants.RERANK_MAX_MISSING)))
+        self.embedding_cache = EmbeddingCache(
+            max_size=int(os.getenv("EMBEDDING_CACHE_MAX_SIZE", pipeline_constants.EMBEDDING_CACHE_MAX_SIZE)),
+            ttl_seconds=float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", pipeline_constants.EMBEDDING_CACHE_TTL_SECONDS)))
 
     @handle_exceptions
     def initialize_embedding_func(self):
@@ -57,17 +124,395 @@ class QdrantVectorRetrieverPipeline:
 
 
         self.client = qdrant_client.QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY,)
+        # the request path searches through the async client, the sync one is kept for exports and the langchain store
+        self.async_client = qdrant_client.AsyncQdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY,)
+        self.collection_name = QDRANT_COLLECTION_NAME
             
         self.vector_store = Qdrant(
             client=self.client,
             collection_name=QDRANT_COLLECTION_NAME,
             embeddings=self.embedder)
         self.log_writer.handle_logging(f"Qdrant vector store initialized for collection: {QDRANT_COLLECTION_NAME}")
+        self.initialize_payload_schema()
+
+    @handle_exceptions
+    def initialize_payload_schema(self):
+        """
+        creates the missing payload indexes of the typed schema and checks whether the collection was ingested with it.
+        collections without the typed fields keep being filtered with page_content text matches.
+        """
+        created = create_payload_indexes(self.client, self.collection_name)
+        points, _ = self.client.scroll(collection_name=self.collection_name, limit=1, with_payload=True, with_vectors=False)
+        self.typed_payload = bool(points) and TYPED_PAYLOAD_MARKER in (points[0].payload.get("metadata") or {})
+        self.log_writer.handle_logging(f"payload indexes created: {created}, typed payload filters: {self.typed_payload}")
+        if self.typed_payload and not self.ingredient_vocabulary.tokens:
+            self.log_writer.handle_logging("the ingredient vocabulary has no corpus tokens (missing or old INGREDIENT_VOCABULARY_PATH file), "
+                                           "allergens are excluded with page_content text matches", logging.WARNING)
+
+    @handle_exceptions
+    def initialize_recipe_store(self):
+        """
+        lean payload mode for the remote backend: qdrant searches return ids, scores and the LEAN_PAYLOAD_FIELDS only,
+        the bodies of the final results are read from the local RecipeStore. points it misses are fetched from qdrant and written back.
+        the mode is only enabled once the store holds as many recipes as the collection (export_recipe_store or ingestion
+        filled it), before that every search would pay an extra retrieve and a store write.
+        """
+        store = initialize_recipe_store()
+        stored, points = store.size(), self.client.count(collection_name=self.collection_name, exact=True).count
+        if stored < points:
+            store.close()
+            self.log_writer.handle_logging(f"recipe store at {store.db_path} holds {stored} of {points} recipes, lean payload mode stays off "
+                                           f"until export_recipe_store has filled it", logging.WARNING)
+            return
+        self.recipe_store = store
+        self.log_writer.handle_logging(f"recipe store opened at {store.db_path}, # of recipes: {stored}")
+
+    @handle_exceptions
+    def export_recipe_store(self):
+        """
+        copies every payload of the remote collection into the recipe store, call initialize_qdrant_client first.
+        """
+        store = self.recipe_store or initialize_recipe_store()
+        copied = store.sync_from_qdrant(self.client, self.collection_name)
+        self.log_writer.handle_logging(f"{copied} recipes copied from {self.collection_name} to {store.db_path}")
+        return store
+
+    @handle_exceptions
+    def initialize_local_index(self, index_dir:str=pipeline_constants.LOCAL_INDEX_DIR, ef_search:int=None):
+        """
+        alternative to initialize_qdrant_client: serves similarity_search from the in-process LocalVectorIndex
+        snapshot in index_dir instead of the remote collection, no network round-trip on the hot path.
+        the index is memory-mapped read-only, so every uvicorn worker shares one copy (and the hnsw graph, if built) in the page cache.
+        """
+        self.vector_store = LocalVectorIndex.load(index_dir, embedder=self.embedder, mmap=True, ef_search=ef_search)
+        self.log_writer.handle_logging(f"local vector index loaded from {index_dir}, # of vectors: {len(self.vector_store)}, "
+                                       f"hnsw: {self.vector_store.ann_index.stats() if self.vector_store.ann_index is not None else None}, "
+                                       f"bitmap index: {self.vector_store.bitmap_index.stats()}")
+
+    @handle_exceptions
+    def initialize_sparse_index(self, index_dir:str=pipeline_constants.LOCAL_INDEX_DIR):
+        """
+        hybrid mode with the remote backend: loads the snapshot in index_dir (memory-mapped) for its bm25 index and payloads.
+        the snapshot has to be exported from the same collection, sparse hits are matched to qdrant points by id.
+        """
+        self.sparse_index = LocalVectorIndex.load(index_dir, embedder=self.embedder, mmap=True)
+        self.log_writer.handle_logging(f"bm25 index loaded from {index_dir}: {self.sparse_index.bm25_index.stats()}")
+
+    @handle_exceptions
+    def export_local_index(self, index_dir:str=pipeline_constants.LOCAL_INDEX_DIR, build_ann_index:bool=False):
+        """
+        snapshots the remote qdrant collection into index_dir, call initialize_qdrant_client first.
+        build_ann_index=True also builds the hnsw graph next to the vectors.
+        """
+        local_index = LocalVectorIndex.from_qdrant(self.client, self.collection_name, embedder=self.embedder)
+        if build_ann_index:
+            local_index.build_ann_index(M=pipeline_constants.HNSW_M, ef_construction=pipeline_constants.HNSW_EF_CONSTRUCTION,
+                                        ef_search=pipeline_constants.HNSW_EF_SEARCH)
+            self.log_writer.handle_logging(f"hnsw graph built, recall@10 against exact search: {local_index.ann_recall(k=10):.3f}")
+        local_index.save(index_dir)
+        self.log_writer.handle_logging(f"{len(local_index)} vectors exported from {self.collection_name} to {index_dir}")
+        return local_index
+
 
+    def vocabulary_file_mtime(self) -> Union[float, None]:
+        return os.path.getmtime(self.ingredient_vocabulary_path) if os.path.exists(self.ingredient_vocabulary_path) else None
 
-    async def similarity_search(self, query: Union[str, List[str]], k:int = 3, filter=None):
-        print("query: ", query)
-        print("filter: ", filter)
+    def refresh_ingredient_vocabulary(self) -> IngredientVocabulary:
+        """
+        the ingredient vocabulary, reloaded when ingestion wrote its file after it was read (checked at most every
+        ingredient_vocabulary_reload_seconds), so ids assigned by a later ingestion are known without a restart.
+        a file caught mid-write keeps the current vocabulary until the next check.
+        """
+        now = time.monotonic()
+        if now - self.ingredient_vocabulary_checked_at < self.ingredient_vocabulary_reload_seconds:
+            return self.ingredient_vocabulary
+        self.ingredient_vocabulary_checked_at = now
+        mtime = self.vocabulary_file_mtime()
+        if mtime is not None and mtime != self.ingredient_vocabulary_mtime:
+            try:
+                self.ingredient_vocabulary = IngredientVocabulary.load(self.ingredient_vocabulary_path)
+                self.ingredient_vocabulary_mtime = mtime
+                self.log_writer.handle_logging(f"reloaded the ingredient vocabulary: {len(self.ingredient_vocabulary)} ingredients")
+            except (OSError, ValueError, KeyError) as e:
+                self.log_writer.handle_logging(f"could not reload the ingredient vocabulary, keeping the current one: {e}", logging.WARNING)
+        return self.ingredient_vocabulary
+
+    def compile_filter(self, preferences: List[str], allergens: List[str], ranges: Dict[str, Dict[str, float]] = None) -> Dict:
+        """
+        the search filter for a request. the remote collection is filtered on its indexed keyword/number fields when it
+        has them; the local index keeps the page_content text conditions, its bitmap index already answers them without a scan.
+        the bitmap index is therefore only used with VECTOR_BACKEND=local, the remote backend relies on qdrant's payload indexes.
+        """
+        vocabulary = self.refresh_ingredient_vocabulary()
+        if isinstance(self.vector_store, LocalVectorIndex):
+            filter = compile_filter(preferences, allergens, vocabulary, typed=False)
+            filter["must"] += compile_filter([], [], vocabulary, ranges=ranges)["must"]
+            return filter
+        return compile_filter(preferences, allergens, vocabulary, typed=self.typed_payload, ranges=ranges)
+
+    async def embed_query(self, query: str) -> List[float]:
+        """
+        returns the embedding of the canonical form of the query, from the cache when possible.
+        on a miss the query is embedded through the batcher together with other concurrent misses.
+        """
+        canonical_query = canonicalize_query(query)
+        embedding = self.embedding_cache.get(canonical_query)
+        if embedding is None:
+            embedding = await self.embedding_batcher.embed_query(canonical_query)
+            self.embedding_cache.put(canonical_query, embedding)
+        return embedding
+
+    async def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """
+        embed_query for a batch of queries: the distinct cache misses are embedded in one model call.
+        """
+        canonical_queries = [canonicalize_query(query) for query in queries]
+        embeddings = {query: self.embedding_cache.get(query) for query in canonical_queries}
+        misses = [query for query, embedding in embeddings.items() if embedding is None]
+        if misses:
+            vectors = await self.embedding_executor.run(self.embedder.embed_documents, misses)
+            for query, embedding in zip(misses, vectors):
+                self.embedding_cache.put(query, embedding)
+                embeddings[query] = embedding
+        return [embeddings[query] for query in canonical_queries]
+
+    def payload_selector(self, rerank: bool = False, user_ingredients: List[str] = None) -> Union[bool, models.PayloadSelectorInclude]:
+        """
+        the payload a qdrant search returns per candidate: everything without a recipe store, otherwise only what
+        ranking reads (the ingredient ids for the pantry reranker, nothing for mmr and fusion). the ingredient lines are
+        added when the vocabulary cannot map some of the user's ingredients, the reranker then matches them as text.
+        """
+        if self.recipe_store is None:
+            return True
+        if not rerank:
+            return False
+        fields = list(pipeline_constants.LEAN_PAYLOAD_FIELDS)
+        if user_ingredients and self.refresh_ingredient_vocabulary().unknown_terms(user_ingredients):
+            fields.append("metadata.recipe_ingredients_formatted")
+        return models.PayloadSelectorInclude(include=fields)
+
+    async def query_collection(self, embedding: List[float], limit: int, filter: Dict = None, with_vectors: bool = False,
+                               with_payload: Union[bool, models.PayloadSelectorInclude] = True) -> List[Any]:
+        response = await self.async_client.query_points(
+            collection_name=self.collection_name,
+            query=embedding,
+            query_filter=models.Filter(**filter) if filter else None,
+            limit=limit,
+            with_payload=with_payload,
+            with_vectors=with_vectors)
+        return response.points
+
+    async def query_collection_batch(self, embeddings: List[List[float]], limits: List[int], filters: List[Dict],
+                                     with_vectors: List[bool], with_payloads: List[Union[bool, models.PayloadSelectorInclude]]) -> List[List[Any]]:
+        """
+        query_collection for several queries in one request (one round-trip, one search round on the server).
+        """
+        responses = await self.async_client.query_batch_points(
+            collection_name=self.collection_name,
+            requests=[models.QueryRequest(query=embedding, filter=models.Filter(**filter) if filter else None, limit=limit,
+                                          with_payload=payload, with_vector=vectors)
+                      for embedding, limit, filter, vectors, payload in zip(embeddings, limits, filters, with_vectors, with_payloads)])
+        return [response.points for response in responses]
+
+    async def point_documents(self, points: List[Any]) -> Dict[Any, Document]:
+        """
+        documents of the selected points keyed by point id. in lean payload mode their bodies are read from the recipe
+        store in one lookup, the ones it misses are retrieved from qdrant and written back; points found nowhere are left out.
+        """
+        if self.recipe_store is None:
+            return {point.id: point_to_document(point) for point in points}
+        payloads = self.recipe_store.get_many([point.id for point in points])
+        missing = list({point.id for point in points if point_key(point.id) not in payloads})
+        if missing:
+            fetched = await self.async_client.retrieve(collection_name=self.collection_name, ids=missing, with_payload=True, with_vectors=False)
+            self.recipe_store.put_many([point.id for point in fetched], [point.payload for point in fetched])
+            payloads.update({point_key(point.id): point.payload for point in fetched})
+        return {point.id: payload_to_document(payloads[point_key(point.id)]) for point in points if point_key(point.id) in payloads}
+
+    async def to_documents(self, points: List[Any]) -> List[Document]:
+        documents = await self.point_documents(points)
+        return [documents[point.id] for point in points if point.id in documents]
+
+    @staticmethod
+    def mmr_points(points: List[Any], k: int, lambda_mult: float = 0.5) -> List[Any]:
+        if not points:
+            return []
+        candidates = LocalVectorIndex.normalize(np.array([point.vector for point in points], dtype=np.float32))
+        scores = np.array([point.score for point in points], dtype=np.float32)
+        selected = maximal_marginal_relevance(scores, candidates, k, lambda_mult)
+        return [points[i] for i in selected]
+
+    async def search_by_vector(self, embedding: List[float], k: int = 3, fetch_k: int = 20, lambda_mult: float = 0.5, filter: Dict = None,
+                               query: str = None) -> List[Document]:
+        """
+        mmr search (or rrf-fused dense + bm25 search in hybrid mode, when the query text is given) for an already computed query embedding.
+        the local index is searched on the search executor (a matrix product or graph walk, no I/O); the remote collection
+        is queried through the async qdrant client. either way the event loop keeps serving other requests meanwhile.
+        """
+        if self.retrieval_mode == "hybrid" and query is not None:
+            return await self.hybrid_search(embedding, query, k=k, fetch_k=fetch_k, filter=filter)
+
+        if isinstance(self.vector_store, LocalVectorIndex):
+            return await self.search_executor.run(self.vector_store.max_marginal_relevance_search_by_vector, embedding, k, fetch_k, lambda_mult, filter)
+
+        points = await self.query_collection(embedding, max(k, fetch_k), filter, with_vectors=True, with_payload=self.payload_selector())
+        return await self.to_documents(self.mmr_points(points, k, lambda_mult))
+
+    def pool_user_ids(self, user_ingredients: List[str], ids: np.ndarray, payloads: List[Dict]) -> np.ndarray:
+        """
+        the ids the reranker counts as the user's for a pool of candidates: the ids of the user's ingredients, plus the
+        ids of candidate lines naming one of them where the vocabulary cannot map it (missing or older file, see
+        IngredientVocabulary.text_covered_lines), so an outdated vocabulary does not zero the pantry coverage.
+        candidates whose payload has no ingredient lines (lean payloads) keep the id match only.
+        """
+        vocabulary = self.refresh_ingredient_vocabulary()
+        user_ids = vocabulary.query_ids(user_ingredients)
+        if vocabulary.unknown_terms(user_ingredients) or ids.max(initial=-1) >= len(vocabulary):
+            for payload in payloads:
+                metadata = payload.get("metadata") or {}
+                lines = parse_payload_field(metadata.get("recipe_ingredients_formatted"), list)
+                line_ids = parse_payload_field(metadata.get("recipe_ingredient_ids"), list)
+                if len(lines) == len(line_ids):
+                    covered = vocabulary.text_covered_lines(user_ingredients, lines, line_ids)
+                    user_ids.update(i for line_covered, line in zip(covered, line_ids) if line_covered for i in line)
+        return np.fromiter(user_ids, dtype=np.int32, count=len(user_ids))
+
+    def rerank_rows(self, rows: np.ndarray, relevance: np.ndarray, user_ingredients: List[str], k: int) -> List[Document]:
+        """
+        the k best of a pool of local index rows, ingredient id sets read from the index.
+        """
+        store = self.vector_store
+        ids, lengths = store.ingredient_sets.gather(rows)
+        user_ids = self.pool_user_ids(user_ingredients, ids, [store.payloads[row] for row in rows])
+        order = self.reranker.rerank(ids, lengths, relevance, user_ids)[:k]
+        return [store.to_document(row) for row in rows[order]]
+
+    def rerank_payloads(self, payloads: List[Dict], relevance: np.ndarray, user_ingredients: List[str], k: int) -> np.ndarray:
+        """
+        positions of the k best of a pool of candidates, ingredient id sets read from their (lean) payloads.
+        """
+        ids, lengths = IngredientSets.flatten([IngredientSets.payload_ids(payload) for payload in payloads])
+        user_ids = self.pool_user_ids(user_ingredients, ids, payloads)
+        return self.reranker.rerank(ids, lengths, relevance, user_ids)[:k]
+
+    def rerank_local(self, embedding: List[float], user_ingredients: List[str], k: int, filter: Dict, query: str, pool: int) -> List[Document]:
+        """
+        rerank_search on the local index, run on the search executor.
+        """
+        store = self.vector_store
+        if query is not None:
+            rows = np.asarray(store.hybrid_rows(embedding, query, k=pool, fetch_k=pool, filter=filter), dtype=np.int64)
+            relevance = -np.arange(len(rows), dtype=np.float32) # fused rank
+        else:
+            rows, relevance = store.top_rows(embedding, pool, filter)
+        return self.rerank_rows(rows, relevance, user_ingredients, k)
+
+    async def rerank_search(self, embedding: List[float], user_ingredients: List[str], k: int = 3, filter: Dict = None,
+                            query: str = None) -> List[Document]:
+        """
+        fetches a pool of rerank_pool_size candidates (dense, or hybrid when the query text is given) and returns the k
+        recipes the PantryReranker scores best for the user's ingredients. replaces mmr when the user sent ingredients.
+        """
+        pool = max(k, self.rerank_pool_size)
+        hybrid = self.retrieval_mode == "hybrid" and query is not None
+
+        if isinstance(self.vector_store, LocalVectorIndex):
+            return await self.search_executor.run(self.rerank_local, embedding, user_ingredients, k, filter, query if hybrid else None, pool)
+
+        if hybrid:
+            documents = await self.hybrid_search(embedding, query, k=pool, fetch_k=pool, filter=filter)
+            relevance = -np.arange(len(documents), dtype=np.float32)
+            order = self.rerank_payloads([{"metadata": document.metadata} for document in documents], relevance, user_ingredients, k)
+            return [documents[i] for i in order]
+
+        points = await self.query_collection(embedding, pool, filter, with_payload=self.payload_selector(rerank=True, user_ingredients=user_ingredients))
+        relevance = np.array([point.score for point in points], dtype=np.float32)
+        order = self.rerank_payloads([point.payload or {} for point in points], relevance, user_ingredients, k)
+        return await self.to_documents([points[i] for i in order])
+
+    async def search(self, embedding: List[float], query: str, k: int = 3, filter: Dict = None, user_ingredients: List[str] = None) -> List[Document]:
+        """
+        pantry reranked search when the user sent ingredients, mmr / hybrid search otherwise.
+        """
+        if user_ingredients and self.rerank_pool_size > 0:
+            return await self.rerank_search(embedding, user_ingredients, k=k, filter=filter, query=query)
+        return await self.search_by_vector(embedding, k=k, filter=filter, query=query)
+
+    async def search_batch(self, embeddings: List[List[float]], queries: List[str], filters: List[Dict],
+                           user_ingredients: List[List[str]], k: int = 3, fetch_k: int = 20, lambda_mult: float = 0.5) -> List[List[Document]]:
+        """
+        search for a batch of requests with a single vector search round: one matrix product over the local index or one
+        query_batch_points request to qdrant, then every item is reranked or mmr-selected on its own pool as search() does.
+        hybrid mode needs bm25 per item anyway, its items are searched concurrently instead.
+        """
+        if self.retrieval_mode == "hybrid":
+            return list(await asyncio.gather(*[self.search(embedding, query, k=k, filter=filter, user_ingredients=ingredients)
+                                                for embedding, query, filter, ingredients in zip(embeddings, queries, filters, user_ingredients)]))
+
+        rerank = [bool(ingredients) and self.rerank_pool_size > 0 for ingredients in user_ingredients]
+        limits = [max(k, self.rerank_pool_size) if item_rerank else max(k, fetch_k) for item_rerank in rerank]
+
+        if isinstance(self.vector_store, LocalVectorIndex):
+            return await self.search_executor.run(self.search_batch_local, embeddings, filters, user_ingredients, rerank, limits, k, lambda_mult)
+
+        results = []
+        point_lists = await self.query_collection_batch(embeddings, limits, filters, with_vectors=[not item_rerank for item_rerank in rerank],
+                                                        with_payloads=[self.payload_selector(rerank=item_rerank, user_ingredients=ingredients)
+                                                                       for item_rerank, ingredients in zip(rerank, user_ingredients)])
+        for points, item_rerank, ingredients in zip(point_lists, rerank, user_ingredients):
+            if item_rerank:
+                relevance = np.array([point.score for point in points], dtype=np.float32)
+                order = self.rerank_payloads([point.payload or {} for point in points], relevance, ingredients, k)
+                results.append([points[i] for i in order])
+            else:
+                results.append(self.mmr_points(points, k, lambda_mult))
+        # the bodies of every selected point of the batch are read in one lookup
+        documents = await self.point_documents([point for points in results for point in points])
+        return [[documents[point.id] for point in points if point.id in documents] for points in results]
+
+    def search_batch_local(self, embeddings: List[List[float]], filters: List[Dict], user_ingredients: List[List[str]], rerank: List[bool],
+                           limits: List[int], k: int, lambda_mult: float) -> List[List[Document]]:
+        """
+        search_batch on the local index, run on the search executor.
+        """
+        store = self.vector_store
+        results = []
+        pools = store.dense_rows_batch(embeddings, max(limits), [store.filter_mask(filter) for filter in filters])
+        for (rows, scores), limit, item_rerank, ingredients in zip(pools, limits, rerank, user_ingredients):
+            rows, scores = rows[:limit], scores[:limit]
+            if item_rerank:
+                results.append(self.rerank_rows(rows, scores, ingredients, k))
+            elif len(rows) == 0:
+                results.append([])
+            else:
+                selected = maximal_marginal_relevance(scores, np.asarray(store.vectors[rows]), k, lambda_mult)
+                results.append([store.to_document(row) for row in rows[selected]])
+        return results
+
+    async def hybrid_search(self, embedding: List[float], query: str, k: int = 3, fetch_k: int = 20, filter: Dict = None) -> List[Document]:
+        """
+        dense + bm25 retrieval fused with reciprocal rank fusion, so recipes that literally contain rare query ingredients
+        are not lost when the embedding ranks them low. with the remote backend the bm25 side is scored on the local
+        snapshot (sparse_index) while the qdrant request is in flight, results are matched by point id.
+        """
+        if isinstance(self.vector_store, LocalVectorIndex):
+            return await self.search_executor.run(self.vector_store.hybrid_search_by_vector, embedding, query, k, fetch_k, filter)
+
+        dense_task = asyncio.ensure_future(self.query_collection(embedding, max(k, fetch_k), filter, with_payload=self.payload_selector()))
+        rows, _ = await self.search_executor.run(self.sparse_index.sparse_rows, query, max(k, fetch_k), filter)
+        dense_points = await dense_task
+
+        sparse_ids = [self.sparse_index.ids[row] for row in rows]
+        fused = reciprocal_rank_fusion([[point.id for point in dense_points], sparse_ids])[:k]
+        # only the fused results are turned into documents, the dense ones read from the recipe store in lean payload mode
+        fused_ids = set(fused)
+        documents = await self.point_documents([point for point in dense_points if point.id in fused_ids])
+        for row, point_id in zip(rows, sparse_ids):
+            if point_id in fused_ids and point_id not in documents:
+                documents[point_id] = self.sparse_index.to_document(row)
+        return [documents[point_id] for point_id in fused if point_id in documents]
+
+    async def similarity_search(self, query: Union[str, List[str]], k:int = 3, filter=None, user_ingredients: List[str] = None):
         """
         Performs a similarity search on the given query and filters the results by metadata.
 
@@ -78,6 +523,7 @@ class QdrantVectorRetrieverPipeline:
         Returns:
         - A list of tuples containing the documents and their corresponding similarity scores.
         """
+        self.log_writer.handle_logging(f"query: {query}, filter: {filter}", logging.DEBUG)
                 
         if isinstance(query, list):
             query = "-".join(query) # concatenate list items to a string
@@ -85,7 +531,8 @@ class QdrantVectorRetrieverPipeline:
         if isinstance(query, str):
             try:
                 #print(self.vector_store)
-                results = self.vector_store.max_marginal_relevance_search(query, filter = filter, k=k)
+                embedding = await self.embed_query(query)
+                results = await self.search(embedding, query, k=k, filter=filter, user_ingredients=user_ingredients)
                 #print(results)
                 if len(results)<1: # check if the response from database is empty.
                     self.log_writer.handle_logging(f"no results found for {query}", logging.ERROR)
@@ -100,38 +547,106 @@ class QdrantVectorRetrieverPipeline:
             return None
         
     
-    async def post_process_results(self, search_results: List[Document]) -> List[Dict]:
+    async def similarity_search_batch(self, queries: List[str], filters: List[Dict], k: int = 3,
+                                      user_ingredients: List[List[str]] = None) -> List[Union[List[RecipeResult], None]]:
+        """
+        similarity_search for a batch of queries: one embedding model call for the cache misses and one vector search round.
+        returns one entry per query, None where nothing was found.
+        """
+        user_ingredients = user_ingredients or [None] * len(queries)
+        try:
+            embeddings = await self.embed_queries(queries)
+            batch_results = await self.search_batch(embeddings, queries, filters, user_ingredients, k=k)
+        except Exception as e:
+            self.log_writer.handle_logging(f"batch similarity search failed with error: {e}", logging.ERROR)
+            return [None] * len(queries)
+
+        formatted_results = []
+        for query, results in zip(queries, batch_results):
+            if len(results) < 1:
+                self.log_writer.handle_logging(f"no results found for {query}", logging.ERROR)
+                formatted_results.append(None)
+            else:
+                formatted_results.append(await self.post_process_results(results))
+        return formatted_results
+
+    async def post_process_results(self, search_results: List[Document]) -> List[RecipeResult]:
  
         formatted_results = []
         for document in search_results:
             try:
-                recipe = {
-                    'recipe_name': document.metadata.get('recipe_name', 'No name available'),
-                    'recipe_ingredients': document.metadata.get('recipe_ingredients_formatted', 'No ingredients available'),
-                    'recipe_directions': document.metadata.get('recipe_directions_formatted', 'No directions available'),
-                    'recipe_details': document.metadata.get('recipe_details_formatted', 'No details available'),
-                    'recipe_nutrition_details': document.metadata.get('recipe_nutrition_details_formatted', 'No nutrition details available'),
-                    'recipe_tags': document.metadata.get('recipe_tags_formatted', 'No tags available'),
-                    'recipe_image_url': document.metadata.get('recipe_img_url-src', 'No image available'),
-                    'recipe_url': document.metadata.get('recipe_card-href', 'No URL available')
-                }
+                recipe = format_recipe(document.metadata)
                 formatted_results.append(recipe)
-                print("OK")
             except AttributeError as e:
                 # Handle the case where the document does not have the expected attributes
                 self.log_writer.handle_logging(f"document {document} does not have the expected attributes, error: {e}", logging.ERROR)
                 return None
 
         return formatted_results
+
+    async def close(self) -> None:
+        await self.embedding_batcher.close()
+        self.embedding_executor.shutdown()
+        self.search_executor.shutdown()
+        if self.async_client is not None:
+            await self.async_client.close()
+        if self.recipe_store is not None:
+            self.recipe_store.close()
     
 
-def initialize_qdrant_vector_retriever():
+def initialize_qdrant_vector_retriever(backend:str=None):
+    """
+    backend: "qdrant" (remote collection) or "local" (in-process LocalVectorIndex snapshot: hnsw graph, bitmap filters).
+    defaults to the VECTOR_BACKEND environment variable, then "qdrant".
+    LEAN_PAYLOAD=true (remote backend) reads result bodies from the RECIPE_STORE_PATH store instead of the search responses.
+    RETRIEVAL_MODE=hybrid fuses bm25 with the dense search, the remote backend then also needs the LOCAL_INDEX_DIR snapshot.
+    """
     #MODEL PARAMETERS
     model_name = "sentence-transformers/all-MiniLM-L6-v2"
     model_kwargs = {'device': 'cpu'}
     encode_kwargs = {'normalize_embeddings': False}
 
+    load_dotenv()
+    backend = backend or os.getenv("VECTOR_BACKEND", "qdrant")
+
     pipeline = QdrantVectorRetrieverPipeline(model_name, model_kwargs, encode_kwargs)
-    pipeline.initialize_qdrant_client()
+    pipeline.retrieval_mode = os.getenv("RETRIEVAL_MODE", pipeline_constants.RETRIEVAL_MODE)
+    if backend == "local":
+        ef_search = os.getenv("HNSW_EF_SEARCH")
+        pipeline.initialize_local_index(os.getenv("LOCAL_INDEX_DIR", pipeline_constants.LOCAL_INDEX_DIR), int(ef_search) if ef_search else None)
+    else:
+        pipeline.initialize_qdrant_client()
+        if os.getenv("LEAN_PAYLOAD", str(pipeline_constants.LEAN_PAYLOAD)).lower() == "true":
+            pipeline.initialize_recipe_store()
+        if pipeline.retrieval_mode == "hybrid":
+            pipeline.initialize_sparse_index(os.getenv("LOCAL_INDEX_DIR", pipeline_constants.LOCAL_INDEX_DIR))
     pipeline.log_writer.handle_logging("vector retriever pipeline initialized successfully!")
-    return pipeline
\ No newline at end of file
+    return pipeline
+
+
+def export_local_vector_index(index_dir:str=pipeline_constants.LOCAL_INDEX_DIR, build_ann_index:bool=False):
+    """
+    builds the snapshot that initialize_qdrant_vector_retriever(backend="local") loads.
+    """
+    #MODEL PARAMETERS
+    model_name = "sentence-transformers/all-MiniLM-L6-v2"
+    model_kwargs = {'device': 'cpu'}
+    encode_kwargs = {'normalize_embeddings': False}
+
+    pipeline = QdrantVectorRetrieverPipeline(model_name, model_kwargs, encode_kwargs)
+    pipeline.initialize_qdrant_client()
+    return pipeline.export_local_index(index_dir, build_ann_index=build_ann_index)
+
+
+def export_recipe_store():
+    """
+    fills the recipe store LEAN_PAYLOAD mode reads result bodies from, run it once for collections ingested before the store existed.
+    """
+    #MODEL PARAMETERS
+    model_name = "sentence-transformers/all-MiniLM-L6-v2"
+    model_kwargs = {'device': 'cpu'}
+    encode_kwargs = {'normalize_embeddings': False}
+
+    pipeline = QdrantVectorRetrieverPipeline(model_name, model_kwargs, encode_kwargs)
+    pipeline.initialize_qdrant_client()
+    return pipeline.export_recipe_store()
@@ -0,0 +1,127 @@
+from typing import List, Dict, Union, Optional
+import re
+
+
+DETAIL_LABELS = {"prep": "prep", "cook": "cook", "total": "total", "active": "active", "servings": "servings", "yield": "yield", "level": "level"}
+NUTRITION_LABELS = {"calories": "calories", "total fat": "fat", "carbohydrates": "carbohydrate", "protein": "protein", "serving size": "serving_size"}
+NULL_VALUES = {"", "none", "null", "nutrition info"}
+DURATION_PATTERN = re.compile(r"(\d+)\s*(day|hr|hour|min)", re.IGNORECASE)
+NUMBER_PATTERN = re.compile(r"\d*\.?\d+")
+SERVINGS_PATTERN = re.compile(r"(?:serves\s*(\d+)|(\d+)(?:\s*(?:to|-|–)\s*\d+)?\s*(?:small|large|generous|hearty|main[- ]course|side[- ]dish|appetizer)?\s*servings?\b)",
+                              re.IGNORECASE)
+MINUTES_PER_UNIT = {"day": 1440, "hr": 60, "hour": 60, "min": 1}
+
+# typed payload fields written at ingestion, None when the source does not state the value
+RECIPE_FACT_FIELDS = [
+    "recipe_prep_minutes", "recipe_cook_minutes", "recipe_total_minutes", "recipe_servings",
+    "recipe_calories", "recipe_fat_grams", "recipe_carbohydrate_grams", "recipe_protein_grams",
+]
+
+
+def text_lines(value: Union[Dict, List, str, None]) -> List[str]:
+    """
+    the non-empty, stripped lines of a scraped details/nutrition field. dict fields become "key:" / value line pairs,
+    the form the list fields are scraped in, so both are read by the same label/value walk.
+    """
+    if isinstance(value, dict):
+        value = [f"{key}:\n{item}" for key, item in value.items()]
+    elif isinstance(value, str):
+        value = [value]
+    elif not isinstance(value, list):
+        return []
+    return [line.strip() for item in value for line in str(item).split("\n") if line.strip()]
+
+
+def label_values(lines: List[str], labels: Dict[str, str]) -> Dict[str, str]:
+    """
+    pairs every known label line ("Total:", "Calories") with the line following it, the first occurrence wins.
+    "Label: value" on a single line is accepted as well; lines that are neither (notes like "(includes rising time)") are skipped.
+    """
+    values = {}
+    pending = None
+    for line in lines:
+        label, _, rest = line.partition(":") if ":" in line else (line, "", "")
+        key = labels.get(label.strip().lower())
+        if key is not None:
+            pending = None
+            if rest.strip():
+                values.setdefault(key, rest.strip())
+            else:
+                pending = key
+        elif pending is not None:
+            values.setdefault(pending, line)
+            pending = None
+    return {key: value for key, value in values.items() if value.lower() not in NULL_VALUES}
+
+
+def parse_minutes(text: Optional[str]) -> Optional[int]:
+    """
+    "1 hr 20 min" -> 80, "10 hr" -> 600. None when the text holds no duration.
+    """
+    if not text:
+        return None
+    matches = DURATION_PATTERN.findall(text)
+    if not matches:
+        return None
+    return sum(int(amount) * MINUTES_PER_UNIT[unit.lower()] for amount, unit in matches)
+
+
+def parse_number(text: Optional[str]) -> Optional[float]:
+    match = NUMBER_PATTERN.search(text or "")
+    return float(match.group()) if match else None
+
+
+def parse_grams(text: Optional[str]) -> Optional[float]:
+    """
+    "14 g" / "4.5 grams" -> grams, "291 mg" / "58 milligrams" are converted.
+    """
+    amount = parse_number(text)
+    if amount is None:
+        return None
+    if re.search(r"\b(mg|milligrams?)\b", text, re.IGNORECASE):
+        amount /= 1000
+    return round(amount, 2)
+
+
+def parse_servings(*texts: Optional[str]) -> Optional[int]:
+    """
+    serving count from the first text stating one: "4" (servings field), "4 to 6 servings" -> 4, "4 small servings" -> 4,
+    "1 of 4 servings" -> 4, "serves 8" -> 8. yields in other units ("8 cups", "12 muffins") do not count as servings.
+    """
+    for text in texts:
+        if not text:
+            continue
+        if text.strip().isdigit():
+            return int(text.strip())
+        match = SERVINGS_PATTERN.search(text)
+        if match:
+            return int(match.group(1) or match.group(2))
+    return None
+
+
+def parse_recipe_facts(details: Union[Dict, List, str, None], nutrition: Union[Dict, List, str, None]) -> Dict:
+    """
+    the typed RECIPE_FACT_FIELDS of a recipe, parsed once from its scraped details and nutrition fields.
+    """
+    detail_values = label_values(text_lines(details), DETAIL_LABELS)
+    nutrition_values = label_values(text_lines(nutrition), NUTRITION_LABELS)
+    calories = parse_number(nutrition_values.get("calories"))
+    return {
+        "recipe_prep_minutes": parse_minutes(detail_values.get("prep")),
+        "recipe_cook_minutes": parse_minutes(detail_values.get("cook")),
+        "recipe_total_minutes": parse_minutes(detail_values.get("total")),
+        "recipe_servings": parse_servings(detail_values.get("servings"), detail_values.get("yield"), nutrition_values.get("serving_size")),
+        "recipe_calories": int(round(calories)) if calories is not None else None,
+        "recipe_fat_grams": parse_grams(nutrition_values.get("fat")),
+        "recipe_carbohydrate_grams": parse_grams(nutrition_values.get("carbohydrate")),
+        "recipe_protein_grams": parse_grams(nutrition_values.get("protein")),
+    }
+
+
+def format_minutes(minutes: int) -> str:
+    hours, minutes = divmod(minutes, 60)
+    return " ".join(part for part in (f"{hours} hr" if hours else "", f"{minutes} min" if minutes or not hours else "") if part)
+
+
+def format_grams(grams: float) -> str:
+    return f"{grams:g} g"
@@ -0,0 +1,162 @@
+from src.handler_api.recipe_details_parser import RECIPE_FACT_FIELDS, format_minutes, format_grams
+from pydantic import BaseModel, ConfigDict, ValidationError
+from typing import List, Dict, Any, Union, Optional, Tuple
+import hashlib
+import orjson
+import ast
+
+
+def parse_payload_field(value: Any, expected_type: Union[type, Tuple[type, ...]]) -> Any:
+    """
+    payloads written before ingestion kept native types store lists/dicts as their python repr, e.g. "['1 cup rice', '2 eggs']".
+    those are parsed once here with ast.literal_eval (never eval), native values pass through untouched.
+    falls back to an empty value of the (first) expected type.
+    """
+    expected_types = expected_type if isinstance(expected_type, tuple) else (expected_type,)
+    if isinstance(value, expected_types):
+        return value
+    if isinstance(value, str):
+        try:
+            parsed = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            parsed = None
+        if isinstance(parsed, expected_types):
+            return parsed
+        if list in expected_types and value and value != "None":
+            return [value]
+    return expected_types[0]()
+
+
+class RecipeResult(BaseModel):
+    """
+    a retrieved recipe as the endpoints (and the prompt builder) work with it, built from the stored document metadata.
+    """
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+
+    recipe_name: str = "No name available"
+    recipe_ingredients: List[str] = []
+    recipe_directions: List[str] = []
+    # some sources scraped details/nutrition as raw text lines instead of key-value pairs
+    recipe_details: Union[Dict[str, Optional[str]], List[str]] = {}
+    recipe_nutrition_details: Union[Dict[str, Optional[str]], List[str]] = {}
+    recipe_tags: List[str] = []
+    recipe_image_url: str = ""
+    recipe_url: str = ""
+    recipe_ingredient_ids: List[List[int]] = [] # canonical ingredient ids per ingredient line, empty for old payloads
+    # parsed from details/nutrition at ingestion, None when unknown or for old payloads
+    recipe_prep_minutes: Optional[int] = None
+    recipe_cook_minutes: Optional[int] = None
+    recipe_total_minutes: Optional[int] = None
+    recipe_servings: Optional[int] = None
+    recipe_calories: Optional[int] = None
+    recipe_fat_grams: Optional[float] = None
+    recipe_carbohydrate_grams: Optional[float] = None
+    recipe_protein_grams: Optional[float] = None
+
+    @classmethod
+    def from_metadata(cls, metadata: Dict) -> "RecipeResult":
+        return cls(
+            recipe_name=str(metadata.get("recipe_name", "No name available")),
+            recipe_ingredients=parse_payload_field(metadata.get("recipe_ingredients_formatted"), list),
+            recipe_directions=parse_payload_field(metadata.get("recipe_directions_formatted"), list),
+            recipe_details=parse_payload_field(metadata.get("recipe_details_formatted"), (dict, list)),
+            recipe_nutrition_details=parse_payload_field(metadata.get("recipe_nutrition_details_formatted"), (dict, list)),
+            recipe_tags=parse_payload_field(metadata.get("recipe_tags_formatted"), list),
+            recipe_image_url=str(metadata.get("recipe_img_url-src", "")),
+            recipe_url=str(metadata.get("recipe_card-href", "")),
+            recipe_ingredient_ids=parse_payload_field(metadata.get("recipe_ingredient_ids"), list),
+            **{field: metadata.get(field) for field in RECIPE_FACT_FIELDS})
+
+    def content_hash(self) -> str:
+        """
+        short hash of everything the LLM is given about the recipe, part of the translation cache key: a recipe whose
+        text changed at re-ingestion is formatted again instead of being served from the cache.
+        """
+        content = self.model_dump(exclude={"recipe_tags", "recipe_image_url", "recipe_url", "recipe_ingredient_ids"})
+        return hashlib.sha256(orjson.dumps(content, option=orjson.OPT_SORT_KEYS)).hexdigest()[:16]
+
+    def structured_details(self) -> Dict[str, str]:
+        """
+        the parsed details with the keys of the output schema, empty when nothing was parsed.
+        """
+        details = {
+            "Prep_time": format_minutes(self.recipe_prep_minutes) if self.recipe_prep_minutes is not None else None,
+            "CookTime": format_minutes(self.recipe_cook_minutes) if self.recipe_cook_minutes is not None else None,
+            "TotalTime": format_minutes(self.recipe_total_minutes) if self.recipe_total_minutes is not None else None,
+            "Servings": str(self.recipe_servings) if self.recipe_servings is not None else None,
+        }
+        return {key: value for key, value in details.items() if value is not None}
+
+    def structured_nutrition(self) -> Dict[str, str]:
+        """
+        the parsed nutrition facts with the keys of the output schema, empty when nothing was parsed.
+        """
+        nutrition = {
+            "Calories": str(self.recipe_calories) if self.recipe_calories is not None else None,
+            "Total Fat": format_grams(self.recipe_fat_grams) if self.recipe_fat_grams is not None else None,
+            "Carbohydrates": format_grams(self.recipe_carbohydrate_grams) if self.recipe_carbohydrate_grams is not None else None,
+            "Protein": format_grams(self.recipe_protein_grams) if self.recipe_protein_grams is not None else None,
+        }
+        return {key: value for key, value in nutrition.items() if value is not None}
+
+
+class FormattedRecipe(BaseModel):
+    """
+    the formatted/translated recipe returned by /get-recipe, the LLM fills everything but the urls and the shopping list.
+    """
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+
+    recipe_name: str
+    recipe_ingredients: List[str]
+    recipe_directions: List[str]
+    recipe_details: Dict[str, Optional[str]] = {}
+    recipe_nutrition_details: Dict[str, Optional[str]] = {}
+    shopping_list: List[str] = []
+    recipe_image_url: str = ""
+    recipe_url: str = ""
+    degraded: bool = False # formatted locally from the stored recipe because the LLM stage was unavailable
+
+    @classmethod
+    def from_llm_output(cls, text: Union[str, bytes, None]) -> Union["FormattedRecipe", None]:
+        """
+        parses the JSON-mode output of the LLM, None when it is missing or does not match the schema.
+        """
+        if not text:
+            return None
+        try:
+            return cls.model_validate(orjson.loads(text))
+        except (orjson.JSONDecodeError, ValidationError):
+            return None
+
+    @classmethod
+    def from_recipe(cls, recipe: RecipeResult, translations: Dict[str, str] = None) -> "FormattedRecipe":
+        """
+        degraded fallback built without the LLM: the stored recipe with whitespace cleaned up and null values dropped
+        (details/nutrition from the fields parsed at ingestion when available), ingredient lines found in `translations`
+        (the ingredient translation cache) translated, the rest as stored.
+        keeps one ingredient per stored line, so the shopping list can be taken from it.
+        """
+        translations = translations or {}
+
+        def clean(text: Any) -> str:
+            return " ".join(str(text).split())
+
+        def clean_details(details: Union[Dict, List]) -> Dict[str, str]:
+            if isinstance(details, list):
+                details = dict(line.split("\n", 1) if "\n" in line else (line, "") for line in map(str, details))
+            return {clean(key): clean(value) for key, value in details.items()
+                    if value is not None and clean(value) and clean(value).lower() not in ("none", "null")}
+
+        return cls(
+            recipe_name=clean(recipe.recipe_name),
+            recipe_ingredients=[translations.get(line, clean(line)) for line in recipe.recipe_ingredients],
+            recipe_directions=[clean(line) for line in recipe.recipe_directions if clean(line)],
+            recipe_details=recipe.structured_details() or clean_details(recipe.recipe_details),
+            recipe_nutrition_details=recipe.structured_nutrition() or clean_details(recipe.recipe_nutrition_details),
+            degraded=True)
+
+    def cache_value(self) -> Dict:
+        """
+        the cacheable, user independent part of the recipe.
+        """
+        return self.model_dump(exclude={"shopping_list", "recipe_image_url", "recipe_url", "degraded"})
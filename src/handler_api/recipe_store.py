@@ -0,0 +1,96 @@
+from src.constants import pipeline_constants
+from typing import Any, Dict, Iterable, List, Union
+import sqlite3
+import orjson
+import uuid
+import os
+
+
+def point_key(point_id: Union[str, int]) -> str:
+    """
+    qdrant returns uuid ids in their dashed form whatever form they were written in, both map to the same key.
+    """
+    try:
+        return str(uuid.UUID(str(point_id)))
+    except ValueError:
+        return str(point_id)
+
+
+class RecipeStore:
+    """
+    read-optimized sqlite store of full recipe payloads ({"page_content", "metadata"}) keyed by qdrant point id.
+    the vector search only returns ids, scores and the few fields ranking needs; the bodies of the final results
+    are read from here, so long ingredient/direction strings of discarded candidates never cross the wire and bodies
+    can be corrected in place without re-embedding.
+    """
+
+    def __init__(self, db_path: str) -> None:
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+
+        # autocommit mode + WAL so several uvicorn workers can read while ingestion writes
+        self.connection = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS recipes (point_id TEXT PRIMARY KEY, payload BLOB NOT NULL) WITHOUT ROWID")
+
+    def get_many(self, point_ids: List[Union[str, int]]) -> Dict[str, Dict]:
+        """
+        payloads of the given points keyed by point_key, missing ones are simply absent from the result.
+        """
+        keys = list(dict.fromkeys(point_key(point_id) for point_id in point_ids))
+        if not keys:
+            return {}
+        placeholders = ",".join("?" * len(keys))
+        rows = self.connection.execute(f"SELECT point_id, payload FROM recipes WHERE point_id IN ({placeholders})", keys).fetchall()
+        self.hits += len(rows)
+        self.misses += len(keys) - len(rows)
+        return {key: orjson.loads(payload) for key, payload in rows}
+
+    def put_many(self, point_ids: Iterable[Union[str, int]], payloads: Iterable[Dict]) -> None:
+        self.connection.execute("BEGIN")
+        try:
+            self.connection.executemany("INSERT OR REPLACE INTO recipes VALUES (?, ?)",
+                                        [(point_key(point_id), orjson.dumps(payload)) for point_id, payload in zip(point_ids, payloads)])
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    def delete_many(self, point_ids: Iterable[Union[str, int]]) -> int:
+        return self.connection.executemany("DELETE FROM recipes WHERE point_id=?", [(point_key(point_id),) for point_id in point_ids]).rowcount
+
+    def sync_from_qdrant(self, client: Any, collection_name: str, batch_size: int = 256) -> int:
+        """
+        copies every payload of the collection into the store with the sync qdrant client, returns the # of points copied.
+        """
+        copied = 0
+        offset = None
+        while True:
+            points, offset = client.scroll(collection_name=collection_name, limit=batch_size, offset=offset,
+                                           with_payload=True, with_vectors=False)
+            self.put_many([point.id for point in points], [point.payload for point in points])
+            copied += len(points)
+            if offset is None:
+                return copied
+
+    def size(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM recipes").fetchone()[0]
+
+    def metrics(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": self.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def initialize_recipe_store() -> RecipeStore:
+    return RecipeStore(os.getenv("RECIPE_STORE_PATH", pipeline_constants.RECIPE_STORE_PATH))
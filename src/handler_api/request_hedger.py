@@ -0,0 +1,142 @@
+from typing import Any, Awaitable, Callable, Dict, Set
+from collections import deque
+import numpy as np
+import asyncio
+import random
+import time
+
+
+class Deadline:
+    """
+    absolute end time of a request, created once by the endpoint and passed down to every upstream call,
+    so each call gets what is left of the request budget instead of its own fixed timeout.
+    """
+
+    def __init__(self, seconds: float) -> None:
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def limit(self, seconds: float) -> "Deadline":
+        """
+        a deadline at most `seconds` from now and never later than this one, for one stage of the request.
+        """
+        deadline = Deadline(seconds)
+        deadline.expires_at = min(deadline.expires_at, self.expires_at)
+        return deadline
+
+
+class RequestHedger:
+    """
+    runs an idempotent async call within a deadline, cutting the latency tail:
+        - hedging: when the first attempt is still pending after the hedge_percentile latency of recent calls, a second
+          identical attempt is sent and whichever succeeds first wins, the other one is cancelled.
+          at most max_hedge_rate of the calls hedge, so an upstream that is slow overall does not get twice the load.
+        - retries: failed attempts accepted by `retryable` are retried after a full-jitter exponential backoff, only
+          while the backoff still fits in the remaining budget.
+    the call receives the seconds it may take (remaining budget) as its only argument.
+    """
+
+    def __init__(self, hedge_percentile: float = 95, min_hedge_delay: float = 1.0, default_hedge_delay: float = 10.0,
+                 min_samples: int = 20, window: int = 500, max_hedge_rate: float = 0.1, max_attempts: int = 3,
+                 backoff_base: float = 0.5, backoff_max: float = 4.0,
+                 retryable: Callable[[BaseException], bool] = lambda e: True) -> None:
+        self.hedge_percentile = hedge_percentile # 0 disables hedging
+        self.min_hedge_delay = min_hedge_delay
+        self.default_hedge_delay = default_hedge_delay
+        self.min_samples = min_samples
+        self.latencies = deque(maxlen=window)
+        self.max_hedge_rate = max_hedge_rate
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retryable = retryable
+        self.calls = 0
+        self.attempts = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.retries = 0
+        self.failures = 0
+        self.deadline_exceeded = 0
+
+    def hedge_delay(self) -> float:
+        if len(self.latencies) < self.min_samples:
+            return self.default_hedge_delay
+        return max(float(np.percentile(self.latencies, self.hedge_percentile)), self.min_hedge_delay)
+
+    def can_hedge(self) -> bool:
+        return self.hedge_percentile > 0 and self.hedges < self.max_hedge_rate * self.calls
+
+    async def run(self, call: Callable[[float], Awaitable[Any]], deadline: Deadline) -> Any:
+        self.calls += 1
+        error: BaseException = asyncio.TimeoutError("request deadline exceeded")
+        for attempt in range(self.max_attempts):
+            if deadline.expired():
+                break
+            try:
+                return await self.hedged_attempt(call, deadline)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = e
+                if not self.retryable(e):
+                    break
+            backoff = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+            if attempt + 1 >= self.max_attempts or backoff >= deadline.remaining():
+                break
+            self.retries += 1
+            await asyncio.sleep(backoff)
+
+        if deadline.expired():
+            self.deadline_exceeded += 1
+        self.failures += 1
+        raise error
+
+    async def hedged_attempt(self, call: Callable[[float], Awaitable[Any]], deadline: Deadline) -> Any:
+        started = time.monotonic()
+        self.attempts += 1
+        primary = asyncio.ensure_future(call(deadline.remaining()))
+        tasks: Set[asyncio.Future] = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=min(self.hedge_delay(), deadline.remaining()))
+            if not done and not deadline.expired() and self.can_hedge():
+                self.hedges += 1
+                self.attempts += 1
+                tasks.add(asyncio.ensure_future(call(deadline.remaining())))
+
+            error = None
+            pending = tasks
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=deadline.remaining(), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise asyncio.TimeoutError("request deadline exceeded")
+                for task in done:
+                    if task.exception() is None:
+                        # a hedge win leaves the primary unfinished, its latency is at least the time waited so far
+                        self.latencies.append(time.monotonic() - started)
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def metrics(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "attempts": self.attempts,
+            "hedges": self.hedges,
+            "hedge_rate": self.hedges / self.calls if self.calls else 0.0,
+            "hedge_wins": self.hedge_wins,
+            "hedge_win_rate": self.hedge_wins / self.hedges if self.hedges else 0.0,
+            "hedge_delay_seconds": self.hedge_delay(),
+            "retries": self.retries,
+            "failures": self.failures,
+            "deadline_exceeded": self.deadline_exceeded,
+        }
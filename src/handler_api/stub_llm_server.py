@@ -0,0 +1,62 @@
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+import uvicorn
+import asyncio
+import json
+import os
+
+#local stand-in for the chat completions API, so the pre-translation job and the endpoints can run offline.
+#start it with `uvicorn src.handler_api.stub_llm_server:app --port 8001`
+#and set OPENAI_BASE_URL=http://localhost:8001/v1
+#STUB_LLM_LATENCY_MS adds an artificial delay to every response.
+
+app = FastAPI()
+
+
+def fake_completion(prompt: str) -> str:
+    """
+    echoes the recipe (sent as JSON) in the JSON output format instruction_prompt asks for, without translating anything.
+    a JSON list prompt is an item translation request (item_translation_prompt), answered with {"items": [...]}.
+    """
+    try:
+        recipe = json.loads(prompt)
+    except ValueError:
+        recipe = {}
+    if isinstance(recipe, list):
+        return json.dumps({"items": [f"[translated] {item}" for item in recipe]}, ensure_ascii=False)
+
+    return json.dumps({
+        "recipe_name": recipe.get("recipe_name", "stub recipe"),
+        "recipe_ingredients": recipe.get("recipe_ingredients", []),
+        "recipe_directions": recipe.get("recipe_directions", []),
+        "recipe_details": {"Prep_time": "10 min", "CookTime": "20 min", "TotalTime": "30 min", "Servings": "4"},
+        "recipe_nutrition_details": {"Calories": "400", "Total Fat": "10 g", "Carbohydrates": "50 g", "Protein": "20 g"},
+    }, ensure_ascii=False)
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    await asyncio.sleep(float(os.getenv("STUB_LLM_LATENCY_MS", 0)) / 1000.0)
+    prompt = body["messages"][-1]["content"]
+    content = fake_completion(prompt)
+
+    if body.get("stream"):
+        async def chunks():
+            for start in range(0, len(content), 20):
+                delta = {"choices": [{"index": 0, "delta": {"content": content[start:start+20]}, "finish_reason": None}]}
+                yield f"data: {json.dumps(delta)}\n\n"
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    return {
+        "id": "stub-completion",
+        "object": "chat.completion",
+        "model": body.get("model", "stub"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4, "total_tokens": (len(prompt) + len(content)) // 4},
+    }
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -0,0 +1,167 @@
+from src.constants import pipeline_constants
+from typing import Dict, List, Union
+import hashlib
+import sqlite3
+import json
+import time
+import os
+
+
+def get_prompt_version(prompt_templates: List[str]) -> str:
+    """
+    short content hash of every prompt template that shapes a cached answer, part of every cache key so editing any of
+    them invalidates old entries.
+    """
+    return hashlib.sha256("\x00".join(prompt_templates).encode("utf-8")).hexdigest()[:12]
+
+
+class TranslationCache:
+    """
+    durable sqlite cache of LLM-formatted and translated recipes.
+    keyed on (recipe_card-href, target language, prompt version); an entry is only served for the recipe content
+    (RecipeResult.content_hash) it was produced from. user-specific fields such as the shopping list must not be
+    stored here, they are recomputed per request.
+    """
+
+    def __init__(self, db_path: str, prompt_version: str, max_entries: int = 50000) -> None:
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.db_path = db_path
+        self.prompt_version = prompt_version
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        # autocommit mode + WAL so several uvicorn workers can read while one writes
+        self.connection = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS translations (
+                recipe_url TEXT NOT NULL,
+                language TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                content_hash TEXT,
+                PRIMARY KEY (recipe_url, language, prompt_version))""")
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(translations)")}
+        if "content_hash" not in columns: # caches written before entries were tied to the recipe content
+            self.connection.execute("ALTER TABLE translations ADD COLUMN content_hash TEXT")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS translations_last_access ON translations (last_access)")
+        # single translated ingredient lines, used for shopping lists when the formatted recipe cannot be reused
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS item_translations (
+                text TEXT NOT NULL,
+                language TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (text, language, prompt_version))""")
+        # how often each recipe was served, lets the offline pre-translation job pick the top-N
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS recipe_requests (
+                recipe_url TEXT PRIMARY KEY,
+                request_count INTEGER NOT NULL)""")
+
+    @staticmethod
+    def normalize_language(language: str) -> str:
+        return language.strip().lower()
+
+    def get(self, recipe_url: str, language: str, content_hash: str = None) -> Union[Dict, None]:
+        key = (recipe_url, self.normalize_language(language), self.prompt_version)
+        row = self.connection.execute(
+            "SELECT value FROM translations WHERE recipe_url=? AND language=? AND prompt_version=? AND content_hash IS ?",
+            (*key, content_hash)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.connection.execute(
+            "UPDATE translations SET last_access=? WHERE recipe_url=? AND language=? AND prompt_version=?", (time.time(), *key))
+        return json.loads(row[0])
+
+    def put(self, recipe_url: str, language: str, value: Dict, content_hash: str = None) -> None:
+        now = time.time()
+        self.connection.execute(
+            "INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (recipe_url, self.normalize_language(language), self.prompt_version, json.dumps(value, ensure_ascii=False), now, now, content_hash))
+        self.evict()
+
+    def contains(self, recipe_url: str, language: str, content_hash: str = None) -> bool:
+        row = self.connection.execute(
+            "SELECT 1 FROM translations WHERE recipe_url=? AND language=? AND prompt_version=? AND content_hash IS ?",
+            (recipe_url, self.normalize_language(language), self.prompt_version, content_hash)).fetchone()
+        return row is not None
+
+    def get_items(self, texts: List[str], language: str) -> Dict[str, str]:
+        """
+        cached translations of the given lines, missing ones are simply absent from the result.
+        """
+        if not texts:
+            return {}
+        placeholders = ",".join("?" * len(texts))
+        rows = self.connection.execute(
+            f"SELECT text, value FROM item_translations WHERE language=? AND prompt_version=? AND text IN ({placeholders})",
+            (self.normalize_language(language), self.prompt_version, *texts)).fetchall()
+        return dict(rows)
+
+    def put_items(self, translations: Dict[str, str], language: str) -> None:
+        language = self.normalize_language(language)
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO item_translations VALUES (?, ?, ?, ?)",
+            [(text, language, self.prompt_version, value) for text, value in translations.items()])
+
+    def record_request(self, recipe_url: str) -> None:
+        self.connection.execute(
+            "INSERT INTO recipe_requests VALUES (?, 1) ON CONFLICT(recipe_url) DO UPDATE SET request_count=request_count+1", (recipe_url,))
+
+    def top_requested(self, n: int) -> List[str]:
+        rows = self.connection.execute("SELECT recipe_url FROM recipe_requests ORDER BY request_count DESC LIMIT ?", (n,)).fetchall()
+        return [row[0] for row in rows]
+
+    def size(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+
+    def evict(self) -> int:
+        """
+        drops the least recently used entries above max_entries.
+        """
+        overflow = self.size() - self.max_entries
+        if overflow <= 0:
+            return 0
+        self.connection.execute(
+            "DELETE FROM translations WHERE rowid IN (SELECT rowid FROM translations ORDER BY last_access ASC LIMIT ?)", (overflow,))
+        return overflow
+
+    def invalidate_stale(self) -> int:
+        """
+        deletes entries produced with any other prompt version, call it after a prompt template changes.
+        """
+        self.connection.execute("DELETE FROM item_translations WHERE prompt_version != ?", (self.prompt_version,))
+        return self.connection.execute("DELETE FROM translations WHERE prompt_version != ?", (self.prompt_version,)).rowcount
+
+    def invalidate_all(self) -> int:
+        self.connection.execute("DELETE FROM item_translations")
+        return self.connection.execute("DELETE FROM translations").rowcount
+
+    def metrics(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": self.size(),
+            "max_entries": self.max_entries,
+            "prompt_version": self.prompt_version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def initialize_translation_cache(prompt_templates: List[str]) -> TranslationCache:
+    return TranslationCache(
+        db_path=os.getenv("TRANSLATION_CACHE_PATH", pipeline_constants.TRANSLATION_CACHE_PATH),
+        prompt_version=get_prompt_version(prompt_templates),
+        max_entries=int(os.getenv("TRANSLATION_CACHE_MAX_ENTRIES", pipeline_constants.TRANSLATION_CACHE_MAX_ENTRIES)))
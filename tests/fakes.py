@@ -0,0 +1,41 @@
+from typing import Dict, List
+import numpy as np
+import hashlib
+
+
+class HashingEmbedder:
+    """
+    deterministic bag-of-words embedder standing in for the sentence transformer; picklable, so it can be the
+    embedder factory of the ingestion process pool.
+    """
+
+    def __init__(self, dimensions: int = 32) -> None:
+        self.dimensions = dimensions
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for text in texts:
+            vector = np.zeros(self.dimensions)
+            for word in text.lower().replace("|", " ").split():
+                vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dimensions] += 1.0
+            vectors.append(vector.tolist())
+        return vectors
+
+
+def make_recipe(name: str, ingredients: List[str] = None, tags: List[str] = None) -> Dict:
+    """
+    a recipe in the formatted json layout great_migration ingests.
+    """
+    return {
+        "recipe_card-href": f"https://example.com/recipes/{name.lower().replace(' ', '-')}",
+        "recipe_name": name,
+        "recipe_img_url-src": "None",
+        "recipe_tags_formatted": tags or ["Main Dish"],
+        "recipe_details_formatted": {"Prep": "10 min", "Cook": "20 min", "Total": "30 min", "Servings": "4"},
+        "recipe_ingredients_formatted": ingredients or ["1 cup flour", "2 large eggs", "1/2 cup milk"],
+        "recipe_directions_formatted": ["Mix everything.", "Bake."],
+        "recipe_nutrition_details_formatted": {"Calories": "250", "Total Fat": "9 g", "Protein": "7 g"},
+    }
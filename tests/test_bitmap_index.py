@@ -0,0 +1,69 @@
+from src.handler_api.bitmap_index import BitmapIndex, tokenize
+from src.handler_api.local_vector_index import LocalVectorIndex
+import numpy as np
+
+
+def payload(tags, ingredients):
+    return {"page_content": f"{'|'.join(ingredients)}\nrecipe_tags_formatted:{tags}",
+            "metadata": {"recipe_tags_formatted": tags, "recipe_ingredients_formatted": ingredients}}
+
+
+PAYLOADS = [
+    payload(["Vegetarian", "Dinner"], ["1 eggplant", "2 tomatoes"]),
+    payload(["Breakfast"], ["2 large eggs", "1 cup buttermilk"]),
+    payload(["Vegetarian", "Low-Carb"], ["3 zucchini", "1 cup peanuts"]),
+    payload(["Dessert"], ["1 cup sugar", "1 egg"]),
+]
+
+
+def rows(bitmap_index, **terms):
+    return np.flatnonzero(bitmap_index.to_mask(bitmap_index.evaluate(**terms))).tolist()
+
+
+def test_tokens_share_a_singular_form():
+    assert tokenize("2 Large Eggs, peanuts") == ["large", "egg", "peanut"]
+
+
+def test_preferences_match_tags_and_whole_words():
+    bitmap_index = BitmapIndex.from_payloads(PAYLOADS)
+    assert rows(bitmap_index, must=["vegetarian"]) == [0, 2]
+    assert rows(bitmap_index, must=["egg"]) == [1, 3] # "eggplant" is not an egg
+    assert rows(bitmap_index, should=["breakfast", "dessert"]) == [1, 3]
+
+
+def test_allergens_exclude_every_word_containing_them():
+    bitmap_index = BitmapIndex.from_payloads(PAYLOADS)
+    assert rows(bitmap_index, must_not=["milk"]) == [0, 2, 3] # buttermilk
+    assert rows(bitmap_index, must=["vegetarian"], must_not=["peanut"]) == [0]
+
+
+def test_text_filter_takes_the_bitmap_path_and_persists(tmp_path):
+    vectors = np.random.default_rng(0).normal(size=(len(PAYLOADS), 8))
+    local_index = LocalVectorIndex(LocalVectorIndex.normalize(vectors), PAYLOADS, list(range(len(PAYLOADS))))
+    filter = {"must": [{"key": "page_content", "match": {"text": "vegetarian"}}],
+              "must_not": [{"key": "page_content", "match": {"text": "peanut"}}]}
+    assert local_index.filter_mask(filter).tolist() == [True, False, False, False]
+
+    local_index.bitmap_index.save(str(tmp_path))
+    loaded = BitmapIndex.load(str(tmp_path))
+    assert rows(loaded, must=["vegetarian"]) == [0, 2]
+
+
+def test_allergens_without_an_indexable_word_fall_back_to_a_text_scan():
+    payloads = [*PAYLOADS, payload(["Dinner"], ["1 Ox tail", "2 carrots"]), payload(["Dessert"], ["1 cup Süt", "2 tbsp honey"])]
+    vectors = np.random.default_rng(0).normal(size=(len(payloads), 8))
+    local_index = LocalVectorIndex(LocalVectorIndex.normalize(vectors), payloads, list(range(len(payloads))))
+
+    def excluded(*allergens, must=()):
+        filter = {"must": [{"key": "page_content", "match": {"text": tag}} for tag in must],
+                  "must_not": [{"key": "page_content", "match": {"text": allergen}} for allergen in allergens]}
+        return np.flatnonzero(~local_index.filter_mask(filter)).tolist()
+
+    assert excluded("ox") == [4] and excluded("süt") == [5] and excluded("SÜT", "peanut") == [2, 5]
+    assert excluded("ox", must=["dinner"]) == [1, 2, 3, 4, 5]
+    assert excluded("  ") == []
+    # a condition the bitmap fast path cannot take goes through condition_mask, with the same rule
+    generic = {"must": [{"key": "metadata.recipe_tags_formatted", "match": {"any": ["Dinner", "Dessert"]}}],
+               "must_not": [{"key": "page_content", "match": {"text": "ox"}}]}
+    assert np.flatnonzero(local_index.filter_mask(generic)).tolist() == [0, 3, 5]
+    assert not BitmapIndex.from_payloads(payloads).term_bitmap("ox", substring=True).any()
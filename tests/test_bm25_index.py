@@ -0,0 +1,61 @@
+from src.handler_api.bm25_index import BM25Index, reciprocal_rank_fusion
+from src.handler_api.bitmap_index import tokenize
+from src.handler_api.local_vector_index import LocalVectorIndex
+from tests.fakes import HashingEmbedder
+import numpy as np
+import math
+
+
+TEXTS = ["chicken|rice|garlic\nrecipe_tags_formatted:['Dinner']", "chicken|chicken stock|onion", "rice|milk|sugar\nrecipe_tags_formatted:['Dessert']",
+         "garlic|butter|bread", "tofu|rice|soy sauce|garlic"]
+
+
+def okapi(query, texts, k1=1.2, b=0.75):
+    documents = [tokenize(text) for text in texts]
+    average_length = sum(len(document) for document in documents) / len(documents)
+    scores = []
+    for document in documents:
+        score = 0.0
+        for term in set(tokenize(query)):
+            df = sum(term in other for other in documents)
+            tf = document.count(term)
+            if tf:
+                idf = math.log(1 + (len(documents) - df + 0.5) / (df + 0.5))
+                score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(document) / average_length))
+        scores.append(score)
+    return np.array(scores)
+
+
+def test_scores_follow_okapi_bm25():
+    bm25_index = BM25Index.from_texts(TEXTS)
+    for query in ("chicken rice", "garlic", "Chickens", "sugar milk tofu", "caviar"):
+        assert np.allclose(bm25_index.scores(query), okapi(query, TEXTS), atol=1e-5)
+
+
+def test_search_ranks_masks_and_skips_rows_without_a_query_term(tmp_path):
+    bm25_index = BM25Index.from_texts(TEXTS)
+    rows, scores = bm25_index.search("chicken garlic", k=10)
+    assert rows.tolist() == [1, 0, 3, 4] and np.all(np.diff(scores) <= 0) # row 1 names chicken twice
+    rows, _ = bm25_index.search("chicken garlic", k=10, mask=np.array([False, True, True, True, True]))
+    assert rows.tolist() == [1, 3, 4]
+    assert bm25_index.search("caviar", k=3)[0].tolist() == []
+
+    bm25_index.save(str(tmp_path))
+    loaded = BM25Index.load(str(tmp_path))
+    assert np.array_equal(loaded.scores("rice garlic"), bm25_index.scores("rice garlic"))
+
+
+def test_reciprocal_rank_fusion():
+    assert reciprocal_rank_fusion([["a", "b", "c"], ["c", "a", "d"]]) == ["a", "c", "b", "d"]
+    assert reciprocal_rank_fusion([]) == []
+
+
+def test_hybrid_search_lifts_the_exact_lexical_match():
+    payloads = [{"page_content": text, "metadata": {"recipe_ingredients_formatted": text.split("\n")[0].split("|")}} for text in TEXTS]
+    local_index = LocalVectorIndex(LocalVectorIndex.normalize(np.array(HashingEmbedder().embed_documents(TEXTS))), payloads,
+                                   list(range(len(TEXTS))))
+    query = "soy sauce tofu"
+    rows = local_index.hybrid_rows(HashingEmbedder().embed_query(query), query, k=2, fetch_k=5)
+    assert rows[0] == 4
+    filter = {"must_not": [{"key": "page_content", "match": {"text": "soy"}}]}
+    assert 4 not in local_index.hybrid_rows(HashingEmbedder().embed_query(query), query, k=5, fetch_k=5, filter=filter)
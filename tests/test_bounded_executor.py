@@ -0,0 +1,45 @@
+from src.handler_api.bounded_executor import BoundedExecutor
+import asyncio
+import threading
+import time
+
+
+def test_jobs_beyond_workers_and_queue_wait_on_the_event_loop():
+    executor = BoundedExecutor(max_workers=2, max_queue=2)
+    release = threading.Event()
+    in_flight, peak = [0], [0]
+    lock = threading.Lock()
+
+    def job(i):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        release.wait(5)
+        with lock:
+            in_flight[0] -= 1
+        return i
+
+    async def run():
+        tasks = [asyncio.ensure_future(executor.run(job, i)) for i in range(10)]
+        await asyncio.sleep(0.2)
+        metrics = executor.metrics()
+        release.set()
+        return metrics, await asyncio.gather(*tasks)
+
+    metrics, results = asyncio.run(run())
+    executor.shutdown()
+    assert results == list(range(10))
+    assert peak[0] == 2
+    assert metrics["running"] == 2 and metrics["queue_depth"] == 8 # 2 queued in the pool + 6 waiting for a slot
+    assert executor.metrics()["running"] == 0 and executor.completed == 10
+
+
+def test_running_count_stays_exact_under_many_threads():
+    executor = BoundedExecutor(max_workers=8, max_queue=1000)
+
+    async def run():
+        await asyncio.gather(*[executor.run(time.sleep, 0) for _ in range(2000)])
+
+    asyncio.run(run())
+    executor.shutdown()
+    assert executor.running_jobs() == 0 and executor.queue_depth() == 0
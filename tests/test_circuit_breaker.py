@@ -0,0 +1,66 @@
+from src.handler_api import circuit_breaker, llm_handler
+from src.handler_api.circuit_breaker import CircuitBreaker
+from src.handler_api.recipe_models import RecipeResult, FormattedRecipe
+import asyncio
+import pytest
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_failures_open_the_breaker_until_probes_succeed(clock):
+    breaker = CircuitBreaker(window=10, min_calls=4, failure_rate_threshold=0.5, open_seconds=30, half_open_calls=2)
+    for success in (True, False, True, False):
+        assert breaker.allow()
+        breaker.record(success, latency=0.1)
+    assert breaker.state == "open" and not breaker.allow()
+
+    clock[0] += 31
+    assert breaker.allow() and breaker.allow() and not breaker.allow() # two probes, the third call waits
+    breaker.record(True, 0.1)
+    breaker.record(False, 0.1)
+    assert breaker.state == "open" and breaker.times_opened == 2
+
+    clock[0] += 31
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record(True, 0.1)
+    assert breaker.state == "closed" and breaker.metrics()["rejected"] == 2
+
+
+def test_slow_calls_open_the_breaker(clock):
+    breaker = CircuitBreaker(min_calls=3, slow_call_seconds=5, slow_call_rate_threshold=0.6)
+    for latency in (6, 1, 7):
+        breaker.record(True, latency)
+    assert breaker.state == "open"
+
+
+def test_open_breaker_skips_the_llm_call(monkeypatch):
+    breaker = CircuitBreaker(open_seconds=60)
+    breaker.trip()
+    monkeypatch.setattr(llm_handler, "llm_breaker", breaker)
+
+    async def unexpected_post(*args, **kwargs):
+        raise AssertionError("the LLM must not be called while the breaker is open")
+
+    monkeypatch.setattr(llm_handler.llm_client, "post", unexpected_post)
+    assert asyncio.run(llm_handler.call_gpt_2("instruction", "prompt")) is None
+    with pytest.raises(circuit_breaker.CircuitOpenError):
+        asyncio.run(anext(llm_handler.stream_gpt("instruction", "prompt")))
+
+
+def test_degraded_recipe_is_built_from_the_stored_one():
+    recipe = RecipeResult(recipe_name="  Onion   Soup ", recipe_ingredients=["2  onions", "1 l stock"],
+                          recipe_directions=["Slice.", "  ", "Simmer  gently."],
+                          recipe_details=["Prep\n10 min", "Cook\nNone"], recipe_nutrition_details={"Calories": "120", "Fat": None},
+                          recipe_url="https://example.com/soup")
+    formatted = FormattedRecipe.from_recipe(recipe, translations={"1 l stock": "1 l Brühe"})
+    assert formatted.degraded and formatted.recipe_name == "Onion Soup"
+    assert formatted.recipe_ingredients == ["2 onions", "1 l Brühe"] # one line per stored line, for the shopping list
+    assert formatted.recipe_directions == ["Slice.", "Simmer gently."]
+    assert formatted.recipe_details == {"Prep": "10 min"} and formatted.recipe_nutrition_details == {"Calories": "120"}
+    assert recipe.model_copy(update={"recipe_total_minutes": 75}).structured_details() == {"TotalTime": "1 hr 15 min"}
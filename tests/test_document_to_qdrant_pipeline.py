@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+import numpy as np
+import pytest
+
+document_to_qdrant_pipeline = pytest.importorskip("src.database.document_to_qdrant_pipeline")
+from src.database.document_generator_pipeline import DocumentGeneratorPipeline
+from src.handler_api.local_vector_index import LocalVectorIndex
+from src.handler_api.recipe_store import RecipeStore, point_key
+from src.logger import AppLogger
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Distance, VectorParams
+from tests.fakes import HashingEmbedder, make_recipe
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    """
+    the pipeline around an in-memory collection, without loading the sentence transformer.
+    """
+    monkeypatch.setenv("LEAN_PAYLOAD", "true")
+    monkeypatch.setenv("RECIPE_STORE_PATH", str(tmp_path / "recipes.sqlite3"))
+    client = QdrantClient(":memory:")
+    client.create_collection("recipes", vectors_config=VectorParams(size=32, distance=Distance.COSINE))
+    pipeline = document_to_qdrant_pipeline.DocumentToQdrantPipeline.__new__(document_to_qdrant_pipeline.DocumentToQdrantPipeline)
+    pipeline.log_writer = AppLogger("DocumentToQdrantPipeline")
+    pipeline.embedder = HashingEmbedder()
+    pipeline.vector_store = SimpleNamespace(client=client, collection_name="recipes")
+    return pipeline
+
+
+@pytest.fixture
+def generator(tmp_path):
+    return DocumentGeneratorPipeline(str(tmp_path / "ingredient_vocabulary.json"))
+
+
+def test_changed_and_removed_recipes_reach_the_collection_store_and_local_index(tmp_path, pipeline, generator):
+    index_dir = str(tmp_path / "local_index")
+    recipes = [make_recipe(f"recipe {i}", ingredients=[f"{i} cups flour", "1 egg"]) for i in range(12)]
+    first_ids = pipeline.add_new_documents(generator.build_documents(recipes), hnsw_index_dir=index_dir)
+    assert len(first_ids) == 12
+
+    removed = recipes.pop(0)
+    recipes[0] = make_recipe(recipes[0]["recipe_name"], ingredients=["3 ripe tomatoes"])
+    changed_ids = pipeline.add_new_documents(generator.build_documents(recipes), hnsw_index_dir=index_dir, delete_missing=True)
+    assert len(changed_ids) == 1
+
+    client = pipeline.vector_store.client
+    assert client.count("recipes").count == 11
+    store = RecipeStore(str(tmp_path / "recipes.sqlite3"))
+    assert store.size() == 11
+    assert "tomatoes" in store.get_many(changed_ids)[point_key(changed_ids[0])]["page_content"]
+    store.close()
+
+    local_index = LocalVectorIndex.load(index_dir, mmap=True)
+    # the removed and the changed recipe are tombstones in the graph, the changed one came back as a new node
+    assert len(local_index) == 11 and len(local_index.ann_index) == 13 and local_index.ann_index.n_deleted == 2
+    row = [point_key(point_id) for point_id in local_index.ids].index(point_key(changed_ids[0]))
+    assert "tomatoes" in local_index.page_contents[row]
+    expected = LocalVectorIndex.normalize(np.array([pipeline.embedder.embed_query(local_index.page_contents[row])]))[0]
+    assert np.allclose(local_index.vectors[row], expected, atol=1e-6)
+    removed_id = set(first_ids) - {point_key(point_id) for point_id in local_index.ids}
+    assert len(removed_id) == 1 and removed["recipe_name"] not in str(local_index.payloads)
+
+
+def test_unchanged_corpus_writes_nothing(pipeline, generator):
+    recipes = [make_recipe(f"recipe {i}") for i in range(5)]
+    pipeline.add_new_documents(generator.build_documents(recipes))
+    assert pipeline.add_new_documents(generator.build_documents(recipes), delete_missing=True) == []
+    assert pipeline.vector_store.client.count("recipes").count == 5
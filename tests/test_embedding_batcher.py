@@ -0,0 +1,66 @@
+from src.handler_api.embedding_batcher import EmbeddingBatcher
+from tests.fakes import HashingEmbedder
+import asyncio
+
+
+class RecordingEmbedder(HashingEmbedder):
+
+    def __init__(self, fail_on: str = None) -> None:
+        super().__init__()
+        self.calls = []
+        self.fail_on = fail_on
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        if self.fail_on in texts:
+            raise RuntimeError("model crashed")
+        return super().embed_documents(texts)
+
+
+def test_concurrent_queries_share_model_calls_and_get_their_own_vector():
+    embedder = RecordingEmbedder()
+    batcher = EmbeddingBatcher(embedder, window_ms=50, max_batch_size=4)
+    texts = [f"eggs flour {i}" for i in range(10)]
+
+    async def run():
+        vectors = await asyncio.gather(*[batcher.embed_query(text) for text in texts])
+        await batcher.close()
+        return vectors
+
+    vectors = asyncio.run(run())
+    assert vectors == HashingEmbedder().embed_documents(texts)
+    assert [len(call) for call in embedder.calls] == [4, 4, 2]
+    metrics = batcher.metrics()
+    assert metrics["model_calls"] == 3 and metrics["texts_embedded"] == 10
+    assert metrics["batch_size_distribution"] == {2: 1, 4: 2}
+
+
+def test_lone_query_waits_no_longer_than_the_window():
+    embedder = RecordingEmbedder()
+    batcher = EmbeddingBatcher(embedder, window_ms=5, max_batch_size=32)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await batcher.embed_query("salt")
+        elapsed = loop.time() - start
+        await batcher.close()
+        return elapsed
+
+    assert asyncio.run(run()) < 0.5
+    assert embedder.calls == [["salt"]]
+
+
+def test_failed_batch_fails_its_callers_and_the_worker_keeps_going():
+    embedder = RecordingEmbedder(fail_on="poison")
+    batcher = EmbeddingBatcher(embedder, window_ms=50, max_batch_size=8)
+
+    async def run():
+        failed = await asyncio.gather(batcher.embed_query("poison"), batcher.embed_query("salt"), return_exceptions=True)
+        vector = await batcher.embed_query("pepper")
+        await batcher.close()
+        return failed, vector
+
+    failed, vector = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in failed)
+    assert vector == HashingEmbedder().embed_query("pepper")
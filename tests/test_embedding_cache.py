@@ -0,0 +1,32 @@
+from src.handler_api import embedding_cache
+from src.handler_api.embedding_cache import EmbeddingCache, build_query, canonicalize_query
+
+
+def test_order_case_and_spacing_share_one_key():
+    query = build_query(["Chicken", " rice", "rice", ""], ["Dinner", "quick "])
+    assert query == "chicken|rice\nrecipe_tags_formatteddinner|quick"
+    assert canonicalize_query("rice| chicken\nrecipe_tags_formatted:quick|Dinner") == query
+    assert canonicalize_query("Rice|chicken") == build_query(["chicken", "rice"], [])
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = EmbeddingCache(max_size=2)
+    cache.put("a", [1.0])
+    cache.put("b", [2.0])
+    assert cache.get("a") == [1.0]
+    cache.put("c", [3.0])
+    assert cache.get("b") is None and cache.get("a") == [1.0] and cache.get("c") == [3.0]
+    metrics = cache.metrics()
+    assert (metrics["size"], metrics["hits"], metrics["misses"], metrics["evictions"]) == (2, 3, 1, 1)
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(embedding_cache.time, "monotonic", lambda: now[0])
+    cache = EmbeddingCache(ttl_seconds=10)
+    cache.put("a", [1.0])
+    now[0] += 9
+    assert cache.get("a") == [1.0]
+    now[0] += 2
+    assert cache.get("a") is None and len(cache) == 0
+    assert EmbeddingCache(ttl_seconds=0).ttl_seconds is None
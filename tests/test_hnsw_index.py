@@ -0,0 +1,115 @@
+from src.handler_api import hnsw_index
+from src.handler_api.hnsw_index import HNSWIndex
+from src.handler_api.local_vector_index import LocalVectorIndex
+import numpy as np
+import time
+import pytest
+
+
+N_CLUSTERS = 4
+K = 10
+
+
+@pytest.fixture(scope="module")
+def clustered():
+    """
+    four well separated clusters, so a filter on one cluster is correlated with the vectors, the hard case for a filtered graph walk.
+    """
+    rng = np.random.default_rng(0)
+    clusters = rng.integers(0, N_CLUSTERS, 3000)
+    centers = 3 * rng.normal(size=(N_CLUSTERS, 16))
+    vectors = LocalVectorIndex.normalize(centers[clusters] + rng.normal(size=(3000, 16))).astype(np.float32)
+    local_index = LocalVectorIndex(vectors, [{} for _ in range(3000)], list(range(3000)))
+    local_index.build_ann_index(M=8, ef_construction=64, ef_search=32)
+    local_index.ann_min_rows = 0 # the graph is only walked from ANN_MIN_ROWS rows on, the tests here exercise the walk
+    queries = vectors[rng.choice(3000, 30, replace=False)] + 0.05 * rng.normal(size=(30, 16)).astype(np.float32)
+    return local_index, clusters, LocalVectorIndex.normalize(queries)
+
+
+def exact_rows(local_index, query, mask=None):
+    return set(LocalVectorIndex.top_scores(local_index.vectors @ query, K, mask)[0].tolist())
+
+
+def filtered_recall(local_index, queries, masks):
+    hits = [len(set(local_index.dense_rows(query, K, mask)[0].tolist()) & exact_rows(local_index, query, mask)) / K
+            for query, mask in zip(queries, masks)]
+    return float(np.mean(hits))
+
+
+def count_expansions(monkeypatch, index):
+    expansions = []
+    neighbours = HNSWIndex.neighbours
+
+    def counted(self, node, layer):
+        if layer == 0:
+            expansions.append(node)
+        return neighbours(self, node, layer)
+
+    monkeypatch.setattr(HNSWIndex, "neighbours", counted)
+    return expansions
+
+
+def test_small_indexes_are_scanned_exactly(clustered, monkeypatch):
+    local_index, _, queries = clustered
+    monkeypatch.setattr(local_index, "ann_min_rows", 3001)
+    expansions = count_expansions(monkeypatch, local_index.ann_index)
+    for query in queries[:5]:
+        assert set(local_index.dense_rows(query, K)[0].tolist()) == exact_rows(local_index, query)
+    assert not expansions
+
+
+def test_unfiltered_recall(clustered):
+    local_index, _, queries = clustered
+    assert local_index.ann_index.recall(queries, k=K) >= 0.95
+
+
+def test_tombstoned_nodes_are_walked_through_but_never_returned(clustered):
+    local_index, _, queries = clustered
+    ann_index = HNSWIndex(16, M=8, ef_construction=64, ef_search=32)
+    ann_index.add_items(local_index.vectors[:1000])
+    deleted = np.random.default_rng(3).choice(1000, 200, replace=False)
+    ann_index.mark_deleted(deleted)
+    assert ann_index.n_deleted == 200 and ann_index.stats()["deleted"] == 200
+    for query in queries:
+        nodes, _ = ann_index.search(query, K)
+        assert len(nodes) == K and not np.isin(nodes, deleted).any()
+        assert not np.isin(ann_index.exact_search(query, K), deleted).any()
+    assert ann_index.recall(queries, k=K) >= 0.95
+
+
+def test_filtered_recall_matches_an_exact_scan(clustered):
+    local_index, clusters, queries = clustered
+    rng = np.random.default_rng(1)
+    uniform = [rng.random(len(local_index)) < 0.3 for _ in queries]
+    assert filtered_recall(local_index, queries, uniform) >= 0.95
+    # only a cluster the query is not in is allowed, the graph has to leave the query's neighbourhood to find anything
+    query_clusters = [clusters[np.argmax(local_index.vectors @ query)] for query in queries]
+    elsewhere = [clusters == (cluster + 1) % N_CLUSTERS for cluster in query_clusters]
+    assert filtered_recall(local_index, queries, elsewhere) >= 0.95
+
+
+def test_filtered_walk_is_bounded(clustered, monkeypatch):
+    local_index, clusters, queries = clustered
+    ann_index = local_index.ann_index
+    query = queries[0]
+    mask = clusters != clusters[np.argmax(local_index.vectors @ query)]
+    mask &= np.random.default_rng(2).random(len(mask)) < 0.4
+    expansions = count_expansions(monkeypatch, ann_index)
+    ann_index.search(query, K, mask=mask)
+    cap = hnsw_index.FILTERED_EXPANSION_SLACK * ann_index.ef_search * len(mask) / mask.sum()
+    assert len(expansions) <= cap + ann_index.max_level + 1 < len(mask) / 2
+
+
+def test_filtered_latency_stays_close_to_unfiltered(clustered):
+    local_index, clusters, queries = clustered
+
+    def latency(masks):
+        start = time.perf_counter()
+        for query, mask in zip(queries, masks):
+            local_index.dense_rows(query, K, mask)
+        return time.perf_counter() - start
+
+    elsewhere = [clusters == (clusters[np.argmax(local_index.vectors @ query)] + 1) % N_CLUSTERS for query in queries]
+    latency([None] * len(queries)) # warm up
+    # the capped walk costs at most slack / allowed fraction (~8x) the unfiltered one, plus one exact scan
+    assert latency(elsewhere) < 12 * latency([None] * len(queries)) + 0.02
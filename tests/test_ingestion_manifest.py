@@ -0,0 +1,83 @@
+from src.database.ingestion_manifest import IngestionManifest
+import os
+import pytest
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    manifest = IngestionManifest(str(tmp_path / "manifest.sqlite3"))
+    yield manifest
+    manifest.close()
+
+
+@pytest.fixture
+def recipe_file(tmp_path):
+    path = tmp_path / "recipes.json"
+    path.write_text("[]")
+    return str(path)
+
+
+def test_file_is_done_once_every_batch_is_committed(manifest, recipe_file):
+    manifest.start_run()
+    manifest.begin_file(recipe_file)
+    manifest.set_batches(recipe_file, 2)
+    assert not manifest.commit_batch(recipe_file, 0, "upserted", ["a", "b"])
+    assert manifest.file_status(recipe_file) == "building"
+    assert manifest.commit_batch(recipe_file, 1, "unchanged", ["c"])
+    assert manifest.file_status(recipe_file) == "done"
+    assert manifest.file_point_ids(recipe_file) == ["a", "b", "c"]
+
+
+def test_file_without_recipes_is_done_at_once(manifest, recipe_file):
+    manifest.start_run()
+    manifest.begin_file(recipe_file)
+    manifest.set_batches(recipe_file, 0)
+    assert manifest.file_status(recipe_file) == "done"
+
+
+def test_unfinished_run_is_resumed_with_its_committed_batches(tmp_path, recipe_file):
+    path = str(tmp_path / "manifest.sqlite3")
+    manifest = IngestionManifest(path)
+    run_id = manifest.start_run()
+    manifest.begin_file(recipe_file)
+    manifest.set_batches(recipe_file, 3)
+    manifest.commit_batch(recipe_file, 0, "upserted", ["a"])
+    manifest.fail_batch(recipe_file, 1, 1, "qdrant down")
+    manifest.finish_run("incomplete")
+    manifest.close()
+
+    manifest = IngestionManifest(path)
+    assert manifest.start_run(resume=True) == run_id
+    assert manifest.committed_batches(recipe_file) == {0}
+    assert manifest.summary()["batches"] == {"upserted": 1, "failed": 1}
+    manifest.close()
+
+
+def test_finished_run_or_no_resume_starts_a_new_run(manifest, recipe_file):
+    first = manifest.start_run()
+    manifest.finish_run("incomplete")
+    second = manifest.start_run(resume=False)
+    assert second != first
+    manifest.finish_run()
+    assert manifest.start_run(resume=True) not in (first, second)
+
+
+def test_changed_file_starts_over(manifest, recipe_file):
+    manifest.start_run()
+    manifest.begin_file(recipe_file)
+    manifest.set_batches(recipe_file, 2)
+    manifest.commit_batch(recipe_file, 0, "upserted", ["a"])
+    with open(recipe_file, "w") as f:
+        f.write('[{"recipe_name": "new"}]')
+    os.utime(recipe_file, ns=(0, 0))
+    assert manifest.file_status(recipe_file) is None
+    manifest.begin_file(recipe_file)
+    assert manifest.committed_batches(recipe_file) == set()
+
+
+def test_quarantined_file(manifest, recipe_file):
+    manifest.start_run()
+    manifest.begin_file(recipe_file)
+    manifest.quarantine_file(recipe_file, "unexpected end of data")
+    assert manifest.file_status(recipe_file) == "quarantined"
+    assert manifest.summary()["files"] == {"quarantined": 1}
@@ -0,0 +1,217 @@
+import asyncio
+import time
+import json
+import os
+import pytest
+
+ingestion_pipeline = pytest.importorskip("src.database.ingestion_pipeline")
+from src.database.document_generator_pipeline import DocumentGeneratorPipeline
+from src.database.ingestion_manifest import IngestionManifest
+from qdrant_client import AsyncQdrantClient
+from tests.fakes import HashingEmbedder, make_recipe
+
+
+COLLECTION = "recipes"
+
+
+def write_recipes(path, recipes):
+    with open(path, "w") as f:
+        json.dump(recipes, f)
+    return str(path)
+
+
+def corpus(folder, n_files=3, per_file=6):
+    folder.mkdir(exist_ok=True)
+    return [write_recipes(folder / f"category_{i}.json", [make_recipe(f"recipe {i} {j}") for j in range(per_file)])
+            for i in range(n_files)]
+
+
+def new_pipeline(tmp_path, client, **kwargs):
+    pipeline = ingestion_pipeline.StreamingIngestionPipeline(
+        client, COLLECTION, embedder_factory=HashingEmbedder, embed_workers=1, parse_workers=2, batch_size=4,
+        report_interval=3600, quarantine_dir=str(tmp_path / "invalid"), **kwargs)
+    pipeline.document_generator = DocumentGeneratorPipeline(str(tmp_path / "ingredient_vocabulary.json"))
+    return pipeline
+
+
+async def count(client):
+    return (await client.count(COLLECTION)).count
+
+
+class SlowInvalidFirst(ingestion_pipeline.StreamingIngestionPipeline):
+    """
+    the first discovered file is invalid and finishes parsing last, so every other file waits behind it in the reorder buffer.
+    """
+
+    def parse_file(self, file_path):
+        if file_path.endswith("broken.json"):
+            time.sleep(0.5)
+        return super().parse_file(file_path)
+
+
+def test_failed_parse_releases_the_files_waiting_behind_it(tmp_path):
+    folder = tmp_path / "recipes"
+    files = corpus(folder, n_files=5)
+    broken = str(folder / "0_broken.json")
+    with open(broken, "w") as f:
+        f.write('[{"recipe_name": ')
+
+    async def run():
+        client = AsyncQdrantClient(":memory:")
+        pipeline = SlowInvalidFirst(client, COLLECTION, embedder_factory=HashingEmbedder, embed_workers=1, parse_workers=3,
+                                    batch_size=4, report_interval=3600, quarantine_dir=str(tmp_path / "invalid"))
+        pipeline.document_generator = DocumentGeneratorPipeline(str(tmp_path / "ingredient_vocabulary.json"))
+        metrics = await pipeline.run([broken, *files])
+        return metrics, await count(client)
+
+    metrics, points = asyncio.run(run())
+    assert points == 30
+    assert metrics["manifest"]["files"] == {"done": 5, "quarantined": 1}
+    assert metrics["stages"]["parse"]["errors"] == 1
+
+
+def test_reingestion_only_writes_what_changed_and_deletes_what_is_gone(tmp_path):
+    files = corpus(tmp_path / "recipes")
+
+    async def run():
+        client = AsyncQdrantClient(":memory:")
+        first = await new_pipeline(tmp_path, client).run(files)
+        recipes = json.load(open(files[0]))
+        recipes[0]["recipe_directions_formatted"] = ["Mix everything.", "Bake longer."]
+        del recipes[1]
+        write_recipes(files[0], recipes)
+        second = await new_pipeline(tmp_path, client, delete_missing=True).run(files)
+        return first, second, await count(client)
+
+    first, second, points = asyncio.run(run())
+    assert first["recipes"]["new"] == 18
+    assert second["recipes"] == {"new": 0, "changed": 1, "unchanged": 16, "deleted": 1}
+    assert second["stages"]["embed"]["documents"] == 1
+    assert points == 17
+
+
+def test_recipe_listed_in_several_files_is_stored_once(tmp_path):
+    folder = tmp_path / "recipes"
+    folder.mkdir()
+    shared = make_recipe("shared recipe")
+    files = [write_recipes(folder / "a.json", [shared, make_recipe("only a")]),
+             write_recipes(folder / "b.json", [shared, make_recipe("only b")])]
+
+    async def run():
+        client = AsyncQdrantClient(":memory:")
+        metrics = await new_pipeline(tmp_path, client).run(files)
+        return metrics, await count(client)
+
+    metrics, points = asyncio.run(run())
+    assert metrics["recipes"]["duplicate"] == 1
+    assert points == 3
+
+
+def failing_upserts(client, after):
+    """
+    makes the client's upserts fail once `after` of them went through, like a qdrant outage in the middle of a run.
+    """
+    upsert = client.upsert
+    calls = {"n": 0}
+
+    async def flaky_upsert(*args, **kwargs):
+        calls["n"] += 1
+        if calls["n"] > after:
+            raise ConnectionError("qdrant unavailable")
+        return await upsert(*args, **kwargs)
+
+    client.upsert = flaky_upsert
+    return upsert
+
+
+def test_interrupted_run_resumes_with_the_uncommitted_batches(tmp_path):
+    files = corpus(tmp_path / "recipes", n_files=3, per_file=6) # 2 batches per file
+    manifest_path = str(tmp_path / "manifest.sqlite3")
+
+    async def run():
+        client = AsyncQdrantClient(":memory:")
+        manifest = IngestionManifest(manifest_path)
+        upsert = failing_upserts(client, after=3)
+        first = await new_pipeline(tmp_path, client, manifest=manifest, delete_missing=True).run(files)
+        points_after_failure = await count(client)
+        client.upsert = upsert
+        second = await new_pipeline(tmp_path, client, manifest=manifest, delete_missing=True).run(files)
+        status = manifest.connection.execute("SELECT status FROM runs WHERE run_id=?", (manifest.run_id,)).fetchone()[0]
+        manifest.close()
+        return first, points_after_failure, second, status, await count(client)
+
+    first, points_after_failure, second, status, points = asyncio.run(run())
+    assert first["stages"]["upsert"]["errors"] == 3
+    assert first["manifest"]["batches"] == {"upserted": 3, "failed": 3}
+    assert second["manifest"]["run_id"] == first["manifest"]["run_id"]
+    # only the failed batches are sent again, the done file is not read at all
+    assert second["stages"]["upsert"]["documents"] == 18 - points_after_failure
+    assert second["recipes"]["resumed"] == 6
+    assert second["recipes"]["deleted"] == 0
+    assert second["manifest"]["files"] == {"done": 3}
+    assert status == "finished"
+    assert points == 18
+
+
+def test_failed_batch_keeps_the_run_resumable_and_nothing_is_deleted(tmp_path):
+    files = corpus(tmp_path / "recipes", n_files=2, per_file=4)
+
+    async def run():
+        client = AsyncQdrantClient(":memory:")
+        await new_pipeline(tmp_path, client).run(files)
+        failing_upserts(client, after=0)
+        for path in files: # everything changed, nothing can be written
+            write_recipes(path, [{**recipe, "recipe_name": recipe["recipe_name"] + " v2"} for recipe in json.load(open(path))])
+        manifest = IngestionManifest(":memory:")
+        metrics = await new_pipeline(tmp_path, client, manifest=manifest, delete_missing=True).run(files)
+        status = manifest.connection.execute("SELECT status FROM runs").fetchone()[0]
+        return metrics, status, await count(client)
+
+    metrics, status, points = asyncio.run(run())
+    assert metrics["manifest"]["batches"] == {"failed": 2}
+    assert metrics["recipes"].get("deleted", 0) == 0
+    assert status == "incomplete"
+    assert points == 8
+
+
+def test_invalid_file_is_quarantined_and_the_run_goes_on(tmp_path):
+    folder = tmp_path / "recipes"
+    files = corpus(folder, n_files=2)
+    (folder / "nested").mkdir()
+    invalid = [write_recipes(folder / "nested" / "category_0.json", {"not": "a list"}), str(folder / "truncated.json")]
+    with open(invalid[1], "w") as f:
+        f.write("[")
+    os.makedirs(tmp_path / "invalid")
+    write_recipes(tmp_path / "invalid" / "category_0.json", []) # quarantined by an earlier run
+
+    async def run():
+        client = AsyncQdrantClient(":memory:")
+        metrics = await new_pipeline(tmp_path, client).run([*files, *invalid])
+        return metrics, await count(client)
+
+    metrics, points = asyncio.run(run())
+    assert points == 12
+    assert metrics["manifest"]["files"] == {"done": 2, "quarantined": 2}
+    assert sorted(os.listdir(tmp_path / "invalid")) == ["category_0.json", "nested_category_0.json", "truncated.json"]
+    assert not any(os.path.exists(path) for path in invalid)
+
+
+def test_slow_upserts_hold_the_earlier_stages_back_within_the_queue_size(tmp_path):
+    files = corpus(tmp_path / "recipes", n_files=8, per_file=4)
+
+    async def run():
+        client = AsyncQdrantClient(":memory:")
+        upsert = client.upsert
+
+        async def slow_upsert(*args, **kwargs):
+            await asyncio.sleep(0.05)
+            return await upsert(*args, **kwargs)
+
+        client.upsert = slow_upsert
+        metrics = await new_pipeline(tmp_path, client, queue_size=2).run(files)
+        return metrics, await count(client)
+
+    metrics, points = asyncio.run(run())
+    assert points == 32 and metrics["stages"]["upsert"]["documents"] == 32
+    depths = [queue["peak_depth"] for queue in metrics["queues"].values()]
+    assert max(depths) == 2 and all(queue["max_size"] == 2 for queue in metrics["queues"].values()) # full, never beyond
@@ -0,0 +1,51 @@
+from src.handler_api.ingredient_vocabulary import IngredientVocabulary, IngredientSets, canonicalize_ingredient
+import numpy as np
+
+
+def test_lines_reduce_to_canonical_names():
+    assert canonicalize_ingredient("1 1/2 sticks (12 tablespoons) unsalted butter") == ["butter"]
+    assert canonicalize_ingredient("1 tablespoon minced shallots or red onion") == ["shallot", "red onion"]
+    assert canonicalize_ingredient("2 large green bell peppers, seeded and chopped") == ["bell pepper"]
+    assert canonicalize_ingredient("salt to taste") == ["salt"]
+    assert canonicalize_ingredient("1/2 cup, packed") == []
+
+
+def test_ids_are_stable_and_queries_cover_longer_names(tmp_path):
+    vocabulary = IngredientVocabulary()
+    first = vocabulary.recipe_ids(["2 chicken breasts", "1 red bell pepper", "1 cup rice"])
+    assert first == [[0], [1], [2]]
+    assert vocabulary.line_ids("3 chicken breasts, cubed") == [0]
+    assert vocabulary.line_ids("1 lemon", grow=False) == [] and len(vocabulary) == 3
+    assert vocabulary.query_ids(["Chicken", "peppers"]) == {0, 1}
+
+    vocabulary.tokens.update(["buttermilk", "milk", "rice"])
+    path = str(tmp_path / "vocabulary" / "ingredient_vocabulary.json")
+    vocabulary.save(path)
+    loaded = IngredientVocabulary.load_or_create(path)
+    assert loaded.names == vocabulary.names and loaded.add("lemon") == 3
+    assert loaded.matching_tokens("milk") == ["buttermilk", "milk"]
+
+
+def test_lines_the_vocabulary_cannot_map_are_checked_as_text():
+    lines = ["2 chicken breasts", "1 tsp saffron threads", "1 cup rice"]
+    current = IngredientVocabulary()
+    line_ids = current.recipe_ids(lines)
+    assert current.text_covered_lines(["chicken", "rice"], lines, line_ids) == [False, False, False] # ids decide
+    # missing file: no user ingredient has an id, every line is checked as text
+    assert IngredientVocabulary().text_covered_lines(["Chicken", " ", "saffron"], lines, line_ids) == [True, True, False]
+    # older file: knows chicken, not the saffron and rice ids a later ingestion assigned
+    stale = IngredientVocabulary(current.names[:1])
+    assert stale.text_covered_lines(["chicken", "saffron", "rice"], lines, line_ids) == [False, True, True]
+
+
+def test_row_sets_are_gathered_without_a_loop(tmp_path):
+    payloads = [{"metadata": {"recipe_ingredient_ids": [[3], [1, 3]]}}, {"metadata": {}},
+                {"metadata": {"recipe_ingredient_ids": "[[2], [0]]"}}]
+    sets = IngredientSets.from_payloads(payloads)
+    assert len(sets) == 3 and sets.row(0).tolist() == [1, 3] and sets.row(1).tolist() == []
+    flat, lengths = sets.gather(np.array([2, 0, 1]))
+    assert flat.tolist() == [0, 2, 1, 3] and lengths.tolist() == [2, 2, 0]
+
+    sets.save(str(tmp_path))
+    assert IngredientSets.exists(str(tmp_path))
+    assert IngredientSets.load(str(tmp_path)).row(2).tolist() == [0, 2]
@@ -0,0 +1,89 @@
+from src.handler_api.llm_handler import LLMClient
+import asyncio
+import time
+import httpx
+import pytest
+
+
+def streaming_client(chunks):
+    """
+    an LLMClient whose requests are answered by a server-sent event stream built from chunks; a None chunk stalls the stream.
+    """
+    async def body():
+        for chunk in chunks:
+            if chunk is None:
+                await asyncio.sleep(30)
+            yield chunk.encode("utf-8")
+
+    llm_client = LLMClient()
+    llm_client.client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, content=body())))
+    return llm_client
+
+
+async def collect(llm_client, total_timeout):
+    return [delta async for delta in llm_client.stream({"model": "stub"}, total_timeout=total_timeout)]
+
+
+def test_stream_yields_the_deltas():
+    llm_client = streaming_client(['data: {"choices": [{"delta": {"content": "a"}}]}\n',
+                                   'data: {"choices": [{"delta": {"content": "b"}}]}\n', "data: [DONE]\n"])
+    assert asyncio.run(collect(llm_client, 5)) == ["a", "b"]
+
+
+def test_stalled_stream_is_cut_off_at_the_deadline():
+    llm_client = streaming_client(['data: {"choices": [{"delta": {"content": "a"}}]}\n', None])
+    started = time.monotonic()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(collect(llm_client, 0.3))
+    assert time.monotonic() - started < 2
+    assert llm_client.errors == 1 and llm_client.in_flight == 0
+
+
+def test_concurrent_calls_share_one_pooled_client():
+    seen = []
+
+    async def handler(request):
+        seen.append(request)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={"choices": [{"message": {"content": "{}"}}]})
+
+    async def run():
+        llm_client = LLMClient()
+        llm_client.client = client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        await llm_client.start() # the lifespan hook and every lazy start keep the existing client
+        responses = await asyncio.gather(*[llm_client.post({"model": "stub"}) for _ in range(5)])
+        assert llm_client.client is client
+        await llm_client.close()
+        return llm_client, responses
+
+    llm_client, responses = asyncio.run(run())
+    assert all(response.status_code == 200 for response in responses) and len(seen) == 5
+    assert (llm_client.requests, llm_client.peak_in_flight, llm_client.in_flight, llm_client.errors) == (5, 5, 0, 0)
+    assert llm_client.client is None
+
+
+def test_post_is_bound_by_the_total_timeout():
+    async def handler(request):
+        await asyncio.sleep(30)
+
+    async def run():
+        llm_client = LLMClient()
+        llm_client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        with pytest.raises(asyncio.TimeoutError):
+            await llm_client.post({"model": "stub"}, total_timeout=0.2)
+        return llm_client
+
+    llm_client = asyncio.run(run())
+    assert llm_client.errors == 1 and llm_client.in_flight == 0
+
+
+@pytest.mark.parametrize("total_timeout", [0, 0.0, -1])
+def test_exhausted_budget_fails_without_a_request(total_timeout):
+    seen = []
+    llm_client = LLMClient()
+    llm_client.client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: seen.append(request) or httpx.Response(200, json={})))
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(llm_client.post({"model": "stub"}, total_timeout=total_timeout))
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(collect(llm_client, total_timeout))
+    assert not seen and llm_client.requests == 0
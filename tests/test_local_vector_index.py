@@ -0,0 +1,93 @@
+from src.handler_api.local_vector_index import LocalVectorIndex
+from langchain.vectorstores.utils import maximal_marginal_relevance
+from qdrant_client import QdrantClient, models
+import numpy as np
+import pytest
+import os
+
+
+def random_payloads(n):
+    return [{"page_content": f"ingredient_{i % 7}|salt\nrecipe_tags_formatted:['Tag{i % 3}']", "metadata": {"recipe_name": f"recipe {i}"}}
+            for i in range(n)]
+
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(0).normal(size=(300, 16)).astype(np.float32)
+
+
+def test_remove_tombstones_graph_nodes_until_the_graph_is_compacted(tmp_path, vectors):
+    local_index = LocalVectorIndex.empty(16, hnsw_params={"M": 8, "ef_construction": 64, "ef_search": 32})
+    local_index.add(vectors, random_payloads(300), list(range(300)))
+    local_index.ann_min_rows = 0
+    graph = local_index.ann_index
+    assert local_index.remove([0, 5, 299, 1000]) == 3
+    assert len(local_index) == 297 and local_index.ann_index is graph and graph.n_deleted == 3
+    assert 5 not in local_index.ids and len(local_index.page_contents) == 297
+    assert local_index.bitmap_index.n_rows == 297
+    rows, _ = local_index.top_rows(vectors[7].tolist(), k=1)
+    assert local_index.ids[rows[0]] == 7
+    assert local_index.remove([5]) == 0
+
+    changed = np.random.default_rng(1).normal(size=(1, 16)).astype(np.float32)
+    local_index.add(changed, random_payloads(1), [5])
+    assert len(graph) == 301 and len(local_index.vectors) == 298
+    for query in [*vectors[:5], changed[0]]:
+        for mask in (None, np.arange(len(local_index)) % 3 > 0):
+            found, _ = local_index.ann_rows(LocalVectorIndex.normalize(query), 5, mask)
+            exact, _ = LocalVectorIndex.top_scores(local_index.vectors @ LocalVectorIndex.normalize(query), 5, mask)
+            assert found[0] == exact[0] and len(set(found) & set(exact)) >= 4
+    assert local_index.ids[local_index.top_rows(changed[0].tolist(), k=1)[0][0]] == 5
+
+    local_index.save(str(tmp_path))
+    for mmap in (True, False):
+        loaded = LocalVectorIndex.load(str(tmp_path), mmap=mmap)
+        loaded.ann_min_rows = 0
+        assert loaded.ann_index.n_deleted == 3 and np.array_equal(loaded.vectors, local_index.vectors)
+        for query in vectors[:5]:
+            assert np.array_equal(loaded.top_rows(query.tolist(), 5)[0], local_index.top_rows(query.tolist(), 5)[0])
+
+    assert loaded.remove(list(range(10, 70))) == 60 # 63 tombstones > 0.2 * 301 nodes
+    assert loaded.ann_index.n_deleted == 0 and len(loaded.ann_index) == len(loaded) == 238
+    loaded.save(str(tmp_path))
+    assert not os.path.exists(tmp_path / "hnsw_vectors.npy")
+    assert LocalVectorIndex.load(str(tmp_path), mmap=True).ids == loaded.ids
+
+
+def test_scores_and_filters_match_a_qdrant_collection(vectors):
+    client = QdrantClient(":memory:")
+    client.create_collection("recipes", vectors_config=models.VectorParams(size=16, distance=models.Distance.COSINE))
+    payloads = [{**payload, "metadata": {**payload["metadata"], "calories": float(i % 50), "tags": [f"Tag{i % 3}", f"Tag{i % 5}"]}}
+                for i, payload in enumerate(random_payloads(300))]
+    client.upsert("recipes", [models.PointStruct(id=i, vector=vectors[i].tolist(), payload=payloads[i]) for i in range(300)])
+    local_index = LocalVectorIndex.from_qdrant(client, "recipes", batch_size=64)
+    assert len(local_index) == 300
+
+    filter = {"must": [{"key": "metadata.calories", "range": {"gte": 10, "lt": 30}}, {"key": "metadata.tags", "match": {"any": ["Tag1", "Tag4"]}}],
+              "must_not": [{"key": "metadata.tags", "match": {"value": "Tag2"}}]}
+    query = vectors[11] + vectors[12]
+    for qdrant_filter, local_filter in ((None, None), (models.Filter(**filter), filter)):
+        expected = client.query_points("recipes", query=query.tolist(), limit=8, query_filter=qdrant_filter).points
+        rows, scores = local_index.top_rows(query.tolist(), k=8, filter=local_filter)
+        assert [local_index.ids[row] for row in rows] == [point.id for point in expected]
+        assert np.allclose(scores, [point.score for point in expected], atol=1e-5)
+
+
+def test_mmr_selects_what_langchain_selects(vectors):
+    local_index = LocalVectorIndex(LocalVectorIndex.normalize(vectors), random_payloads(300), list(range(300)))
+    query = LocalVectorIndex.normalize(vectors[3])
+    candidates, _ = local_index.top_rows(query, k=20)
+    expected = maximal_marginal_relevance(query, list(local_index.vectors[candidates]), lambda_mult=0.3, k=5)
+    assert local_index.mmr_rows(query, k=5, fetch_k=20, lambda_mult=0.3).tolist() == candidates[expected].tolist()
+
+
+def test_saved_snapshot_searches_the_same_when_memory_mapped(tmp_path, vectors):
+    local_index = LocalVectorIndex(LocalVectorIndex.normalize(vectors), random_payloads(300), [f"id-{i}" for i in range(300)])
+    local_index.build_ann_index(M=8, ef_construction=64, ef_search=32)
+    local_index.save(str(tmp_path))
+    loaded = LocalVectorIndex.load(str(tmp_path), mmap=True)
+    assert isinstance(loaded.vectors, np.memmap) and loaded.ids == local_index.ids
+    filter = {"must": [{"key": "page_content", "match": {"text": "Tag1"}}]}
+    for query in vectors[:5]:
+        for expected, found in zip(local_index.top_rows(query.tolist(), 5, filter), loaded.top_rows(query.tolist(), 5, filter)):
+            assert np.array_equal(expected, found)
@@ -0,0 +1,107 @@
+from src.handler_api import qdrant_vector_retriever_pipeline
+from src.handler_api.qdrant_vector_retriever_pipeline import QdrantVectorRetrieverPipeline
+from src.handler_api.local_vector_index import LocalVectorIndex
+from src.handler_api.ingredient_vocabulary import IngredientVocabulary
+from src.handler_api.llm_handler import llm_client
+from langchain.schema.document import Document
+from fastapi.testclient import TestClient
+from tests.fakes import HashingEmbedder, make_recipe
+import importlib
+import asyncio
+import orjson
+import httpx
+import time
+import sys
+import pytest
+
+
+RECIPES = [make_recipe("Pancakes", ingredients=["1 cup flour", "2 eggs", "1 cup milk"]),
+           make_recipe("Omelette", ingredients=["3 eggs", "1 tbsp butter", "1 pinch salt"])]
+REQUEST = {"country": "Germany", "allergic_ingredients": [], "preferences": [], "ingredients": ["flour", "milk"]}
+LLM_OUTPUT = orjson.dumps({"recipe_name": "Pfannkuchen", "recipe_ingredients": ["1 Tasse Mehl", "2 Eier", "1 Tasse Milch"],
+                           "recipe_directions": ["Alles verrühren.", "Backen."]}).decode("utf-8")
+
+
+def sse_chunks(text, parts=3):
+    """
+    the LLM output as a server-sent event stream of content deltas; a None part stalls the stream.
+    """
+    size = len(text) // parts + 1
+    return [f'data: {orjson.dumps({"choices": [{"delta": {"content": text[i:i + size]}}]}).decode("utf-8")}\n'
+            for i in range(0, len(text), size)] + ["data: [DONE]\n"]
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    """
+    imports main_api around a local index of RECIPES (hashing embedder, fresh translation cache); the LLM stream
+    is answered with the chunks given to the returned function.
+    """
+    monkeypatch.setattr(QdrantVectorRetrieverPipeline, "initialize_embedding_func", lambda self: HashingEmbedder())
+    monkeypatch.setenv("INGREDIENT_VOCABULARY_PATH", str(tmp_path / "ingredient_vocabulary.json"))
+    monkeypatch.setenv("TRANSLATION_CACHE_PATH", str(tmp_path / "translations.sqlite3"))
+    vocabulary = IngredientVocabulary()
+    documents = [Document(page_content=f"{'|'.join(recipe['recipe_ingredients_formatted'])}\nrecipe_tags_formatted:{recipe['recipe_tags_formatted']}",
+                          metadata={**recipe, "recipe_ingredient_ids": vocabulary.recipe_ids(recipe["recipe_ingredients_formatted"])})
+                 for recipe in RECIPES]
+    vocabulary.save(str(tmp_path / "ingredient_vocabulary.json"))
+    retriever = QdrantVectorRetrieverPipeline("hashing", {}, {})
+    retriever.vector_store = LocalVectorIndex.from_documents(documents, HashingEmbedder())
+    monkeypatch.setattr(qdrant_vector_retriever_pipeline, "initialize_qdrant_vector_retriever", lambda backend=None: retriever)
+    monkeypatch.delitem(sys.modules, "main_api", raising=False)
+    main_api = importlib.import_module("main_api")
+
+    def answer(chunks):
+        async def body():
+            for chunk in chunks:
+                if chunk is None:
+                    await asyncio.sleep(30)
+                yield chunk.encode("utf-8")
+        monkeypatch.setattr(llm_client, "client", httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, content=body()))))
+        return main_api
+
+    yield answer
+    main_api.translation_cache.close()
+    retriever.embedding_executor.shutdown()
+    retriever.search_executor.shutdown()
+
+
+def stream_events(main_api, request=REQUEST):
+    response = TestClient(main_api.app).post("/get-recipe/stream", json=request)
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/event-stream")
+    events = []
+    for block in response.text.strip().split("\n\n"):
+        event, data = block.split("\n", 1)
+        events.append((event[len("event: "):], orjson.loads(data[len("data: "):])))
+    return events
+
+
+def test_stream_sends_metadata_then_deltas_then_the_final_recipe(api):
+    main_api = api(sse_chunks(LLM_OUTPUT))
+    events = stream_events(main_api)
+    names = [event for event, _ in events]
+    assert names[0] == "metadata" and names[-1] == "final" and set(names[1:-1]) == {"delta"}
+    assert events[0][1]["recipe_name"] == "Pancakes"
+    assert "".join(data["text"] for event, data in events if event == "delta") == LLM_OUTPUT
+    final = events[-1][1]
+    assert final["recipe_name"] == "Pfannkuchen" and final["shopping_list"] == ["2 Eier"] and not final["degraded"]
+    assert final["recipe_url"] == events[0][1]["recipe_url"]
+
+
+def test_stream_sends_an_error_when_no_recipe_matches(api):
+    main_api = api(sse_chunks(LLM_OUTPUT))
+    events = stream_events(main_api, {**REQUEST, "allergic_ingredients": ["egg"]})
+    assert events == [("error", {"detail": "no recipe found for the given ingredients and preferences"})]
+
+
+@pytest.mark.parametrize("degraded_mode", [True, False])
+def test_stalled_stream_ends_when_the_llm_budget_is_spent(api, monkeypatch, degraded_mode):
+    main_api = api(sse_chunks(LLM_OUTPUT)[:1] + [None])
+    monkeypatch.setattr(main_api, "llm_stage_budget_seconds", 0.3)
+    monkeypatch.setattr(main_api, "degraded_mode", degraded_mode)
+    started = time.monotonic()
+    events = stream_events(main_api)
+    assert time.monotonic() - started < 5
+    assert [event for event, _ in events] == ["metadata", "delta", "final" if degraded_mode else "error"]
+    if degraded_mode:
+        assert events[-1][1]["degraded"] and events[-1][1]["recipe_name"] == "Pancakes"
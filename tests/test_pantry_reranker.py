@@ -0,0 +1,35 @@
+from src.handler_api.pantry_reranker import PantryReranker
+from src.handler_api.ingredient_vocabulary import IngredientSets
+import numpy as np
+
+
+def reference_scores(reranker, id_sets, relevance, user_ids):
+    relevance = np.asarray(relevance, dtype=float)
+    spread = relevance.max() - relevance.min()
+    relevance = (relevance - relevance.min()) / spread if spread > 0 else np.ones(len(relevance))
+    scores = []
+    for ids, scaled in zip(id_sets, relevance):
+        covered = len(set(ids) & set(user_ids))
+        coverage = covered / len(ids) if len(ids) else 0.0
+        missing = min(len(ids) - covered, reranker.max_missing) / reranker.max_missing
+        scores.append(reranker.vector_weight * scaled + reranker.coverage_weight * coverage - reranker.missing_weight * missing)
+    return np.array(scores)
+
+
+def test_vectorized_scores_match_a_per_recipe_loop():
+    rng = np.random.default_rng(0)
+    id_sets = [np.unique(rng.integers(0, 200, rng.integers(0, 25))).astype(np.int32) for _ in range(100)]
+    relevance = rng.random(100)
+    user_ids = np.unique(rng.integers(0, 250, 30))
+    reranker = PantryReranker()
+    ids, lengths = IngredientSets.flatten(id_sets)
+    assert np.allclose(reranker.scores(ids, lengths, relevance, user_ids), reference_scores(reranker, id_sets, relevance, user_ids))
+
+
+def test_cookable_recipe_moves_up_and_ties_keep_the_retriever_order():
+    id_sets = [np.array([1, 2, 3, 4]), np.array([5, 6]), np.array([7, 8]), np.array([], dtype=np.int64)]
+    ids, lengths = IngredientSets.flatten(id_sets)
+    order = PantryReranker().rerank(ids, lengths, np.array([0.9, 0.85, 0.85, 0.8]), user_ids=np.array([5, 6]))
+    assert order.tolist() == [1, 0, 2, 3]
+    # nothing owned: fewer missing ingredients win, the recipe without ids keeps only its relevance
+    assert PantryReranker().rerank(ids, lengths, np.ones(4), user_ids=np.array([], dtype=np.int64)).tolist() == [3, 1, 2, 0]
@@ -0,0 +1,95 @@
+from src.handler_api.payload_schema import keyword_fields, compile_filter, create_payload_indexes, PAYLOAD_INDEXES
+from src.handler_api.ingredient_vocabulary import IngredientVocabulary
+from src.handler_api.local_vector_index import LocalVectorIndex
+from qdrant_client import QdrantClient, models
+from types import SimpleNamespace
+import numpy as np
+import pytest
+
+
+RECIPES = [
+    (["Vegetarian", "Dinner"], ["1 eggplant", "2 tomatoes"], 40),
+    (["Breakfast"], ["2 large eggs", "1 cup buttermilk"], 15),
+    (["Vegetarian", "Low-Carb"], ["3 zucchini", "1 cup peanuts"], 25),
+    (["Dessert", "Gluten Free"], ["1 cup sugar", "1 egg"], 90),
+    (["Main Dish"], ["1 lb chicken breast", "1 cup milk"], 30),
+    (["Dinner", "Vegetarian"], ["1 block tofu", "2 tbsp peanut butter"], None),
+    (["Dinner"], ["1 ox tail", "1 cup süt"], None),
+]
+
+
+@pytest.fixture(scope="module")
+def collection():
+    vocabulary = IngredientVocabulary()
+    payloads = []
+    for tags, ingredients, minutes in RECIPES:
+        metadata = {"recipe_tags_formatted": tags, "recipe_ingredients_formatted": ingredients, "recipe_total_minutes": minutes,
+                    **keyword_fields(tags, ingredients, vocabulary.recipe_ids(ingredients), vocabulary)}
+        payloads.append({"page_content": f"{'|'.join(ingredients)}\nrecipe_tags_formatted:{tags}", "metadata": metadata})
+
+    client = QdrantClient(":memory:")
+    client.create_collection("recipes", vectors_config=models.VectorParams(size=4, distance=models.Distance.COSINE))
+    client.upsert("recipes", [models.PointStruct(id=i, vector=[1.0, 0, 0, float(i)], payload=payload) for i, payload in enumerate(payloads)])
+    local_index = LocalVectorIndex(LocalVectorIndex.normalize(np.ones((len(payloads), 4))), payloads, list(range(len(payloads))))
+    return client, local_index, vocabulary
+
+
+def qdrant_rows(client, filter):
+    points, _ = client.scroll("recipes", scroll_filter=models.Filter(**filter), limit=100)
+    return sorted(point.id for point in points)
+
+
+def bitmap_rows(local_index, filter):
+    return np.flatnonzero(local_index.filter_mask(filter)).tolist()
+
+
+@pytest.mark.parametrize("preferences, allergens", [
+    (["vegetarian"], []), (["Gluten-free"], []), (["dinner"], ["peanut"]), ([], ["milk"]), ([], ["egg"]),
+    (["main dish", "chicken"], []), (["vegetarian"], ["tofu", "eggplants"]), (["caviar"], []), (["dinner"], ["ox"]), ([], ["süt", "egg"]),
+])
+def test_typed_filter_selects_what_the_bitmap_index_selects(collection, preferences, allergens):
+    client, local_index, vocabulary = collection
+    typed = compile_filter(preferences, allergens, vocabulary)
+    legacy = compile_filter(preferences, allergens, vocabulary, typed=False)
+    assert qdrant_rows(client, typed) == bitmap_rows(local_index, legacy)
+    assert bitmap_rows(local_index, typed) == bitmap_rows(local_index, legacy) # the generic local path agrees as well
+
+
+def test_ranges_skip_recipes_without_the_value(collection):
+    client, local_index, vocabulary = collection
+    filter = compile_filter([], [], vocabulary, ranges={"recipe_total_minutes": {"lte": 30, "gte": None}})
+    assert qdrant_rows(client, filter) == bitmap_rows(local_index, filter) == [1, 2, 4]
+    assert compile_filter([], [], vocabulary, typed=False, ranges={"recipe_total_minutes": {"lte": 30}})["must"] == []
+
+
+def test_preferences_without_an_indexable_word_do_not_restrict_and_such_allergens_are_matched_as_text(collection):
+    _, _, vocabulary = collection
+    assert compile_filter(["!!"], ["ox", " "], vocabulary) == {"must": [], "must_not": [{"key": "page_content", "match": {"text": "ox"}}]}
+
+
+def test_allergens_stay_substring_strict_without_a_vocabulary(collection):
+    _, local_index, vocabulary = collection
+    missing = IngredientVocabulary() # INGREDIENT_VOCABULARY_PATH not found at startup
+    for allergens in (["milk"], ["egg", "peanut"]):
+        filter = compile_filter([], allergens, missing)
+        assert [{"key": "page_content", "match": {"text": allergen}} for allergen in allergens] == \
+               [condition for condition in filter["must_not"] if condition.get("key") == "page_content"]
+        # the in-memory client matches text word by word, a qdrant server without a full-text index by substring like the local index
+        assert bitmap_rows(local_index, filter) == bitmap_rows(local_index, compile_filter([], allergens, vocabulary, typed=False))
+
+
+def test_indexes_are_created_once():
+    class Client:
+        def __init__(self):
+            self.payload_schema = {}
+
+        def get_collection(self, collection_name):
+            return SimpleNamespace(payload_schema=dict(self.payload_schema))
+
+        def create_payload_index(self, collection_name, field_name, field_schema):
+            self.payload_schema[field_name] = field_schema
+
+    client = Client()
+    client.payload_schema["metadata.recipe_tokens"] = models.PayloadSchemaType.KEYWORD
+    assert sorted(create_payload_indexes(client, "recipes")) == sorted(set(PAYLOAD_INDEXES) - {"metadata.recipe_tokens"})
+    assert create_payload_indexes(client, "recipes") == [] and client.payload_schema == PAYLOAD_INDEXES
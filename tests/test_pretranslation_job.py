@@ -0,0 +1,54 @@
+import asyncio
+import json
+import os
+import httpx
+import pytest
+
+pretranslation_job = pytest.importorskip("src.database.pretranslation_job")
+from src.database.document_generator_pipeline import DocumentGeneratorPipeline
+from src.handler_api.llm_handler import llm_client, llm_breaker
+from tests.fakes import make_recipe
+
+
+@pytest.fixture
+def job(tmp_path, monkeypatch):
+    monkeypatch.setenv("TRANSLATION_CACHE_PATH", str(tmp_path / "translations.sqlite3"))
+    recipes_dir = tmp_path / "recipes"
+    (recipes_dir / "category").mkdir(parents=True)
+    with open(recipes_dir / "a.json", "w") as f:
+        json.dump([make_recipe("soup"), make_recipe("stew")], f)
+    with open(recipes_dir / "category" / "b.json", "w") as f:
+        json.dump([make_recipe("soup"), make_recipe("salad")], f)
+    job = pretranslation_job.PretranslationJob(["Germany"], recipes_dirs=[str(recipes_dir)], concurrency=2,
+                                               requests_per_minute=60000, max_attempts=3, backoff_seconds=0)
+    job.document_generator = DocumentGeneratorPipeline(str(tmp_path / "ingredient_vocabulary.json"))
+    return job
+
+
+def test_corpus_is_streamed_deduplicated_and_the_vocabulary_is_not_written(tmp_path, job):
+    urls = [recipe.recipe_url for recipe in job.iter_recipes()]
+    assert len(urls) == 3 and len(set(urls)) == 3
+    assert not os.path.exists(tmp_path / "ingredient_vocabulary.json")
+
+
+def test_every_llm_request_takes_a_rate_limiter_slot(job, monkeypatch):
+    requests, slots = [], []
+
+    async def failing_post(payload, total_timeout=None):
+        requests.append(payload)
+        return httpx.Response(503, request=httpx.Request("POST", "http://llm"))
+
+    wait = pretranslation_job.RateLimiter.wait
+
+    async def counted_wait(self):
+        slots.append(1)
+        await wait(self)
+
+    monkeypatch.setattr(llm_client, "post", failing_post)
+    monkeypatch.setattr(pretranslation_job.RateLimiter, "wait", counted_wait)
+    monkeypatch.setattr(llm_breaker, "allow", lambda: True)
+
+    stats = asyncio.run(job.run())
+    # 3 recipes x 1 language x max_attempts, the retryable 503 is not retried or hedged inside call_gpt_2
+    assert len(requests) == len(slots) == 9
+    assert stats["failed"] == 3 and stats["recipes"] == 3
@@ -0,0 +1,33 @@
+from src.handler_api.prompt_builder import PromptBuilder
+from src.handler_api.recipe_models import RecipeResult
+import orjson
+
+
+def long_recipe():
+    return RecipeResult(recipe_name="  Slow   Stew ", recipe_url="https://example.com/stew",
+                        recipe_ingredients=[f"{i} cups stock" for i in range(12)],
+                        recipe_directions=["Simmer " + "very slowly " * 200] * 8 + ["None", ""],
+                        recipe_details=["Prep: 10 min", "Total: 3 hr"], recipe_nutrition_details=["Calories 400"])
+
+
+def test_prompt_fits_the_budget_and_keeps_every_ingredient():
+    builder = PromptBuilder(max_input_tokens=600)
+    prompt = builder.build(long_recipe(), "translate")
+    fields = orjson.loads(prompt)
+    assert builder.count_tokens("translate") + builder.count_tokens(prompt) <= 600
+    assert fields["recipe_ingredients"] == [f"{i} cups stock" for i in range(12)]
+    assert fields["recipe_name"] == "Slow Stew"
+    assert 1 <= len(fields["recipe_directions"]) < 8
+
+
+def test_prompt_within_budget_is_only_compacted():
+    builder = PromptBuilder(max_input_tokens=100000)
+    fields = orjson.loads(builder.build(long_recipe(), "translate"))
+    assert len(fields["recipe_directions"]) == 1 # repeated and null-like lines are removed
+    assert "recipe_url" not in fields and "recipe_tags" not in fields
+
+
+def test_token_count_falls_back_to_an_estimate_without_an_encoding():
+    builder = PromptBuilder()
+    builder.encoding = None
+    assert builder.count_tokens("x" * 400) == 100
@@ -0,0 +1,167 @@
+from src.handler_api.qdrant_vector_retriever_pipeline import QdrantVectorRetrieverPipeline
+from src.handler_api.ingredient_vocabulary import IngredientVocabulary
+from src.handler_api.local_vector_index import LocalVectorIndex
+from src.handler_api.recipe_store import RecipeStore
+from qdrant_client import AsyncQdrantClient, QdrantClient, models
+from tests.fakes import HashingEmbedder
+import numpy as np
+import asyncio
+import uuid
+import os
+import pytest
+
+
+INGREDIENTS = ["chicken", "rice", "garlic", "onion", "tomato", "basil", "egg", "flour", "milk", "butter", "lemon", "tofu"]
+COLLECTION = "recipes"
+
+
+def corpus(n=40):
+    rng = np.random.default_rng(0)
+    vocabulary = IngredientVocabulary()
+    payloads = []
+    for i in range(n):
+        ingredients = [f"1 cup {name}" for name in rng.choice(INGREDIENTS, 4, replace=False)]
+        metadata = {"recipe_name": f"recipe {i}", "recipe_ingredients_formatted": ingredients, "recipe_tags_formatted": ["Dinner"],
+                    "recipe_ingredient_ids": vocabulary.recipe_ids(ingredients), "recipe_directions_formatted": ["Cook."] * 20}
+        payloads.append({"page_content": f"{'|'.join(ingredients)}\nrecipe_tags_formatted:['Dinner']", "metadata": metadata})
+    ids = [str(uuid.uuid5(uuid.NAMESPACE_URL, f"recipe {i}")) for i in range(n)]
+    return vocabulary, ids, payloads
+
+
+@pytest.fixture
+def new_pipeline(tmp_path, monkeypatch):
+    """
+    builds pipelines around one in-memory collection, remote (lean or full payloads) or local, with a hashing embedder.
+    """
+    monkeypatch.setattr(QdrantVectorRetrieverPipeline, "initialize_embedding_func", lambda self: HashingEmbedder())
+    vocabulary, ids, payloads = corpus()
+    vocabulary.save(str(tmp_path / "ingredient_vocabulary.json"))
+    monkeypatch.setenv("INGREDIENT_VOCABULARY_PATH", str(tmp_path / "ingredient_vocabulary.json"))
+    embedder = HashingEmbedder()
+    # recipes with the same ingredients would tie, and tied rows may come back in any order
+    jitter = 0.01 * np.random.default_rng(1).normal(size=(len(payloads), embedder.dimensions))
+    vectors = (np.array(embedder.embed_documents([payload["page_content"] for payload in payloads])) + jitter).tolist()
+    client = AsyncQdrantClient(":memory:")
+    pipelines = []
+
+    async def build(backend="remote", lean=False):
+        if not await client.collection_exists(COLLECTION):
+            await client.create_collection(COLLECTION, vectors_config=models.VectorParams(size=32, distance=models.Distance.COSINE))
+            await client.upsert(COLLECTION, [models.PointStruct(id=point_id, vector=vector, payload=payload)
+                                             for point_id, vector, payload in zip(ids, vectors, payloads)])
+        pipeline = QdrantVectorRetrieverPipeline("hashing", {}, {})
+        pipeline.collection_name = COLLECTION
+        pipeline.async_client = client
+        if backend == "local":
+            pipeline.vector_store = LocalVectorIndex(LocalVectorIndex.normalize(np.array(vectors)), payloads, ids, embedder)
+        if lean:
+            pipeline.recipe_store = RecipeStore(str(tmp_path / f"recipes_{len(pipelines)}.sqlite3"))
+        pipelines.append(pipeline)
+        return pipeline
+
+    yield build
+    for pipeline in pipelines:
+        pipeline.embedding_executor.shutdown()
+        pipeline.search_executor.shutdown()
+        if pipeline.recipe_store is not None:
+            pipeline.recipe_store.close()
+
+
+def names(documents):
+    return [document.metadata["recipe_name"] for document in documents]
+
+
+BATCH = [("chicken|rice|garlic", ["chicken", "garlic"]), ("tomato|basil", None), ("egg|flour|milk", ["egg"]), ("tofu|lemon", None)]
+
+
+def test_vocabulary_is_reloaded_after_ingestion_grows_it(new_pipeline, tmp_path, monkeypatch):
+    monkeypatch.setenv("INGREDIENT_VOCABULARY_RELOAD_SECONDS", "0")
+    pipeline = asyncio.run(new_pipeline())
+    path = tmp_path / "ingredient_vocabulary.json"
+    assert not pipeline.refresh_ingredient_vocabulary().query_ids(["saffron"])
+
+    path.write_text("{") # caught mid-write
+    os.utime(path, (1, 1))
+    assert pipeline.refresh_ingredient_vocabulary().query_ids(["chicken"])
+
+    grown = IngredientVocabulary.load_or_create(str(tmp_path / "missing.json"))
+    grown.add("saffron")
+    grown.save(str(path))
+    os.utime(path, (2, 2))
+    assert pipeline.refresh_ingredient_vocabulary().query_ids(["saffron"]) == {0}
+
+
+@pytest.mark.parametrize("backend,lean", [("local", False), ("remote", False), ("remote", True)])
+@pytest.mark.parametrize("names_known", [0, 3]) # missing file, file older than the ingestion
+def test_reranking_survives_a_missing_or_stale_vocabulary(new_pipeline, tmp_path, monkeypatch, backend, lean, names_known):
+    pipeline = asyncio.run(new_pipeline(backend, lean))
+    vocabulary_path = str(tmp_path / "old_vocabulary.json")
+    if names_known:
+        IngredientVocabulary(pipeline.ingredient_vocabulary.names[:names_known]).save(vocabulary_path)
+    monkeypatch.setenv("INGREDIENT_VOCABULARY_PATH", vocabulary_path)
+    outdated = asyncio.run(new_pipeline(backend, lean))
+
+    async def check():
+        for query, ingredients in [("chicken|rice", ["Tofu", "lemon"]), ("tomato|basil", ["milk", "butter", "onion", "saffron"])]:
+            embedding = await pipeline.embed_query(query)
+            expected = names(await pipeline.rerank_search(embedding, ingredients, k=3))
+            assert expected != names(await pipeline.rerank_search(embedding, ["saffron"], k=3)) # the pantry changes the order
+            assert names(await outdated.rerank_search(embedding, ingredients, k=3)) == expected
+    asyncio.run(check())
+
+
+def test_lean_payload_mode_waits_for_a_filled_store(new_pipeline, tmp_path, monkeypatch):
+    monkeypatch.setenv("RECIPE_STORE_PATH", str(tmp_path / "recipes.sqlite3"))
+    pipeline = asyncio.run(new_pipeline())
+    _, ids, payloads = corpus()
+    pipeline.client = QdrantClient(":memory:")
+    pipeline.client.create_collection(COLLECTION, vectors_config=models.VectorParams(size=32, distance=models.Distance.COSINE))
+    pipeline.client.upsert(COLLECTION, [models.PointStruct(id=point_id, vector=[1.0] * 32, payload=payload)
+                                        for point_id, payload in zip(ids, payloads)])
+    pipeline.initialize_recipe_store()
+    assert pipeline.recipe_store is None and pipeline.payload_selector(rerank=True) is True
+
+    pipeline.export_recipe_store().close()
+    pipeline.initialize_recipe_store()
+    assert pipeline.recipe_store.size() == len(ids) and pipeline.payload_selector() is False
+
+
+def test_lean_payload_search_reads_bodies_from_the_store(new_pipeline):
+    async def run():
+        full = await new_pipeline()
+        lean = await new_pipeline(lean=True)
+        embedding = HashingEmbedder().embed_query("chicken|rice")
+        assert lean.payload_selector() is False
+        points = await lean.query_collection(embedding, 5, with_payload=lean.payload_selector(rerank=True))
+        assert all(set(point.payload["metadata"]) == {"recipe_ingredient_ids"} for point in points)
+
+        cold = await lean.search(embedding, "chicken|rice", k=3, user_ingredients=["chicken"])
+        assert lean.recipe_store.size() == 3 # the store misses were fetched from qdrant and written back
+        warm = await lean.search(embedding, "chicken|rice", k=3, user_ingredients=["chicken"])
+        expected = await full.search(embedding, "chicken|rice", k=3, user_ingredients=["chicken"])
+        assert [document.metadata for document in cold] == [document.metadata for document in warm] == [document.metadata for document in expected]
+        assert lean.recipe_store.metrics()["hits"] == 3
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("backend, lean", [("remote", False), ("remote", True), ("local", False)])
+def test_batch_search_returns_what_single_searches_return(new_pipeline, backend, lean):
+    async def run():
+        pipeline = await new_pipeline(backend, lean)
+        queries = [query for query, _ in BATCH]
+        user_ingredients = [ingredients for _, ingredients in BATCH]
+        filters = [None, {"must_not": [{"key": "page_content", "match": {"text": "garlic"}}]}, None, None]
+        embeddings = await pipeline.embed_queries(queries)
+        assert pipeline.embedding_executor.completed == 1 # one model call for the whole batch
+        batch = await pipeline.search_batch(embeddings, queries, filters, user_ingredients, k=3)
+        single = [await pipeline.search(embedding, query, k=3, filter=filter, user_ingredients=ingredients)
+                  for embedding, query, filter, ingredients in zip(embeddings, queries, filters, user_ingredients)]
+        assert [names(documents) for documents in batch] == [names(documents) for documents in single]
+        # local index searches run on the search executor, off the event loop
+        assert pipeline.search_executor.completed == (1 + len(BATCH) if backend == "local" else 0)
+        assert all(len(documents) == 3 for documents in batch)
+        assert not any("garlic" in document.page_content for document in batch[1])
+        await pipeline.embedding_batcher.close()
+
+    asyncio.run(run())
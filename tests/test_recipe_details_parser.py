@@ -0,0 +1,39 @@
+from src.handler_api.recipe_models import RecipeResult
+from tests.fakes import make_recipe
+from src.handler_api.recipe_details_parser import (parse_recipe_facts, parse_minutes, parse_grams, parse_servings,
+                                                   format_minutes, format_grams, RECIPE_FACT_FIELDS)
+import pytest
+
+
+def test_scraped_list_fields_are_parsed_into_typed_facts():
+    details = ["Level:\nEasy", "Total:\n1 hr 20 min", "(includes rising time)", "Prep:\n20 min", "Cook:\n1 hr", "Yield:\n4 to 6 servings"]
+    nutrition = ["Nutrition Info", "Serving Size\n1 of 6 servings", "Calories\n291", "Total Fat\n14 g", "Carbohydrates\n30.5 g",
+                 "Protein\n950 mg"]
+    assert parse_recipe_facts(details, nutrition) == {
+        "recipe_prep_minutes": 20, "recipe_cook_minutes": 60, "recipe_total_minutes": 80, "recipe_servings": 4,
+        "recipe_calories": 291, "recipe_fat_grams": 14.0, "recipe_carbohydrate_grams": 30.5, "recipe_protein_grams": 0.95}
+
+
+def test_dict_fields_and_missing_values():
+    facts = parse_recipe_facts({"Prep": "10 min", "Cook": "None", "Servings": "8"}, {"Calories": None, "Total Fat": "9 g"})
+    assert set(facts) == set(RECIPE_FACT_FIELDS)
+    assert (facts["recipe_prep_minutes"], facts["recipe_cook_minutes"], facts["recipe_servings"]) == (10, None, 8)
+    assert (facts["recipe_calories"], facts["recipe_fat_grams"]) == (None, 9.0)
+    assert all(value is None for value in parse_recipe_facts(None, "").values())
+
+
+def test_single_values():
+    assert parse_minutes("1 day 2 hr 5 min") == 1565 and parse_minutes("overnight") is None
+    assert parse_grams("4.5 grams") == 4.5 and parse_grams("58 milligrams") == 0.06 and parse_grams(None) is None
+    assert parse_servings(None, "serves 8") == 8 and parse_servings("8 cups") is None and parse_servings("12 muffins", "2 servings") == 2
+    assert [format_minutes(m) for m in (0, 45, 60, 135)] == ["0 min", "45 min", "1 hr", "2 hr 15 min"]
+    assert format_grams(14.0) == "14 g" and format_grams(0.95) == "0.95 g"
+
+
+def test_facts_reach_the_document_metadata_and_the_recipe_model(tmp_path):
+    document_generator_pipeline = pytest.importorskip("src.database.document_generator_pipeline")
+    document = document_generator_pipeline.DocumentGeneratorPipeline(str(tmp_path / "ingredient_vocabulary.json")).build_documents([make_recipe("stew")])[0]
+    assert document.metadata["recipe_total_minutes"] == 30 and document.metadata["recipe_protein_grams"] == 7.0
+    recipe = RecipeResult.from_metadata(document.metadata)
+    assert recipe.structured_details() == {"Prep_time": "10 min", "CookTime": "20 min", "TotalTime": "30 min", "Servings": "4"}
+    assert recipe.structured_nutrition() == {"Calories": "250", "Total Fat": "9 g", "Protein": "7 g"}
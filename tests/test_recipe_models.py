@@ -0,0 +1,30 @@
+from src.handler_api.recipe_models import RecipeResult, FormattedRecipe, parse_payload_field
+
+
+def test_repr_encoded_payload_fields_are_parsed_without_eval():
+    assert parse_payload_field("['1 cup rice', '2 eggs']", list) == ["1 cup rice", "2 eggs"]
+    assert parse_payload_field(["1 cup rice"], list) == ["1 cup rice"]
+    assert parse_payload_field("{'Prep': '10 min'}", (dict, list)) == {"Prep": "10 min"}
+    assert parse_payload_field("just one line", list) == ["just one line"]
+    assert parse_payload_field("None", list) == [] and parse_payload_field(None, (dict, list)) == {}
+    assert parse_payload_field("__import__('os').system('true')", list) == ["__import__('os').system('true')"]
+
+
+def test_old_and_new_payloads_give_the_same_recipe():
+    native = {"recipe_name": "Stew", "recipe_ingredients_formatted": ["1 onion"], "recipe_directions_formatted": ["Simmer."],
+              "recipe_details_formatted": {"Prep": "10 min"}, "recipe_tags_formatted": ["Soup"], "recipe_card-href": "https://example.com/stew",
+              "recipe_ingredient_ids": [[0]], "recipe_servings": 4}
+    legacy = {key: str(value) if isinstance(value, (list, dict)) else value for key, value in native.items()}
+    recipe = RecipeResult.from_metadata(native)
+    assert RecipeResult.from_metadata(legacy) == recipe
+    assert recipe.recipe_url == "https://example.com/stew" and recipe.recipe_servings == 4
+    assert RecipeResult.from_metadata({}).recipe_name == "No name available"
+
+
+def test_llm_output_is_validated_against_the_schema():
+    text = b'{"recipe_name": "Eintopf", "recipe_ingredients": ["1 Zwiebel"], "recipe_directions": ["Kochen."], "recipe_details": {"Servings": 4}}'
+    formatted = FormattedRecipe.from_llm_output(text)
+    assert formatted.recipe_details == {"Servings": "4"} and formatted.shopping_list == []
+    assert set(formatted.cache_value()) == {"recipe_name", "recipe_ingredients", "recipe_directions", "recipe_details", "recipe_nutrition_details"}
+    assert FormattedRecipe.from_llm_output('{"recipe_name": "Eintopf"}') is None
+    assert FormattedRecipe.from_llm_output("{'recipe_name': 'not json'}") is None and FormattedRecipe.from_llm_output(None) is None
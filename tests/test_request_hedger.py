@@ -0,0 +1,75 @@
+from src.handler_api.request_hedger import RequestHedger, Deadline
+import asyncio
+import time
+import pytest
+
+
+def test_slow_primary_is_hedged_and_the_fast_copy_wins():
+    hedger = RequestHedger(default_hedge_delay=0.05, max_hedge_rate=1.0)
+    started = []
+
+    async def call(budget):
+        started.append(budget)
+        await asyncio.sleep(5 if len(started) == 1 else 0.01)
+        return len(started)
+
+    start = time.monotonic()
+    assert asyncio.run(hedger.run(call, Deadline(10))) == 2
+    assert time.monotonic() - start < 1
+    metrics = hedger.metrics()
+    assert (metrics["hedges"], metrics["hedge_wins"], metrics["attempts"]) == (1, 1, 2)
+
+
+def test_hedges_are_capped_by_the_hedge_rate():
+    hedger = RequestHedger(default_hedge_delay=0.01, max_hedge_rate=0.25)
+
+    async def call(budget):
+        await asyncio.sleep(0.03)
+        return "ok"
+
+    async def run():
+        for _ in range(8):
+            await hedger.run(call, Deadline(5))
+
+    asyncio.run(run())
+    assert hedger.hedges == 2
+
+
+def test_only_retryable_errors_are_retried():
+    hedger = RequestHedger(hedge_percentile=0, max_attempts=3, backoff_base=0.001, retryable=lambda e: isinstance(e, ConnectionError))
+    calls = []
+
+    async def flaky(budget):
+        calls.append(budget)
+        if len(calls) < 3:
+            raise ConnectionError("reset")
+        return "ok"
+
+    assert asyncio.run(hedger.run(flaky, Deadline(5))) == "ok" and hedger.retries == 2
+
+    async def broken(budget):
+        calls.append(budget)
+        raise ValueError("bad request")
+
+    calls.clear()
+    with pytest.raises(ValueError):
+        asyncio.run(hedger.run(broken, Deadline(5)))
+    assert len(calls) == 1 and hedger.failures == 1
+
+
+def test_hanging_call_is_cut_at_the_deadline():
+    hedger = RequestHedger(hedge_percentile=0)
+
+    async def hang(budget):
+        await asyncio.sleep(budget + 5)
+
+    start = time.monotonic()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(hedger.run(hang, Deadline(0.2)))
+    assert time.monotonic() - start < 1 and hedger.deadline_exceeded == 1
+
+
+def test_stage_deadline_never_outlives_the_request():
+    request = Deadline(1)
+    assert request.limit(5).expires_at == request.expires_at
+    assert request.limit(0.1).remaining() <= 0.1 and not request.expired()
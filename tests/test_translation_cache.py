@@ -0,0 +1,67 @@
+from src.handler_api.translation_cache import TranslationCache, get_prompt_version
+from src.handler_api.llm_handler import prompt_templates
+from src.handler_api.prompt_builder import PromptBuilder
+from src.handler_api.recipe_models import RecipeResult
+import sqlite3
+import pytest
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = TranslationCache(str(tmp_path / "translations.sqlite3"), prompt_version=get_prompt_version(prompt_templates()))
+    yield cache
+    cache.close()
+
+
+def recipe(directions):
+    return RecipeResult(recipe_name="Stew", recipe_url="https://example.com/stew", recipe_ingredients=["1 onion"], recipe_directions=directions)
+
+
+def test_entry_is_served_only_for_the_recipe_content_it_was_made_from(cache):
+    stored = recipe(["Simmer."])
+    cache.put(stored.recipe_url, "Germany", {"recipe_name": "Eintopf"}, stored.content_hash())
+    assert cache.get(stored.recipe_url, " germany ", stored.content_hash()) == {"recipe_name": "Eintopf"}
+    edited = recipe(["Simmer for an hour."])
+    assert cache.get(edited.recipe_url, "Germany", edited.content_hash()) is None
+    assert not cache.contains(edited.recipe_url, "Germany", edited.content_hash())
+
+
+def test_content_hash_ignores_fields_the_llm_does_not_see():
+    assert recipe(["Simmer."]).content_hash() == recipe(["Simmer."]).model_copy(update={"recipe_tags": ["Soup"]}).content_hash()
+
+
+def test_prompt_version_covers_every_template():
+    templates = prompt_templates()
+    assert all(get_prompt_version(templates[:i] + [template + " "] + templates[i + 1:]) != get_prompt_version(templates)
+               for i, template in enumerate(templates))
+    assert PromptBuilder(max_input_tokens=1000).template_signature() != PromptBuilder(max_input_tokens=2000).template_signature()
+
+
+def test_cache_written_before_content_hashes_is_migrated(tmp_path):
+    path = str(tmp_path / "old.sqlite3")
+    connection = sqlite3.connect(path)
+    connection.execute("""CREATE TABLE translations (recipe_url TEXT NOT NULL, language TEXT NOT NULL, prompt_version TEXT NOT NULL,
+                          value TEXT NOT NULL, created_at REAL NOT NULL, last_access REAL NOT NULL,
+                          PRIMARY KEY (recipe_url, language, prompt_version))""")
+    connection.execute("INSERT INTO translations VALUES ('https://example.com/stew', 'germany', 'v1', '{}', 0, 0)")
+    connection.commit()
+    connection.close()
+
+    cache = TranslationCache(path, prompt_version="v1")
+    assert cache.get("https://example.com/stew", "Germany", recipe(["Simmer."]).content_hash()) is None
+    cache.put("https://example.com/stew", "Germany", {"recipe_name": "Eintopf"}, "abc")
+    assert cache.get("https://example.com/stew", "Germany", "abc") == {"recipe_name": "Eintopf"}
+    cache.close()
+
+
+def test_shopping_list_items_are_cached_per_language_and_prompt_version(tmp_path, cache):
+    cache.put_items({"1 onion": "1 Zwiebel", "2 eggs": "2 Eier"}, "Germany")
+    assert cache.get_items(["1 onion", "salt", "2 eggs"], "germany") == {"1 onion": "1 Zwiebel", "2 eggs": "2 Eier"}
+    assert cache.get_items(["1 onion"], "France") == {} and cache.get_items([], "Germany") == {}
+    newer = TranslationCache(str(tmp_path / "translations.sqlite3"), prompt_version="newer prompts")
+    assert newer.get_items(["1 onion"], "Germany") == {}
+    newer.close()
+
+
+def test_llm_no_longer_writes_the_shopping_list():
+    assert all("shopping_list" not in template and "shopping list" not in template for template in prompt_templates())